@@ -0,0 +1,240 @@
+"""
+Бенчмарк распределения путёвок на синтетических списках путёвок.
+
+Для каждого размера списка путёвок замеряется время этапов get_distribute
+(построение индекса путёвок, get_vouchers_per_months, get_vouchers_per_days,
+get_sanatorium_vouchers, сборка результата) и пиковый объём памяти.
+Результаты сохраняются в JSON, чтобы сравнивать их между коммитами.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.distribution --sizes 10000 100000 1000000 --output benchmarks/results.json
+    python -m benchmarks.distribution --sizes 10000 100000 --compare benchmarks/results.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generator import ARRIVAL_PATTERNS, generate_settings, generate_vouchers  # noqa: E402
+from distributor import Distribution  # noqa: E402
+
+# этапы распределения в порядке выполнения
+STAGES = (
+    'load',
+    'get_vouchers_index',
+    'get_vouchers_per_months',
+    'get_vouchers_per_days',
+    'get_sanatorium_vouchers',
+    'collect_results',
+)
+
+
+class TimedDistribution(Distribution):
+    """Распределение с замером времени каждого этапа"""
+
+    def __init__(self, **kwargs):
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self.calls = dict.fromkeys(STAGES, 0)
+        started = time.perf_counter()
+        super().__init__(**kwargs)
+        self.add_timing('load', started)
+
+    def add_timing(self, stage: str, started: float) -> None:
+        self.timings[stage] += time.perf_counter() - started
+        self.calls[stage] += 1
+
+    def get_vouchers_index(self, df=None):
+        started = time.perf_counter()
+        result = super().get_vouchers_index(df)
+        self.add_timing('get_vouchers_index', started)
+        return result
+
+    def get_vouchers_per_months(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = super().get_vouchers_per_months(*args, **kwargs)
+        self.add_timing('get_vouchers_per_months', started)
+        return result
+
+    def get_vouchers_per_days(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = super().get_vouchers_per_days(*args, **kwargs)
+        self.add_timing('get_vouchers_per_days', started)
+        return result
+
+    def get_sanatorium_vouchers(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = super().get_sanatorium_vouchers(*args, **kwargs)
+        self.add_timing('get_sanatorium_vouchers', started)
+        return result
+
+    def _collect_results(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = super()._collect_results(*args, **kwargs)
+        self.add_timing('collect_results', started)
+        return result
+
+
+def run(df: pd.DataFrame, args: argparse.Namespace, trace_memory: bool = False) -> dict:
+    """
+    Выполняет одно распределение списка путёвок.
+
+    :param df: Список путёвок.
+    :param args: Параметры бенчмарка.
+    :param trace_memory: Замерять пиковый объём памяти (замедляет распределение).
+    """
+    settings = generate_settings(df, args.medical_units)
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with warnings.catch_warnings(record=True) as caught_warnings:
+        warnings.simplefilter('always', RuntimeWarning)
+        distribution = TimedDistribution(
+            vouchers=df,
+            vectorized=not args.by_rows,
+            results_cache_size=0,
+            debug=args.debug
+        )
+        distribution.settings = settings
+        vouchers = distribution.get_distribute()
+    total = time.perf_counter() - started
+    peak_memory = None
+    if trace_memory:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        'total': total,
+        'stages': distribution.timings,
+        'calls': distribution.calls,
+        'distributed': len(vouchers),
+        # кол-во месяцев, в которых не удалось распределить расчётное кол-во путёвок
+        'warnings': len(caught_warnings),
+        'peak_memory': peak_memory,
+    }
+
+
+def benchmark(size: int, args: argparse.Namespace) -> dict:
+    """
+    Бенчмарк одного размера списка путёвок: лучшее время из нескольких повторов
+    и пиковый объём памяти в отдельном прогоне.
+
+    :param size: Кол-во путёвок.
+    :param args: Параметры бенчмарка.
+    """
+    df = generate_vouchers(
+        sanatoriums=args.sanatoriums,
+        vouchers_per_sanatorium=max(1, size // args.sanatoriums),
+        arrival_pattern=args.arrival_pattern,
+        sanatorium_skew=args.sanatorium_skew,
+        day_skew=args.day_skew,
+        seed=args.seed,
+    )
+    runs = [run(df, args) for _ in range(args.repeat)]
+    best = min(runs, key=lambda result: result['total'])
+    if not args.no_memory:
+        best['peak_memory'] = run(df, args, trace_memory=True)['peak_memory']
+    best['vouchers'] = len(df.index)
+    best['size'] = size
+    return best
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(result: dict, baseline: Optional[dict] = None) -> None:
+    """Выводит результат бенчмарка (и изменение относительно базового результата)"""
+    def change(value: float, base_value: Optional[float]) -> str:
+        if not base_value:
+            return ''
+        return ' (%+.0f%%)' % ((value / base_value - 1) * 100)
+
+    print('Путёвок: %d, распределено: %d, предупреждений: %d' % (
+        result['vouchers'], result['distributed'], result['warnings']
+    ))
+    for stage in STAGES:
+        base_value = baseline['stages'].get(stage) if baseline else None
+        print('  %-25s %9.3f с%s' % (stage, result['stages'][stage], change(result['stages'][stage], base_value)))
+    print('  %-25s %9.3f с%s' % ('total', result['total'], change(result['total'], baseline and baseline['total'])))
+    if result['peak_memory'] is not None:
+        print('  %-25s %9.1f МБ%s' % (
+            'peak_memory',
+            result['peak_memory'] / 1024 ** 2,
+            change(result['peak_memory'], baseline and baseline['peak_memory'])
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='Кол-во путёвок.')
+    parser.add_argument('--sanatoriums', type=int, default=50, help='Кол-во санаториев.')
+    parser.add_argument('--arrival-pattern', choices=sorted(ARRIVAL_PATTERNS), default='weekly',
+                        help='Шаблон заездных дней.')
+    parser.add_argument('--sanatorium-skew', type=float, default=1.0,
+                        help='Перекос кол-ва путёвок между санаториями (0 — поровну).')
+    parser.add_argument('--day-skew', type=float, default=0.5,
+                        help='Перекос кол-ва путёвок между заездными днями (0 — поровну).')
+    parser.add_argument('--medical-units', type=int, default=2, help='Кол-во МСЧ в настройках санаториев.')
+    parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора путёвок.')
+    parser.add_argument('--repeat', type=int, default=1, help='Кол-во повторов (берётся лучшее время).')
+    parser.add_argument('--by-rows', action='store_true', help='Построчный отбор путёвок (vectorized=False).')
+    parser.add_argument('--debug', action='store_true', help='Сохранять отладочные данные распределения.')
+    parser.add_argument('--no-memory', action='store_true', help='Не замерять пиковый объём памяти.')
+    parser.add_argument('--output', help='Файл JSON для сохранения результатов.')
+    parser.add_argument('--compare', help='Файл JSON с базовыми результатами для сравнения.')
+    args = parser.parse_args()
+
+    baselines = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baselines = {result['size']: result for result in json.load(f)['results']}
+
+    results = []
+    for size in args.sizes:
+        result = benchmark(size, args)
+        print_result(result, baselines.get(size))
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(
+                {
+                    'commit': get_commit(),
+                    'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'pandas': pd.__version__,
+                    'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+                    'results': results,
+                },
+                f,
+                indent=2
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Генератор синтетических списков путёвок и настроек распределения для бенчмарков.
+
+Результат детерминирован: при одинаковых параметрах и seed генерируется один и тот же список путёвок.
+"""
+import numpy as np
+import pandas as pd
+
+from typing import List
+
+from distributor import Settings
+
+# начало периода заездов
+START_DATE = np.datetime64('2021-01-04')
+# длительность периода заездов в днях
+PERIOD_DAYS = 364
+# шаблоны заездных дней: шаг между заездами в днях (None — случайные дни)
+ARRIVAL_PATTERNS = {
+    'daily': 1,
+    'weekly': 7,
+    'shifts': 21,
+    'random': None,
+}
+
+
+def get_weights(size: int, skew: float, rnd: np.random.Generator) -> np.ndarray:
+    """
+    Веса по закону Ципфа (skew=0 — равномерное распределение), перемешанные случайным образом.
+
+    :param size: Кол-во весов.
+    :param skew: Показатель перекоса.
+    :param rnd: Генератор случайных чисел.
+    """
+    weights = 1 / np.arange(1, size + 1) ** skew
+    rnd.shuffle(weights)
+    return weights / weights.sum()
+
+
+def get_arrival_days(pattern: str, rnd: np.random.Generator) -> np.ndarray:
+    """
+    Заездные дни санатория (смещения от начала периода).
+
+    :param pattern: Шаблон заездных дней (см. ARRIVAL_PATTERNS).
+    :param rnd: Генератор случайных чисел.
+    """
+    assert pattern in ARRIVAL_PATTERNS, 'Неизвестный шаблон заездных дней: %s.' % pattern
+    step = ARRIVAL_PATTERNS[pattern]
+    if step is None:
+        return np.sort(rnd.choice(PERIOD_DAYS, size=int(rnd.integers(12, 60)), replace=False))
+    return np.arange(int(rnd.integers(0, step)), PERIOD_DAYS, step)
+
+
+def generate_vouchers(
+        sanatoriums: int = 10,
+        vouchers_per_sanatorium: int = 1000,
+        arrival_pattern: str = 'weekly',
+        sanatorium_skew: float = 0.0,
+        day_skew: float = 0.0,
+        seed: int = 1
+) -> pd.DataFrame:
+    """
+    Функция генерирует список путёвок в формате API списка путёвок.
+
+    :param sanatoriums: Кол-во санаториев.
+    :param vouchers_per_sanatorium: Среднее кол-во путёвок в санатории.
+    :param arrival_pattern: Шаблон заездных дней (daily, weekly, shifts, random).
+    :param sanatorium_skew: Перекос кол-ва путёвок между санаториями (0 — поровну).
+    :param day_skew: Перекос кол-ва путёвок между заездными днями санатория (0 — поровну).
+    :param seed: Начальное значение генератора случайных чисел.
+    :return: Список путёвок в случайном порядке.
+    """
+    rnd = np.random.default_rng(seed)
+    total = sanatoriums * vouchers_per_sanatorium
+    sizes = rnd.multinomial(total, get_weights(sanatoriums, sanatorium_skew, rnd))
+
+    sanatorium_ids = []
+    days = []
+    arrival_numbers = []
+    for sanatorium_idx, size in enumerate(sizes):
+        arrival_days = get_arrival_days(arrival_pattern, rnd)
+        day_idx = rnd.choice(len(arrival_days), size=size, p=get_weights(len(arrival_days), day_skew, rnd))
+        sanatorium_ids.append(np.full(size, sanatorium_idx + 1, dtype=np.int64))
+        days.append(arrival_days[day_idx])
+        arrival_numbers.append(day_idx + 1)
+
+    days = np.concatenate(days)
+    date_begin = START_DATE + days.astype('timedelta64[D]')
+    df = pd.DataFrame({
+        'id': np.arange(1, total + 1),
+        'sanatorium_id': np.concatenate(sanatorium_ids),
+        'organization_id': None,
+        'number': np.char.mod('%08d', rnd.permutation(total)).astype(object),
+        'date_begin': np.datetime_as_string(date_begin, unit='D').astype(object),
+        'date_end': np.datetime_as_string(date_begin + np.timedelta64(21, 'D'), unit='D').astype(object),
+        'duration': 21,
+        'arrival_number': np.concatenate(arrival_numbers),
+    })
+    return df.iloc[rnd.permutation(total)].reset_index(drop=True)
+
+
+def generate_settings(
+        df: pd.DataFrame,
+        medical_units: int = 2,
+        to_sanatorium: float = 0.5,
+        to_reserve: float = 0.2,
+        to_medical_unit: float = 0.05
+) -> List[Settings]:
+    """
+    Функция формирует настройки распределения для каждого санатория списка путёвок.
+
+    :param df: Список путёвок.
+    :param medical_units: Кол-во МСЧ.
+    :param to_sanatorium: Доля путёвок санатория к распределению в санаторий.
+    :param to_reserve: Доля путёвок санатория к распределению в резерв.
+    :param to_medical_unit: Доля путёвок санатория к распределению в каждую МСЧ.
+    """
+    settings = []
+    for sanatorium_id, total in df['sanatorium_id'].value_counts(sort=False).sort_index().items():
+        sanatorium_settings = Settings()
+        sanatorium_settings.sanatorium_id = sanatorium_id
+        sanatorium_settings.to_sanatorium = int(total * to_sanatorium)
+        sanatorium_settings.to_reserve = int(total * to_reserve)
+        sanatorium_settings.to_medical_units = {
+            medical_unit_id: int(total * to_medical_unit) for medical_unit_id in range(1, medical_units + 1)
+        }
+        settings.append(sanatorium_settings)
+    return settings
@@ -0,0 +1,105 @@
+"""
+Сравнение потребления памяти результатом распределения.
+
+Построчное представление (отдельный pd.Series на каждую распределённую путёвку, как было раньше)
+сравнивается с колоночным представлением DistributedVouchers. Для каждого представления
+выводится объём памяти, занятый результатом, и пиковый объём памяти при построении
+результата и таблицы распределённых путёвок.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.result_memory --vouchers 300000 --sanatoriums 50
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from typing import Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generator import generate_settings, generate_vouchers  # noqa: E402
+from distributor import Distribution, DistributedVouchers, VoucherStatus  # noqa: E402
+
+
+def build_rows(df: pd.DataFrame, vouchers: DistributedVouchers) -> Tuple[list, pd.DataFrame]:
+    """
+    Построчное представление: копия строки на каждую путёвку и таблица из списка строк
+    (статусы в таблице — названия, как в Distribution.dataframe).
+    """
+    rows = []
+    for position, status, organization_id in zip(vouchers.positions, vouchers.statuses, vouchers.organization_ids):
+        row = df.iloc[position].copy()
+        row['status'] = status
+        row['organization_id'] = organization_id
+        rows.append(row)
+    table = []
+    for row in rows:
+        table.append([
+            row['id'],
+            row['sanatorium_id'],
+            row['organization_id'],
+            row['number'],
+            row['date_begin'],
+            row['date_end'],
+            row['duration'],
+            row['arrival_number'],
+            VoucherStatus.get_label(row['status']),
+        ])
+    return rows, pd.DataFrame(table)
+
+
+def build_columns(df: pd.DataFrame, vouchers: DistributedVouchers) -> Tuple[DistributedVouchers, pd.DataFrame]:
+    """
+    Колоночное представление: позиции, статусы и организации
+    (статусы в таблице — названия, как в Distribution.dataframe).
+    """
+    result = DistributedVouchers(df, vouchers.positions.copy(), vouchers.statuses.copy(), vouchers.organizations.copy())
+    return result, Distribution.get_vouchers_table(
+        df, result.positions, result.organization_ids, VoucherStatus.get_labels(result.statuses)
+    )
+
+
+def measure(build, *args) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result, table = build(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    del table
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {'retained': retained, 'peak': peak, 'time': elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vouchers', type=int, default=100000, help='Кол-во путёвок.')
+    parser.add_argument('--sanatoriums', type=int, default=50, help='Кол-во санаториев.')
+    args = parser.parse_args()
+
+    df = generate_vouchers(args.sanatoriums, max(1, args.vouchers // args.sanatoriums))
+    distribution = Distribution(vouchers=df, results_cache_size=0)
+    distribution.settings = generate_settings(df, medical_units=1)
+    vouchers = distribution.get_distribute()
+    print('Путёвок: %d, распределено: %d (в санаторий: %d)' % (
+        len(df.index), len(vouchers), int((vouchers.statuses == VoucherStatus.TO_SANATORIUM).sum())
+    ))
+
+    for name, build in (('построчное', build_rows), ('колоночное', build_columns)):
+        stats = measure(build, df, vouchers)
+        print('%-12s результат %8.1f МБ, пик %8.1f МБ, %6.2f с' % (
+            name, stats['retained'] / 1024 ** 2, stats['peak'] / 1024 ** 2, stats['time']
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import functools
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from typing import NoReturn, List, Hashable, Tuple, Optional, Callable
+
+# заголовок записи: длина JSON описания записи
+RECORD_HEADER = struct.Struct('<I')
+# размер данных одной путёвки в записи: индекс (int64), статус (int8) и организация (int32)
+VOUCHER_SIZE = 8 + 1 + 4
+
+
+class Checkpoint(object):
+    """
+    Контрольная точка одного распределения — файл, в который только дописываются записи.
+
+    Первая запись содержит ключ распределения, каждая следующая — результат одного санатория:
+    JSON описание (ID санатория, кол-во путёвок, контрольная сумма) и массивы индексов (int64),
+    статусов (int8) и организаций (int32) распределённых путёвок. Запись, не дописанная
+    до конца (процесс завершён во время записи), отбрасывается при открытии файла.
+    """
+
+    def __init__(self, path: str, key: str, release: Optional[Callable[[], None]] = None):
+        """
+        :param path: Путь к файлу контрольной точки.
+        :param key: Ключ распределения (отпечаток путёвок и настроек санаториев).
+        :param release: Функция, вызываемая один раз после закрытия или удаления контрольной точки
+                        (снимает блокировку ключа, см. Checkpoints.open).
+        """
+        self.path = path
+        self.key = key
+        self.results = {}
+        self._file = None
+        self._release = release
+
+    def open(self) -> 'Checkpoint':
+        """Читает сохранённые результаты санаториев и открывает файл для дописывания"""
+        offset = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                records, offset = self.read_records(f.read())
+            if records and records[0][0].get('key') == self.key:
+                for meta, arrays in records[1:]:
+                    self.results[meta['sanatorium_id']] = arrays
+            else:
+                offset = 0
+
+        self._file = open(self.path, 'r+b' if offset else 'wb')
+        self._file.truncate(offset)
+        self._file.seek(offset)
+        if not offset:
+            self.write({'key': self.key, 'created': time.time()})
+        return self
+
+    @staticmethod
+    def read_records(data: bytes) -> Tuple[List[Tuple[dict, tuple]], int]:
+        """
+        Разбирает записи файла контрольной точки.
+
+        :param data: Содержимое файла.
+        :return: Записи (описание и массивы) и размер части файла с целыми записями.
+        """
+        records = []
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            size, = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            try:
+                meta = json.loads(data[start:start + size])
+            except ValueError:
+                break
+            start += size
+            count = meta.get('size', 0)
+            end = start + count * VOUCHER_SIZE
+            if end > len(data) or zlib.crc32(data[start:end]) != meta.get('crc', 0):
+                break
+            arrays = (
+                np.frombuffer(data, dtype=np.int64, count=count, offset=start),
+                np.frombuffer(data, dtype=np.int8, count=count, offset=start + count * 8),
+                np.frombuffer(data, dtype=np.int32, count=count, offset=start + count * 9),
+            )
+            records.append((meta, arrays))
+            offset = end
+        return records, offset
+
+    def write(self, meta: dict, payload: bytes = b'') -> NoReturn:
+        meta['crc'] = zlib.crc32(payload)
+        data = json.dumps(meta).encode()
+        self._file.write(RECORD_HEADER.pack(len(data)) + data + payload)
+        # сброс буфера в ОС без fsync: запись переживает завершение процесса
+        self._file.flush()
+
+    def append(
+            self,
+            sanatorium_id: Hashable,
+            indexes: np.ndarray,
+            statuses: np.ndarray,
+            organizations: np.ndarray
+    ) -> NoReturn:
+        """
+        Дописывает результат распределения санатория.
+
+        :param sanatorium_id: ID санатория.
+        :param indexes: Индексы распределённых путёвок в списке путёвок.
+        :param statuses: Статусы распределённых путёвок.
+        :param organizations: Организации распределённых путёвок.
+        """
+        payload = b''.join([
+            np.ascontiguousarray(indexes, dtype=np.int64).tobytes(),
+            np.ascontiguousarray(statuses, dtype=np.int8).tobytes(),
+            np.ascontiguousarray(organizations, dtype=np.int32).tobytes(),
+        ])
+        if isinstance(sanatorium_id, np.generic):
+            sanatorium_id = sanatorium_id.item()
+        self.write({'sanatorium_id': sanatorium_id, 'size': len(indexes)}, payload)
+
+    def close(self) -> NoReturn:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+
+    def remove(self) -> NoReturn:
+        """Удаляет контрольную точку завершённого распределения"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        # блокировка ключа снимается только после удаления файла, чтобы распределение с тем же ключом
+        # не открыло файл, который сразу будет удалён
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        self.close()
+
+
+class Checkpoints(object):
+    """
+    Каталог контрольных точек распределений.
+
+    Контрольная точка удаляется после завершения распределения, а контрольные точки прерванных
+    распределений, которые так и не были продолжены, — по истечении времени жизни.
+    Контрольная точка открывается только одним распределением: пока она не закрыта, распределение
+    с тем же ключом (например, то же сообщение в другом потоке) выполняется без контрольной точки.
+    """
+    EXTENSION = '.checkpoint'
+
+    def __init__(self, path: str, ttl: int = 86400):
+        """
+        :param path: Каталог контрольных точек.
+        :param ttl: Время (в секундах), в течение которого хранится контрольная точка прерванного распределения.
+        """
+        self.path = path
+        self.ttl = ttl
+        # ключи открытых контрольных точек
+        self._opened = set()
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def get_key(parts: list) -> str:
+        """Ключ контрольной точки по отпечаткам путёвок и настроек санаториев"""
+        return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+    def open(self, key: str) -> Optional[Checkpoint]:
+        """
+        Открывает контрольную точку распределения (с результатами, сохранёнными до прерывания).
+
+        :param key: Ключ контрольной точки.
+        :return: Контрольная точка или None, если контрольная точка с этим ключом уже открыта.
+        """
+        with self._lock:
+            if key in self._opened:
+                return None
+            self._opened.add(key)
+        try:
+            self.evict()
+            return Checkpoint(
+                os.path.join(self.path, key + self.EXTENSION),
+                key,
+                release=functools.partial(self.release, key)
+            ).open()
+        except BaseException:
+            self.release(key)
+            raise
+
+    def release(self, key: str) -> NoReturn:
+        """Снимает блокировку ключа закрытой контрольной точки"""
+        with self._lock:
+            self._opened.discard(key)
+
+    def evict(self) -> NoReturn:
+        """Удаляет контрольные точки с истёкшим временем жизни (кроме открытых)"""
+        with self._lock:
+            opened = set(self._opened)
+        for name in self.keys():
+            if name in opened:
+                continue
+            path = os.path.join(self.path, name + self.EXTENSION)
+            try:
+                if time.time() - os.path.getmtime(path) >= self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def keys(self) -> List[str]:
+        return [
+            name[:-len(self.EXTENSION)] for name in os.listdir(self.path) if name.endswith(self.EXTENSION)
+        ]
+
@@ -1,23 +1,39 @@
+import copy
 import datetime
+import hashlib
 import json
 import math
 import os
 import sys
 import enum
+import functools
+import threading
+import time
+import warnings
 
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 try:
     import pika
     from pika.adapters.blocking_connection import BlockingChannel
+    from pika.exceptions import NackError, UnroutableError
     from pika.spec import Basic
 except ModuleNotFoundError:
     pass
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from urllib.parse import urljoin
 
-from pandas.core.groupby.generic import DataFrameGroupBy
-from typing import NoReturn, List, Union, Optional, Hashable, Dict
+from typing import NoReturn, List, Union, Optional, Hashable, Dict, Tuple, Iterator, NamedTuple, Callable
+
+import metrics
+from checkpoint import Checkpoint, Checkpoints
+from vouchers_cache import VouchersCache
+from vouchers_loader import VouchersColumns, read_vouchers
 
 
 class VoucherStatus(object):
@@ -27,25 +43,649 @@ class VoucherStatus(object):
     TO_EXCHANGE = 3  # На обмен
     TO_MEDICAL_UNIT = 4  # В резерв МСЧ
 
-    def __getattribute__(self, item: str):
-        if item.startswith('to_medical_unit_'):
-            item = item[:15]
-        item = item.upper()
-        return object.__getattribute__(self, item)
+    # названия статусов в таблице распределённых путёвок
+    LABELS = {
+        TO_SANATORIUM: 'В санаторий',
+        TO_RESERVE: 'В резерв',
+        TO_MEDICAL_UNIT: 'В МСЧ',
+    }
+    # название остальных статусов
+    OTHER_LABEL = 'Куда-то'
+
+    @classmethod
+    def get_label(cls, status: int) -> str:
+        """Название статуса в таблице распределённых путёвок"""
+        return cls.LABELS.get(status, cls.OTHER_LABEL)
+
+    @classmethod
+    def get_labels(cls, statuses: np.ndarray) -> np.ndarray:
+        """Названия статусов путёвок в таблице распределённых путёвок"""
+        return pd.Series(statuses).map(cls.LABELS).fillna(cls.OTHER_LABEL).to_numpy()
+
+    @classmethod
+    def get_status(cls, direction: str) -> int:
+        """Статус путёвок направления распределения (to_medical_unit_N — в резерв МСЧ)"""
+        if direction.startswith('to_medical_unit_'):
+            return cls.TO_MEDICAL_UNIT
+        return getattr(cls, direction.upper())
+
+    def __getattr__(self, item: str) -> int:
+        # вызывается только для отсутствующих атрибутов (направлений распределения)
+        return self.get_status(item)
 
 
 class Settings(object):
-    """Настройки распределения"""
+    """
+    Настройки распределения (изменяемые, заполняются в интерфейсе и генераторе настроек).
+
+    Перед распределением настройки проверяются и преобразуются в SanatoriumSettings.
+    """
     sanatorium_id: Optional[Hashable]
     to_sanatorium: int
     to_reserve: int
-    to_exchange = {}
-    to_medical_units = {}
+    to_exchange: Dict[int, int]
+    to_medical_units: Dict[int, int]
+
+    def __init__(self):
+        # у каждого санатория свои настройки распределения на обмен и в МСЧ
+        self.to_exchange = {}
+        self.to_medical_units = {}
 
-    def __getattribute__(self, item: str):
+    def __getattr__(self, item: str):
+        # вызывается только для отсутствующих атрибутов: кол-во путёвок в МСЧ по имени направления
         if item.startswith('to_medical_unit_'):
             return self.to_medical_units[int(item[16:])]
-        return object.__getattribute__(self, item)
+        raise AttributeError(item)
+
+    @property
+    def fingerprint(self) -> tuple:
+        """Нормализованные настройки, влияющие на результат распределения санатория"""
+        return (
+            self.sanatorium_id,
+            int(self.to_sanatorium),
+            int(self.to_reserve),
+            tuple((int(medical_unit_id), int(cnt)) for medical_unit_id, cnt in self.to_medical_units.items()),
+        )
+
+
+class DirectionPlan(NamedTuple):
+    """Направление распределения санатория"""
+    # имя направления (to_sanatorium, to_reserve, to_medical_unit_N)
+    direction: str
+    status: int
+    # организация распределённых путёвок (DistributedVouchers.NO_ORGANIZATION — не указана)
+    organization_id: int
+    # кол-во путёвок к распределению
+    quota: int
+
+
+class SanatoriumSettings(NamedTuple):
+    """
+    Проверенные неизменяемые настройки распределения санатория.
+
+    План распределения (направления в порядке распределения со статусами, организациями
+    и кол-вом путёвок) составляется один раз при создании настроек.
+    """
+    sanatorium_id: Hashable
+    to_sanatorium: int
+    to_reserve: int
+    to_exchange: Tuple[Tuple[int, int], ...]
+    to_medical_units: Tuple[Tuple[int, int], ...]
+    plan: Tuple[DirectionPlan, ...]
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SanatoriumSettings':
+        """
+        Создаёт настройки распределения санатория из словаря сообщения брокера.
+
+        :param data: Словарь с ключами sanatorium_id, to_sanatorium, to_reserve, to_exchange и to_medical_units.
+        """
+        assert isinstance(data, dict), 'Настройки санатория должны передаваться объектом.'
+        sanatorium_id = data.get('sanatorium_id')
+        assert sanatorium_id is not None, 'В настройках санатория необходимо указать sanatorium_id.'
+        to_exchange = data.get('to_exchange') or {}
+        to_medical_units = data.get('to_medical_units') or {}
+        assert isinstance(to_exchange, dict) and isinstance(to_medical_units, dict), (
+            'Кол-во путёвок на обмен и в МСЧ должно передаваться объектом.'
+        )
+
+        to_medical_units = tuple(
+            (get_settings_number(medical_unit_id, 'ID МСЧ'), get_settings_number(cnt, 'Кол-во путёвок в МСЧ'))
+            for medical_unit_id, cnt in to_medical_units.items()
+        )
+        assert len({medical_unit_id for medical_unit_id, _ in to_medical_units}) == len(to_medical_units), (
+            'МСЧ санатория %s указаны несколько раз.' % sanatorium_id
+        )
+        to_sanatorium = get_settings_number(data.get('to_sanatorium') or 0, 'Кол-во путёвок в санаторий')
+        to_reserve = get_settings_number(data.get('to_reserve') or 0, 'Кол-во путёвок в резерв')
+
+        plan = [
+            DirectionPlan('to_sanatorium', VoucherStatus.TO_SANATORIUM, int(sanatorium_id), to_sanatorium),
+            DirectionPlan('to_reserve', VoucherStatus.TO_RESERVE, DistributedVouchers.NO_ORGANIZATION, to_reserve),
+        ]
+        for medical_unit_id, cnt in to_medical_units:
+            plan.append(DirectionPlan(
+                'to_medical_unit_%d' % medical_unit_id,
+                VoucherStatus.TO_MEDICAL_UNIT,
+                medical_unit_id,
+                cnt
+            ))
+        return cls(
+            sanatorium_id,
+            to_sanatorium,
+            to_reserve,
+            tuple((int(organization_id), int(cnt)) for organization_id, cnt in to_exchange.items()),
+            to_medical_units,
+            tuple(plan),
+        )
+
+    @classmethod
+    def adapt(cls, settings: Union['SanatoriumSettings', Settings, dict]) -> 'SanatoriumSettings':
+        """Преобразует настройки санатория (Settings или словарь сообщения) в SanatoriumSettings"""
+        if isinstance(settings, cls):
+            return settings
+        if isinstance(settings, Settings):
+            settings = {
+                'sanatorium_id': getattr(settings, 'sanatorium_id', None),
+                'to_sanatorium': getattr(settings, 'to_sanatorium', 0),
+                'to_reserve': getattr(settings, 'to_reserve', 0),
+                'to_exchange': settings.to_exchange,
+                'to_medical_units': settings.to_medical_units,
+            }
+        return cls.from_dict(settings)
+
+    @property
+    def directions(self) -> List[str]:
+        """Направления распределения санатория в порядке распределения"""
+        return [direction_plan.direction for direction_plan in self.plan]
+
+    @property
+    def fingerprint(self) -> tuple:
+        """Нормализованные настройки, влияющие на результат распределения санатория"""
+        return self.sanatorium_id, self.to_sanatorium, self.to_reserve, self.to_medical_units
+
+
+def get_settings_number(value, name: str) -> int:
+    """Проверяет и возвращает неотрицательное целое число из настроек санатория"""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise AssertionError('%s должно быть целым числом, получено %r.' % (name, value))
+    assert number == value or isinstance(value, str), '%s должно быть целым числом, получено %r.' % (name, value)
+    assert number >= 0, '%s не может быть отрицательным, получено %r.' % (name, value)
+    return number
+
+
+class VouchersCalendar(object):
+    """Кол-во путёвок санатория по заездным дням и месяцам в виде массивов NumPy"""
+
+    def __init__(self, days: np.ndarray, day_counts: np.ndarray):
+        """
+        :param days: Заездные дни санатория (datetime64[D]), отсортированные по возрастанию.
+        :param day_counts: Кол-во оставшихся путёвок в каждый заездной день.
+        """
+        # дни, в которые не осталось путёвок, в расчёт не попадают
+        self.day_positions = np.flatnonzero(day_counts)
+        self.days = days[self.day_positions]
+        self.day_counts = day_counts[self.day_positions]
+
+        self.months, self.day_month = np.unique(self.days.astype('datetime64[M]'), return_inverse=True)
+        self.month_counts = np.bincount(
+            self.day_month,
+            weights=self.day_counts,
+            minlength=len(self.months)
+        ).astype(np.int64)
+
+    @property
+    def day_labels(self) -> List[str]:
+        """Заездные дни в формате ГГГГ-ММ-ДД"""
+        return np.datetime_as_string(self.days, unit='D').tolist()
+
+    @property
+    def month_labels(self) -> List[str]:
+        """Месяцы в формате ГГГГ-ММ"""
+        return np.datetime_as_string(self.months, unit='M').tolist()
+
+
+class SanatoriumVouchers(object):
+    """Оставшиеся к распределению путёвки одного санатория"""
+
+    def __init__(self, df: pd.DataFrame, day_codes: np.ndarray, row_hashes: Optional[np.ndarray] = None):
+        """
+        :param df: Путёвки санатория, отсортированные по дате заезда и номеру путёвки.
+        :param day_codes: Дата заезда каждой путёвки (datetime64[D]).
+        :param row_hashes: Хэши строк путёвок (если уже посчитаны для всего списка путёвок).
+        """
+        self.df = df
+        self.days, self.day_idx = np.unique(day_codes, return_inverse=True)
+        self.row_hashes = row_hashes
+        self._calendar = None
+
+    def __len__(self) -> int:
+        return len(self.day_idx)
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        """
+        Отпечаток оставшихся путёвок санатория (с учётом их индексов)
+        или None, если поля путёвок не удалось хэшировать.
+        """
+        if self.row_hashes is None:
+            self.row_hashes = get_row_hashes(self.df)
+            if self.row_hashes is None:
+                return None
+        return hashlib.sha1(self.row_hashes.tobytes()).hexdigest()
+
+    @property
+    def calendar(self) -> VouchersCalendar:
+        """Кол-во оставшихся путёвок по заездным дням и месяцам"""
+        if self._calendar is None:
+            self._calendar = VouchersCalendar(self.days, np.bincount(self.day_idx, minlength=len(self.days)))
+        return self._calendar
+
+    @property
+    def ranks(self) -> np.ndarray:
+        """Порядковый номер каждой путёвки внутри своего заездного дня"""
+        return np.arange(len(self.day_idx)) - np.searchsorted(self.day_idx, self.day_idx, side='left')
+
+    def remove(self, indexes: pd.Index) -> NoReturn:
+        """Убирает распределённые путёвки из среза санатория"""
+        if len(indexes):
+            is_exists = ~self.df.index.isin(indexes)
+            self.df = self.df[is_exists]
+            self.day_idx = self.day_idx[is_exists]
+            if self.row_hashes is not None:
+                self.row_hashes = self.row_hashes[is_exists]
+            self._calendar = None
+
+
+class SanatoriumDistribution(object):
+    """Результат распределения путёвок одного санатория"""
+
+    def __init__(self, sanatorium_id: Hashable):
+        self.sanatorium_id = sanatorium_id
+        # индексы распределённых путёвок в общем списке путёвок (в порядке распределения),
+        # их статусы и организации
+        self.indexes = np.empty(0, dtype=np.int64)
+        self.statuses = np.empty(0, dtype=np.int8)
+        self.organizations = np.empty(0, dtype=np.int32)
+        # отладочные данные распределения по месяцам и дням для каждого направления
+        # (заполняются только в режиме отладки)
+        self.vouchers_per_months = {}
+        self.vouchers_per_days = {}
+        # замеры времени этапов распределения и приращения счётчиков корректировок (если включён сбор метрик),
+        # санаторий может распределяться в дочернем процессе, метрики которого в основной процесс не попадают
+        self.timings = []
+
+    @classmethod
+    def from_arrays(
+            cls,
+            sanatorium_id: Hashable,
+            indexes: np.ndarray,
+            statuses: np.ndarray,
+            organizations: np.ndarray
+    ) -> 'SanatoriumDistribution':
+        """Результат распределения санатория, восстановленный из контрольной точки"""
+        result = cls(sanatorium_id)
+        result.indexes = np.array(indexes, dtype=np.int64)
+        result.statuses = np.array(statuses, dtype=np.int8)
+        result.organizations = np.array(organizations, dtype=np.int32)
+        return result
+
+    def append(self, indexes: pd.Index, status: int, organization_id: int) -> NoReturn:
+        """Добавляет путёвки, распределённые по одному направлению"""
+        self.indexes = np.concatenate([self.indexes, indexes.to_numpy(dtype=np.int64)])
+        self.statuses = np.concatenate([self.statuses, np.full(len(indexes), status, dtype=np.int8)])
+        self.organizations = np.concatenate(
+            [self.organizations, np.full(len(indexes), organization_id, dtype=np.int32)]
+        )
+
+
+class DistributedVouchers(object):
+    """
+    Распределённые путёвки в колоночном виде.
+
+    Хранятся только позиции путёвок в исходном списке путёвок, статусы (int8) и организации (int32),
+    остальные поля путёвок берутся из исходного списка по мере необходимости.
+    """
+    # организация не указана (путёвки в резерв)
+    NO_ORGANIZATION = -1
+
+    def __init__(
+            self,
+            source: pd.DataFrame,
+            positions: np.ndarray,
+            statuses: np.ndarray,
+            organizations: np.ndarray
+    ):
+        """
+        :param source: Исходный список путёвок.
+        :param positions: Позиции распределённых путёвок в исходном списке путёвок.
+        :param statuses: Статусы распределённых путёвок.
+        :param organizations: Организации распределённых путёвок.
+        """
+        self.source = source
+        self.positions = positions
+        self.statuses = statuses
+        self.organizations = organizations
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @classmethod
+    def from_results(cls, source: pd.DataFrame, results: List[SanatoriumDistribution]) -> 'DistributedVouchers':
+        """
+        Собирает распределённые путёвки из результатов распределения санаториев.
+
+        :param source: Исходный список путёвок.
+        :param results: Результаты распределения санаториев.
+        """
+        if not results:
+            return cls(
+                source,
+                np.empty(0, dtype=np.intp),
+                np.empty(0, dtype=np.int8),
+                np.empty(0, dtype=np.int32)
+            )
+        return cls(
+            source,
+            source.index.get_indexer(np.concatenate([result.indexes for result in results])),
+            np.concatenate([result.statuses for result in results]),
+            np.concatenate([result.organizations for result in results]),
+        )
+
+    def take(self, order: np.ndarray) -> 'DistributedVouchers':
+        """Распределённые путёвки в другом порядке (order — позиции путёвок в текущем порядке)"""
+        return DistributedVouchers(self.source, self.positions[order], self.statuses[order], self.organizations[order])
+
+    def column(self, name: str) -> np.ndarray:
+        """Значения поля распределённых путёвок"""
+        if not len(self.positions):
+            return np.empty(0, dtype=object)
+        return self.source[name].to_numpy()[self.positions]
+
+    @property
+    def organization_ids(self) -> np.ndarray:
+        """Организации распределённых путёвок (None — организация не указана)"""
+        organization_ids = self.organizations.astype(object)
+        organization_ids[self.organizations == self.NO_ORGANIZATION] = None
+        return organization_ids
+
+    def to_records(self) -> List[dict]:
+        """Распределённые путёвки для ответа брокеру"""
+        return [
+            {'id': voucher_id, 'sanatorium_id': sanatorium_id, 'status': status, 'organization_id': organization_id}
+            for voucher_id, sanatorium_id, status, organization_id in zip(
+                self.column('id').tolist(),
+                self.column('sanatorium_id').tolist(),
+                self.statuses.tolist(),
+                self.organization_ids.tolist(),
+            )
+        ]
+
+
+class ScenarioResult(object):
+    """Результат распределения одного сценария настроек"""
+
+    def __init__(
+            self,
+            settings: List['SanatoriumSettings'],
+            results: List[SanatoriumDistribution],
+            vouchers: DistributedVouchers
+    ):
+        """
+        :param settings: Настройки распределения санаториев сценария.
+        :param results: Результаты распределения санаториев.
+        :param vouchers: Распределённые путёвки сценария.
+        """
+        self.settings = settings
+        self.results = results
+        self.vouchers = vouchers
+
+    @property
+    def summary(self) -> pd.DataFrame:
+        """Запрошенное и распределённое кол-во путёвок по санаториям и направлениям сценария"""
+        results = {result.sanatorium_id: result for result in self.results}
+        rows = []
+        for settings in self.settings:
+            result = results.get(settings.sanatorium_id)
+            for direction in settings.plan:
+                distributed = 0
+                if result is not None:
+                    distributed = int(np.count_nonzero(
+                        (result.statuses == direction.status) & (result.organizations == direction.organization_id)
+                    ))
+                rows.append({
+                    'sanatorium_id': settings.sanatorium_id,
+                    'direction': direction.direction,
+                    'requested': direction.quota,
+                    'distributed': distributed,
+                })
+        return pd.DataFrame(rows, columns=['sanatorium_id', 'direction', 'requested', 'distributed'])
+
+    def to_dict(self, rows: bool = True) -> dict:
+        """
+        Результат сценария для ответа брокеру.
+
+        :param rows: Добавить в результат распределённые путёвки.
+        """
+        result = {
+            'total': len(self.vouchers),
+            'summary': self.summary.to_dict('records'),
+        }
+        if rows:
+            result['rows'] = self.vouchers.to_records()
+        return result
+
+
+class ResultsCache(object):
+    """Ограниченный LRU кэш результатов распределения санаториев"""
+
+    def __init__(self, max_size: int = 2048):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        # кэш общий для распределений, выполняемых в разных потоках
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get(self, key: Hashable) -> Optional[SanatoriumDistribution]:
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: Hashable, result: SanatoriumDistribution) -> NoReturn:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def clear(self) -> NoReturn:
+        with self._lock:
+            self._results.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def distribute_sanatoriums(
+        sanatoriums: List[Tuple[SanatoriumVouchers, SanatoriumSettings]],
+        vectorized: bool = True,
+        collect_metrics: bool = False,
+        debug: bool = False
+) -> List[SanatoriumDistribution]:
+    """
+    Функция распределяет путёвки группы санаториев, выполняется в отдельном процессе.
+
+    :param sanatoriums: Путёвки и настройки распределения санаториев.
+    :param vectorized: Векторизованный отбор путёвок.
+    :param collect_metrics: Замерять время этапов распределения.
+    :param debug: Сохранять отладочные данные распределения.
+    """
+    if collect_metrics:
+        metrics.registry.enable()
+    distribution = Distribution(vouchers=[], vectorized=vectorized, debug=debug)
+    return [distribution.distribute_sanatorium(vouchers, settings) for vouchers, settings in sanatoriums]
+
+
+# заголовок сообщения с кол-вом выполненных попыток обработки
+ATTEMPTS_HEADER = 'x-distribution-attempts'
+
+
+class DistributionCancelled(Exception):
+    """Распределение отменено (получена более новая ревизия настроек)"""
+
+
+def parse_message(body: bytes) -> dict:
+    """
+    Функция разбирает сообщение брокера с настройками распределения.
+
+    Сообщение — JSON объект с ключами settings (список настроек санаториев) и distribution_date
+    (начало и конец периода заездов) либо только список настроек санаториев.
+
+    Сообщение со сценариями вместо settings содержит ключ scenarios — список сценариев, каждый
+    сценарий — список настроек санаториев или объект с ключами id и settings. Ключ rows (по умолчанию true)
+    определяет, возвращать ли распределённые путёвки сценариев или только сводку.
+
+    :param body: Тело сообщения.
+    :return: Словарь с ключами settings и distribution_date (для сценариев — ещё и scenarios,
+             а settings — настройки всех санаториев сценариев, по которым запрашиваются путёвки).
+    """
+    message = json.loads(body)
+    if isinstance(message, list):
+        message = {'settings': message}
+    if message.get('scenarios') is not None:
+        assert isinstance(message['scenarios'], list), 'Сценарии должны передаваться списком.'
+        scenarios = []
+        sanatoriums = {}
+        for position, scenario in enumerate(message['scenarios']):
+            if not isinstance(scenario, dict):
+                scenario = {'settings': scenario}
+            assert isinstance(scenario.get('settings'), list), 'Сценарий должен содержать список настроек санаториев.'
+            scenarios.append({'id': scenario.get('id', position), 'settings': scenario['settings']})
+            for settings in scenario['settings']:
+                sanatoriums.setdefault(settings['sanatorium_id'], settings)
+        message['scenarios'] = scenarios
+        message['settings'] = list(sanatoriums.values())
+    assert isinstance(message.get('settings'), list), 'Сообщение должно содержать список настроек санаториев.'
+    message.setdefault('distribution_date', None)
+    return message
+
+
+def validate_message(body: bytes) -> dict:
+    """
+    Функция разбирает сообщение брокера и проверяет настройки санаториев (и сценариев).
+    Сообщение, которое не прошло проверку, нельзя распределить ни с какой попытки.
+
+    :param body: Тело сообщения.
+    :return: Сообщение (см. parse_message).
+    """
+    message = parse_message(body)
+    for settings in message['settings']:
+        SanatoriumSettings.from_dict(settings)
+    for scenario in message.get('scenarios') or []:
+        for settings in scenario['settings']:
+            SanatoriumSettings.from_dict(settings)
+    return message
+
+
+def json_default(value):
+    """Преобразует типы NumPy при сериализации в JSON"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Object of type %s is not JSON serializable' % type(value).__name__)
+
+
+# поля путёвки, которые используются при распределении
+VOUCHERS_COLUMNS = (
+    'id',
+    'sanatorium_id',
+    'organization_id',
+    'number',
+    'date_begin',
+    'date_end',
+    'duration',
+    'arrival_number',
+)
+# поля путёвки, которые хранятся до конца распределения при получении путёвок пачками санаториев
+STREAM_COLUMNS = ('id', 'sanatorium_id')
+# целочисленные поля путёвки
+VOUCHERS_INT_COLUMNS = {
+    'id': np.int32,
+    'sanatorium_id': np.int32,
+    'organization_id': np.int32,
+    'duration': np.int16,
+    'arrival_number': np.int16,
+}
+# поля путёвки с датами
+VOUCHERS_DATE_COLUMNS = ('date_begin', 'date_end')
+
+
+def apply_vouchers_schema(df: pd.DataFrame, drop_unused_columns: bool = False) -> pd.DataFrame:
+    """
+    Функция приводит поля списка путёвок к компактным типам.
+
+    Целочисленные поля хранятся в int32/int16 (при наличии пропусков — в Int32/Int16),
+    нечисловые ID — в виде категорий, даты — в datetime64.
+    Поля с уже приведёнными типами не копируются.
+
+    :param df: Список путёвок.
+    :param drop_unused_columns: Удалить поля, которые не используются при распределении.
+    :return: Список путёвок с приведёнными типами полей.
+    """
+    if drop_unused_columns:
+        df = df[[column for column in df.columns if column in VOUCHERS_COLUMNS]]
+
+    columns = {}
+    for column, dtype in VOUCHERS_INT_COLUMNS.items():
+        nullable_dtype = pd.Int32Dtype() if dtype == np.int32 else pd.Int16Dtype()
+        if column not in df.columns or df[column].dtype in (dtype, nullable_dtype, 'category'):
+            continue
+        values = df[column]
+        if pd.api.types.infer_dtype(values, skipna=True) not in ('integer', 'floating', 'mixed-integer-float', 'empty'):
+            # строковые ID храним в виде категорий
+            columns[column] = values.astype('category')
+            continue
+        values = pd.to_numeric(values)
+        if values.isna().any():
+            columns[column] = values.astype(nullable_dtype)
+        elif len(values) and not np.iinfo(dtype).min <= values.min() <= values.max() <= np.iinfo(dtype).max:
+            columns[column] = values.astype(np.int64)
+        else:
+            columns[column] = values.astype(dtype)
+    for column in VOUCHERS_DATE_COLUMNS:
+        if column in df.columns and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            columns[column] = pd.to_datetime(df[column])
+
+    if columns:
+        df = df.assign(**columns)
+    return df
+
+
+def get_row_hashes(df: pd.DataFrame) -> Optional[np.ndarray]:
+    """
+    Функция считает хэши строк списка путёвок (с учётом индексов) по полям, которые используются
+    при распределении. Остальные поля на результат не влияют и могут содержать вложенные объекты,
+    которые не хэшируются.
+
+    :param df: Список путёвок.
+    :return: Хэши строк или None, если поля путёвок не удалось хэшировать.
+    """
+    columns = [column for column in df.columns if column in VOUCHERS_COLUMNS]
+    try:
+        return pd.util.hash_pandas_object(df[columns]).to_numpy()
+    except TypeError:
+        return None
 
 
 class Distribution(object):
@@ -57,29 +697,101 @@ class Distribution(object):
 
     # Настройки
     _df: pd.DataFrame
-    _settings: List[Settings]
-    _vouchers_exists: pd.DataFrame
+    _settings: List[SanatoriumSettings]
+    # настройки санаториев по ID санатория (при повторе ID используются первые настройки)
+    _settings_index: Dict[Hashable, SanatoriumSettings]
+    # исходный список путёвок распределения и позиции оставшихся в нём путёвок
+    _vouchers_source: pd.DataFrame
+    _vouchers_exists: np.ndarray
+    # индексы оставшихся путёвок по санаториям
+    _sanatorium_exists: Dict[Hashable, np.ndarray]
     _total_vouchers_by_months: dict
 
     # списки путёвок после распределения
-    to_sanatorium_vouchers = []
-    to_reserve_vouchers = []
-    to_exchange_vouchers = []
-    to_medical_unit_vouchers = []
+    to_sanatorium_vouchers: DistributedVouchers
+    # настройки и результаты распределённых санаториев в порядке распределения
+    _distributed_settings: Dict[Hashable, SanatoriumSettings]
+    _distributed_results: Dict[Hashable, SanatoriumDistribution]
+    # результаты распределения санаториев с данными по месяцам и дням для контрольной таблицы
+    _control_results: Dict[Hashable, SanatoriumDistribution]
 
     # для отладки
-    dump_vouchers_per_months = {}
-    dump_vouchers_per_days = {}
+    dump_vouchers_per_months: Dict[str, List[dict]]
+    dump_vouchers_per_days: Dict[str, List[dict]]
 
     def __init__(self, **kwargs):
-        self.vouchers = kwargs.get('vouchers', [])
-
-        if not self.vouchers:
+        # параметры, с которыми создаются распределения для сообщений брокера
+        self._options = kwargs
+        self.vouchers = kwargs.get('vouchers')
+        # удалять из списка путёвок поля, которые не используются при распределении
+        self.drop_unused_columns = bool(kwargs.get('drop_unused_columns', False))
+        # файл JSON со списком путёвок (путь или файловый объект) загружается сразу в колоночные буферы
+        if self.vouchers is None and kwargs.get('vouchers_file') is not None:
+            self.vouchers = self.load_vouchers(kwargs['vouchers_file'])
+        # векторизованный отбор путёвок (по умолчанию) или построчный проход по DataFrame
+        self.vectorized = kwargs.get('vectorized', True)
+        # кол-во процессов для распределения санаториев
+        self.workers = int(kwargs.get('workers') or 1)
+        # кэш результатов распределения санаториев (0 — кэш отключён)
+        self.results_cache = ResultsCache(int(kwargs.get('results_cache_size', 2048)))
+        # контрольные точки (Checkpoints), по которым прерванное распределение продолжается
+        # с последнего распределённого санатория
+        self.checkpoints = kwargs.get('checkpoints')
+        # событие отмены распределения (устанавливается при получении новой ревизии настроек)
+        self.cancel_event = None
+        self._session = None
+        # режим отладки: сохранять данные распределения по месяцам и дням всех санаториев
+        # (по умолчанию — только для локального списка путёвок, обработчик сообщений брокера их не сохраняет)
+        self.debug = bool(kwargs.get('debug', self.vouchers is not None))
+        self.dump_vouchers_per_months = {}
+        self.dump_vouchers_per_days = {}
+        self._distributed_settings = {}
+        self._distributed_results = {}
+        self._control_results = {}
+        self._sanatorium_exists = {}
+
+        if self.vouchers is None:
+            self.vouchers = []
             self.ampq_url = kwargs.get('ampq_url')
             self.request_queue = kwargs.get('request_queue')
             self.vouchers_url = kwargs.get('vouchers_url')
             self.vouchers_status_code = kwargs.get('vouchers_status_code')
             self.vouchers_page_limit = kwargs.get('vouchers_page_limit')
+            # фильтр списка путёвок, изменённых после отметки времени (для получения изменений списка путёвок),
+            # и отметка времени последнего получения списка путёвок
+            self.vouchers_watermark_filter = kwargs.get('vouchers_watermark_filter') or 'updated_at__gte'
+            self.vouchers_watermark = kwargs.get('vouchers_watermark')
+            # период заездов (начало и конец) для фильтрации списка путёвок
+            self.distribution_date = kwargs.get('distribution_date') or (None, None)
+            self.vouchers_fetch_workers = int(kwargs.get('vouchers_fetch_workers') or 4)
+            self.vouchers_fetch_retries = int(kwargs.get('vouchers_fetch_retries') or 3)
+            self.vouchers_batch_size = int(kwargs.get('vouchers_batch_size') or 20)
+            # получать путёвки пачками санаториев и распределять санатории по мере получения их путёвок
+            # (полный список путёвок в памяти не хранится, кэш списков путёвок не используется)
+            self.vouchers_stream = bool(kwargs.get('vouchers_stream', False))
+            # локальный кэш списков путёвок (VouchersCache)
+            self.vouchers_cache = kwargs.get('vouchers_cache')
+            self.prefetch_count = int(kwargs.get('prefetch_count') or 1)
+            # кол-во потоков распределения и максимальное кол-во сообщений в обработке
+            self.compute_workers = int(kwargs.get('compute_workers') or 1)
+            self.max_pending = int(kwargs.get('max_pending') or self.compute_workers * 2)
+            # кол-во попыток обработки сообщения, после которого сообщение отклоняется с текстом ошибки
+            self.max_attempts = int(kwargs.get('max_attempts') or 2)
+            self.connection = None
+            self._executor = None
+            self._consumer_tag = None
+            self._pending = 0
+            self._stopped = False
+            # окно (в секундах), в течение которого накапливаются ревизии настроек одной кампании
+            self.coalesce_window = float(kwargs.get('coalesce_window') or 0)
+            self._campaigns = {}
+            # последние ревизии кампаний без ожидающих и выполняющихся сообщений, чтобы более старые ревизии,
+            # полученные позже, тоже заменялись (не больше max_campaigns, первыми удаляются давно не активные)
+            self._revisions = OrderedDict()
+            self.max_campaigns = int(kwargs.get('max_campaigns') or 10000)
+            self._arrivals = 0
+            # время получения сообщений, ожидающих подтверждения (для метрик)
+            self._received = {}
 
             assert self.ampq_url, 'Необходимо указать адрес подключения к серверу RabbitMQ.'
             assert self.request_queue, ('Необходимо указать имя очереди, '
@@ -88,365 +800,1241 @@ class Distribution(object):
             assert self.vouchers_status_code, 'Необходимо указать код статуса путёвок для фильтрации списка путёвок.'
             assert self.vouchers_page_limit, 'Необходимо указать кол-во элементов на 1 странице в списке путёвок.'
         else:
-            self._df = pd.DataFrame(self.vouchers)
+            self._df = self.get_vouchers_df(self.vouchers)
 
     @property
-    def settings(self) -> List[Settings]:
+    def settings(self) -> List[SanatoriumSettings]:
         return self._settings
 
     @settings.setter
-    def settings(self, value: List[Settings]):
-        self._settings = value
+    def settings(self, value: List[Union[SanatoriumSettings, Settings, dict]]):
+        # настройки проверяются и индексируются по санаториям один раз при установке
+        self._settings = [SanatoriumSettings.adapt(settings) for settings in value]
+        self._settings_index = {}
+        for settings in self._settings:
+            self._settings_index.setdefault(settings.sanatorium_id, settings)
 
     @property
     def dataframe(self):
         vouchers = self.get_distribute()
-        rows = []
-        for voucher in vouchers:
-            if voucher['status'] == VoucherStatus.TO_SANATORIUM:
-                status = 'В санаторий'
-            elif voucher['status'] == VoucherStatus.TO_RESERVE:
-                status = 'В резерв'
-            elif voucher['status'] == VoucherStatus.TO_MEDICAL_UNIT:
-                status = 'В МСЧ'
-            else:
-                status = 'Куда-то'
-            row = [
-                voucher['id'],
-                voucher['sanatorium_id'],
-                voucher['organization_id'],
-                voucher['number'],
-                voucher['date_begin'],
-                voucher['date_end'],
-                voucher['duration'],
-                voucher['arrival_number'],
-                status
-            ]
-            rows.append(row)
-
-        df = pd.DataFrame(
-            columns=[
-                'ID',
-                'Санаторий ID',
-                'Организация',
-                'Номер путёвки',
-                'Дата заезда',
-                'Дата выезда',
-                'Длительность',
-                'Заезд №',
-                'Статус',
-            ],
-            data=rows
+        return self.get_vouchers_table(
+            vouchers.source,
+            vouchers.positions,
+            vouchers.organization_ids,
+            VoucherStatus.get_labels(vouchers.statuses)
         )
-        df.index += 1
-        return df
 
     @property
     def df_exists(self):
-        rows = []
-        for idx, item in self._vouchers_exists.iterrows():
-            row = [
-                item['id'],
-                item['sanatorium_id'],
-                item['organization_id'],
-                item['number'],
-                item['date_begin'],
-                item['date_end'],
-                item['duration'],
-                item['arrival_number'],
-                ''
-            ]
-            rows.append(row)
-        df = pd.DataFrame(
-            columns=[
-                'ID',
-                'Санаторий ID',
-                'Организация',
-                'Номер путёвки',
-                'Дата заезда',
-                'Дата выезда',
-                'Длительность',
-                'Заезд №',
-                'Статус',
-            ],
-            data=rows
-        )
+        return self.get_vouchers_table(self._vouchers_source, self._vouchers_exists)
+
+    @staticmethod
+    def get_vouchers_table(
+            source: pd.DataFrame,
+            positions: np.ndarray,
+            organization_ids: Optional[np.ndarray] = None,
+            statuses: Optional[np.ndarray] = None
+    ) -> pd.DataFrame:
+        """
+        Функция формирует таблицу путёвок для отображения.
+
+        :param source: Исходный список путёвок (поля, которых в нём нет, остаются пустыми).
+        :param positions: Позиции путёвок в исходном списке путёвок.
+        :param organization_ids: Организации путёвок (по умолчанию — из исходного списка).
+        :param statuses: Названия статусов путёвок (по умолчанию — пустые).
+        """
+        def column(name: str) -> np.ndarray:
+            if name not in source.columns:
+                return np.full(len(positions), None, dtype=object)
+            return source[name].to_numpy()[positions]
+
+        df = pd.DataFrame({
+            'ID': column('id'),
+            'Санаторий ID': column('sanatorium_id'),
+            'Организация': column('organization_id') if organization_ids is None else organization_ids,
+            'Номер путёвки': column('number'),
+            'Дата заезда': column('date_begin'),
+            'Дата выезда': column('date_end'),
+            'Длительность': column('duration'),
+            'Заезд №': column('arrival_number'),
+            'Статус': np.full(len(positions), '', dtype=object) if statuses is None else statuses,
+        })
         df.index += 1
         return df
 
-    def get_control_df(self, direction: str):
-        rows = []
-        for sanatorium_idx, dump_vouchers_per_months in enumerate(self.dump_vouchers_per_months[direction]):
-            for month, month_stat in dump_vouchers_per_months.items():
-                month_str = datetime.datetime.strptime(month, '%Y-%m').strftime('%B')
-                rows.append([
-                    month_str,
-                    '%d%%' % month_stat[1],
-                    '',
-                    '',
-                    '',
-                    '',
-                    '',
-                    '',
-                    '',
-                    '',
-                    '',
-                    '',
-
-                ])
-                totals_percents = 0
-                totals_5 = 0
-                totals_6 = 0
-                totals_7 = 0
-                totals_8 = 0
-                for date, day_stat in self.dump_vouchers_per_days[direction][sanatorium_idx].items():
-                    if date[:7] == month:
-                        total_vouchers_in_day_correct = day_stat[5] if len(day_stat) == 6 else day_stat[4]
-                        rows.append([
-                            date,
-                            day_stat[0],
-                            '',
-                            '',
-                            day_stat[1],
-                            day_stat[2],
-                            day_stat[3],
-                            day_stat[3],
-                            day_stat[4],
-                            day_stat[4],
-                            total_vouchers_in_day_correct,
-                            total_vouchers_in_day_correct - day_stat[0],
-                        ])
-                        totals_percents += day_stat[1]
-                        totals_5 += day_stat[2]
-                        totals_6 += day_stat[3]
-                        totals_7 += day_stat[4]
-                        totals_8 += total_vouchers_in_day_correct
-                rows.append([
-                    'ИТОГО %s' % month_str,
-                    month_stat[0],
-                    month_stat[2],
-                    month_stat[3],
-                    totals_percents,
-                    totals_5,
-                    totals_6,
-                    totals_6,
-                    totals_7,
-                    totals_7,
-                    totals_8,
-                    '',
-                ])
-
-        df = pd.DataFrame(
-            columns=[
-                'День заезда',
-                '% мес/кол-во путёвок в заезде',
-                'кол-во путевок к распред помесячно',
-                'Округлить гр 3',
-                '% пут. по заездам',
-                'кол-во пут. По заездам',
-                'отбросили десятки',
-                'округлили',
-                'получили четное',
-                'Итого',
-                'Итого с корректировкой',
-                'Если > 1 то ОШИБКА',
-            ],
-            data=rows
+    def get_control_df(self, direction: str) -> pd.DataFrame:
+        """
+        Функция формирует контрольную таблицу распределения по направлению.
+
+        В режиме отладки таблица строится по сохранённым данным распределения, иначе данные
+        по месяцам и дням санаториев, распределённых по направлению, берутся из get_control_results.
+
+        :param direction: Направление распределения.
+        """
+        if self.debug:
+            return self.build_control_df(
+                self.dump_vouchers_per_months.get(direction, []),
+                self.dump_vouchers_per_days.get(direction, [])
+            )
+
+        results = self.get_control_results([
+            sanatorium_id
+            for sanatorium_id, settings in self._distributed_settings.items()
+            if direction in settings.directions
+        ])
+        return self.build_control_df(
+            [result.vouchers_per_months[direction] for result in results.values()],
+            [result.vouchers_per_days[direction] for result in results.values()]
         )
-        return df
+
+    def get_sanatorium_control_df(self, sanatorium_id: Hashable, direction: str) -> pd.DataFrame:
+        """
+        Функция формирует контрольную таблицу распределения одного санатория по направлению.
+
+        :param sanatorium_id: ID санатория.
+        :param direction: Направление распределения.
+        """
+        vouchers_per_months, vouchers_per_days = self.get_control_data(sanatorium_id, direction)
+        return self.build_control_df([vouchers_per_months], [vouchers_per_days])
+
+    def get_control_data(self, sanatorium_id: Hashable, direction: str) -> Tuple[dict, dict]:
+        """
+        Функция возвращает данные распределения санатория по месяцам и дням для направления.
+
+        :param sanatorium_id: ID санатория.
+        :param direction: Направление распределения.
+        :return: Данные распределения по месяцам и по дням
+                 (пустые, если санаторий не распределялся по направлению).
+        """
+        result = self.get_control_results([sanatorium_id]).get(sanatorium_id)
+        if result is None:
+            return {}, {}
+        return result.vouchers_per_months.get(direction, {}), result.vouchers_per_days.get(direction, {})
+
+    def get_control_results(self, sanatorium_ids: List[Hashable]) -> Dict[Hashable, SanatoriumDistribution]:
+        """
+        Функция возвращает результаты распределения санаториев с данными по месяцам и дням.
+
+        При первом запросе санаторий распределяется повторно с теми же путёвками и настройками,
+        что и при последнем распределении, и результат хранится, пока санаторий не будет
+        распределён заново с другими путёвками или настройками.
+
+        :param sanatorium_ids: ID санаториев.
+        :return: Результаты распределённых санаториев в порядке sanatorium_ids.
+        """
+        missed = [
+            sanatorium_id for sanatorium_id in sanatorium_ids
+            if sanatorium_id not in self._control_results and sanatorium_id in self._distributed_settings
+        ]
+        if missed:
+            # путёвки разбиваются по санаториям один раз для всех пересчитываемых санаториев
+            source = self._vouchers_source
+            vouchers_index = self.get_vouchers_index(source[source['sanatorium_id'].isin(missed)])
+            for sanatorium_id in missed:
+                if sanatorium_id in vouchers_index:
+                    self._control_results[sanatorium_id] = self.distribute_sanatorium(
+                        vouchers_index[sanatorium_id],
+                        self._distributed_settings[sanatorium_id],
+                        debug=True
+                    )
+        return {
+            sanatorium_id: self._control_results[sanatorium_id]
+            for sanatorium_id in sanatorium_ids if sanatorium_id in self._control_results
+        }
+
+    @staticmethod
+    def build_control_df(vouchers_per_months: List[dict], vouchers_per_days: List[dict]) -> pd.DataFrame:
+        """
+        Функция формирует контрольную таблицу по данным распределения санаториев.
+
+        Для каждого санатория и месяца выводится строка месяца, строки заездных дней месяца
+        и строка итогов месяца. Итоги считаются группировкой подневных данных по месяцам.
+
+        :param vouchers_per_months: Данные распределения по месяцам каждого санатория.
+        :param vouchers_per_days: Данные распределения по дням каждого санатория.
+        """
+        columns = [
+            'День заезда',
+            '% мес/кол-во путёвок в заезде',
+            'кол-во путевок к распред помесячно',
+            'Округлить гр 3',
+            '% пут. по заездам',
+            'кол-во пут. По заездам',
+            'отбросили десятки',
+            'округлили',
+            'получили четное',
+            'Итого',
+            'Итого с корректировкой',
+            'Если > 1 то ОШИБКА',
+        ]
+        # данные распределения по месяцам и дням всех санаториев в виде колонок
+        month_counts = [len(stats) for stats in vouchers_per_months]
+        day_counts = [len(stats) for stats in vouchers_per_days]
+        if not sum(month_counts):
+            return pd.DataFrame(columns=columns)
+
+        month_stats = np.concatenate([
+            np.array([month_stat[:4] for month_stat in stats.values()], dtype=np.float64).reshape(-1, 4)
+            for stats in vouchers_per_months
+        ])
+        months = pd.DataFrame({
+            'sanatorium_idx': np.repeat(np.arange(len(month_counts)), month_counts),
+            'month': [month for stats in vouchers_per_months for month in stats],
+            'total': month_stats[:, 0].astype(np.int64),
+            'percent': month_stats[:, 1].astype(np.int64),
+            'quota': month_stats[:, 2],
+            'quota_round': month_stats[:, 3].astype(np.int64),
+        })
+
+        day_stats = np.concatenate([Distribution.get_day_stats(stats) for stats in vouchers_per_days])
+        day_labels = np.array([date for stats in vouchers_per_days for date in stats], dtype=str)
+        days = pd.DataFrame({
+            'sanatorium_idx': np.repeat(np.arange(len(day_counts)), day_counts),
+            'month': day_labels.astype('U7'),
+            'date': day_labels,
+            'total': day_stats[:, 0].astype(np.int64),
+            'percent': day_stats[:, 1],
+            'quota': day_stats[:, 2],
+            'quota_int': day_stats[:, 3].astype(np.int64),
+            'quota_even': day_stats[:, 4].astype(np.int64),
+            'quota_correct': day_stats[:, 5].astype(np.int64),
+        })
+
+        # порядковый номер месяца в таблице
+        months['position'] = np.arange(len(months.index))
+        days = days.merge(months[['sanatorium_idx', 'month', 'position']], on=['sanatorium_idx', 'month'])
+        totals = days.groupby('position').sum(numeric_only=True).reindex(months['position'], fill_value=0)
+        month_names = pd.to_datetime(months['month'], format='%Y-%m').dt.strftime('%B')
+
+        def get_rows(part: int, positions: pd.Series, values: list) -> pd.DataFrame:
+            rows = pd.DataFrame(dict(zip(columns, values)), columns=columns)
+            rows['_position'] = positions.to_numpy()
+            rows['_part'] = part
+            return rows
+
+        df = pd.concat([
+            # строка месяца
+            get_rows(0, months['position'], [
+                month_names,
+                months['percent'].map(lambda percent: '%d%%' % percent),
+            ] + [''] * 10),
+            # строки заездных дней
+            get_rows(1, days['position'], [
+                days['date'],
+                days['total'],
+                '',
+                '',
+                days['percent'],
+                days['quota'],
+                days['quota_int'],
+                days['quota_int'],
+                days['quota_even'],
+                days['quota_even'],
+                days['quota_correct'],
+                days['quota_correct'] - days['total'],
+            ]),
+            # итоги месяца
+            get_rows(2, months['position'], [
+                'ИТОГО ' + month_names,
+                months['total'],
+                months['quota'],
+                months['quota_round'],
+                totals['percent'].to_numpy(),
+                totals['quota'].to_numpy(),
+                totals['quota_int'].to_numpy(),
+                totals['quota_int'].to_numpy(),
+                totals['quota_even'].to_numpy(),
+                totals['quota_even'].to_numpy(),
+                totals['quota_correct'].to_numpy(),
+                '',
+            ]),
+        ])
+        df = df.sort_values(['_position', '_part'], kind='mergesort')
+        return df[columns].reset_index(drop=True).astype(object)
+
+    @staticmethod
+    def get_day_stats(vouchers_per_days: Dict[str, List]) -> np.ndarray:
+        """
+        Данные распределения по заездным дням в виде массива (кол-во дней × 6).
+        Если скорректированное кол-во путёвок за заезд не посчитано, используется чётное кол-во.
+        """
+        try:
+            day_stats = np.array(list(vouchers_per_days.values()), dtype=np.float64)
+        except ValueError:
+            day_stats = None
+        if day_stats is None or day_stats.ndim != 2 or day_stats.shape[1] != 6:
+            day_stats = np.array(
+                [day_stat[:6] + day_stat[4:5] * (6 - len(day_stat)) for day_stat in vouchers_per_days.values()],
+                dtype=np.float64
+            ).reshape(-1, 6)
+        return day_stats
 
     @property
     def get_sanatoriums(self) -> pd.Series:
         return self._df['sanatorium_id'].value_counts()
 
-    def get_distribute(self) -> list:
+    def get_distribute(self, workers: Optional[int] = None) -> DistributedVouchers:
         """
         Функция формирует унифицированный список путёвок по распределению.
         Проходится алгоритм несколько раз по всем доступным санаториям и различным направлениям,
         чтобы сформировать общий поочерёдный список распределённых путёвок для всех санаториев.
+
+        Если заданы контрольные точки, результат каждого санатория дописывается в контрольную точку,
+        и прерванное распределение продолжается с последнего распределённого санатория.
+
+        :param workers: Кол-во процессов для распределения санаториев (по умолчанию — из настроек).
+        """
+        workers = workers or self.workers
+        vouchers_index = self.get_vouchers_index()
+
+        sanatoriums = []
+        for sanatorium_id, _ in self.get_sanatoriums.items():
+            # получим настройки распределения
+            settings = self.get_sanatorium_setting(sanatorium_id)
+            if settings is not None:
+                sanatoriums.append((vouchers_index[sanatorium_id], settings))
+
+        # пересчитываем только санатории, у которых изменились путёвки или настройки
+        keys = [self.get_result_key(vouchers, settings) for vouchers, settings in sanatoriums]
+        results = [self.results_cache.get(key) if key is not None else None for key in keys]
+        missed = [position for position, result in enumerate(results) if result is None]
+        metrics.registry.inc('distribution_sanatoriums_total', len(sanatoriums) - len(missed), cache='hit')
+
+        checkpoint = self.open_checkpoint(sanatoriums) if missed else None
+        try:
+            if checkpoint is not None:
+                missed = self.restore_checkpoint(checkpoint, sanatoriums, results, keys, missed)
+            save = functools.partial(self.save_checkpoint, checkpoint)
+
+            if workers > 1 and len(missed) > 1:
+                missed_results = self._distribute_parallel(
+                    [sanatoriums[position] for position in missed],
+                    workers,
+                    on_result=save
+                )
+            else:
+                missed_results = []
+                for position in missed:
+                    self.check_cancelled()
+                    missed_results.append(self.distribute_sanatorium(*sanatoriums[position]))
+                    save(missed_results[-1])
+
+            for position, result in zip(missed, missed_results):
+                self.observe_result(result)
+                results[position] = result
+                if keys[position] is not None:
+                    self.results_cache.put(keys[position], result)
+            if checkpoint is not None:
+                checkpoint.remove()
+        finally:
+            # контрольная точка прерванного распределения сохраняется до повторного получения сообщения
+            if checkpoint is not None:
+                checkpoint.close()
+
+        return self._collect_results(self._df, results, vouchers_index)
+
+    def open_checkpoint(
+            self,
+            sanatoriums: List[Tuple[SanatoriumVouchers, SanatoriumSettings]]
+    ) -> Optional[Checkpoint]:
+        """
+        Функция открывает контрольную точку распределения санаториев или возвращает None,
+        если контрольные точки не используются.
+
+        Ключ контрольной точки — отпечатки путёвок и настроек санаториев, поэтому распределение
+        продолжается только при повторном получении того же сообщения с тем же списком путёвок.
+        В режиме отладки контрольная точка не используется: в ней нет отладочных данных санаториев.
+        Контрольная точка не используется и в том случае, если поля путёвок не удалось хэшировать
+        или если контрольная точка с тем же ключом уже открыта другим распределением (compute_workers > 1).
+
+        :param sanatoriums: Путёвки и настройки распределения санаториев.
+        """
+        if self.checkpoints is None or self.debug or not sanatoriums:
+            return None
+        fingerprints = [[settings.fingerprint, vouchers.fingerprint] for vouchers, settings in sanatoriums]
+        if any(fingerprint is None for _, fingerprint in fingerprints):
+            return None
+        return self.checkpoints.open(self.checkpoints.get_key([self.vectorized, fingerprints]))
+
+    def restore_checkpoint(
+            self,
+            checkpoint: Checkpoint,
+            sanatoriums: List[Tuple[SanatoriumVouchers, SanatoriumSettings]],
+            results: List[Optional[SanatoriumDistribution]],
+            keys: List[Optional[tuple]],
+            missed: List[int]
+    ) -> List[int]:
+        """
+        Функция восстанавливает результаты санаториев, распределённых до прерывания,
+        и дописывает в контрольную точку результаты, найденные в кэше результатов.
+
+        :param checkpoint: Контрольная точка распределения.
+        :param sanatoriums: Путёвки и настройки распределения санаториев.
+        :param results: Результаты распределения санаториев (заполняются восстановленными результатами).
+        :param keys: Ключи кэша результатов.
+        :param missed: Позиции санаториев, которых нет в кэше результатов.
+        :return: Позиции санаториев, которые нужно распределить.
+        """
+        for result in results:
+            if result is not None and result.sanatorium_id not in checkpoint.results:
+                self.save_checkpoint(checkpoint, result)
+
+        remaining = []
+        for position in missed:
+            sanatorium_id = sanatoriums[position][1].sanatorium_id
+            arrays = checkpoint.results.get(sanatorium_id)
+            if arrays is None:
+                remaining.append(position)
+                continue
+            results[position] = SanatoriumDistribution.from_arrays(sanatorium_id, *arrays)
+            if keys[position] is not None:
+                self.results_cache.put(keys[position], results[position])
+        metrics.registry.inc('distribution_sanatoriums_total', len(missed) - len(remaining), cache='checkpoint')
+        if len(remaining) < len(missed):
+            print(' [x] Resumed %d sanatoriums from checkpoint' % (len(missed) - len(remaining)))
+        return remaining
+
+    @staticmethod
+    def save_checkpoint(checkpoint: Optional[Checkpoint], result: SanatoriumDistribution) -> NoReturn:
+        """Дописывает результат распределения санатория в контрольную точку"""
+        if checkpoint is not None:
+            checkpoint.append(result.sanatorium_id, result.indexes, result.statuses, result.organizations)
+
+    def get_distribute_stream(self, batch_size: Optional[int] = None) -> DistributedVouchers:
+        """
+        Функция формирует унифицированный список путёвок по распределению, получая путёвки
+        из API пачками санаториев.
+
+        Санаторий распределяется, как только получены все его путёвки, а в это время
+        в фоне запрашиваются путёвки следующей пачки санаториев. Все поля путёвок хранятся
+        только для текущей пачки, а от полученных санаториев — ID путёвок и санаториев
+        (STREAM_COLUMNS, для ответа и остаточного списка), результат распределения
+        и индексы оставшихся путёвок.
+
+        :param batch_size: Кол-во санаториев в одном запросе к API.
         """
+        results = []
+        exists = {}
+        frames = []
+        for sanatorium_id, df in self.iter_sanatorium_vouchers(batch_size):
+            self.check_cancelled()
+            # до конца распределения хранятся только поля, нужные для ответа и остаточного списка
+            frames.append(df[list(STREAM_COLUMNS)])
+            settings = self.get_sanatorium_setting(sanatorium_id)
+            if settings is None:
+                # санаторий без настроек не распределяется, все его путёвки остаются
+                exists[sanatorium_id] = df.index.to_numpy()
+                continue
+            sanatorium_vouchers = self.get_vouchers_index(df)[sanatorium_id]
+
+            key = self.get_result_key(sanatorium_vouchers, settings)
+            result = self.results_cache.get(key) if key is not None else None
+            if result is None:
+                result = self.distribute_sanatorium(sanatorium_vouchers, settings)
+                self.observe_result(result)
+                if key is not None:
+                    self.results_cache.put(key, result)
+            else:
+                metrics.registry.inc('distribution_sanatoriums_total', cache='hit')
+            results.append(result)
+            sanatorium_vouchers.remove(pd.Index(result.indexes))
+            exists[sanatorium_id] = sanatorium_vouchers.df.index.to_numpy()
+        # исходный список путёвок — сохранённые поля путёвок всех полученных санаториев,
+        # остальные поля в таблицах путёвок (dataframe, df_exists) пустые
+        source = pd.concat(frames) if frames else self.get_vouchers_df(self.vouchers)
+        frames.clear()
+        return self._collect_results(source, results, {}, exists)
+
+    def get_distribute_delta(
+            self,
+            vouchers: Union[list, pd.DataFrame, VouchersColumns, None] = None,
+            removed_ids: Optional[List[Hashable]] = None,
+            keep_allocations: bool = True
+    ) -> DistributedVouchers:
+        """
+        Функция обновляет распределение после изменения списка путёвок.
+
+        Новые и изменённые путёвки передаются явно или запрашиваются из API по отметке времени
+        последнего получения списка путёвок (см. get_vouchers_delta).
+        Распределяются заново только санатории, затронутые изменениями, остальные санатории
+        сохраняют результат предыдущего распределения (get_distribute или get_distribute_delta).
+
+        :param vouchers: Новые и изменённые путёвки (по умолчанию — запрашиваются из API).
+        :param removed_ids: ID путёвок, которые больше не участвуют в распределении.
+        :param keep_allocations: Сохранить уже распределённые путёвки санаториев (см. distribute_sanatorium_delta),
+                                 иначе затронутые санатории распределяются заново целиком — результат
+                                 совпадает с get_distribute по обновлённому списку путёвок.
+        """
+        if vouchers is None:
+            affected = self.get_vouchers_delta(removed_ids)
+        else:
+            affected = self.apply_vouchers_delta(vouchers, removed_ids)
+
+        sanatoriums = []
+        for sanatorium_id, _ in self.get_sanatoriums.items():
+            settings = self.get_sanatorium_setting(sanatorium_id)
+            if settings is None:
+                continue
+            previous = self._distributed_results.get(sanatorium_id)
+            if previous is not None and self._distributed_settings.get(sanatorium_id) != settings:
+                # при изменении настроек санаторий распределяется заново целиком
+                previous = None
+            sanatoriums.append((sanatorium_id, settings, previous))
+
+        # путёвки разбиваются только по санаториям, которые распределяются заново
+        # (и санаториям, у которых больше нет настроек), у остальных сохраняются остаточные путёвки
+        updated = set(affected)
+        updated.update(sanatorium_id for sanatorium_id, _, previous in sanatoriums if previous is None)
+        updated.update(
+            sanatorium_id for sanatorium_id in self._distributed_results
+            if self.get_sanatorium_setting(sanatorium_id) is None
+        )
+        vouchers_index = self.get_vouchers_index(self._df[self._df['sanatorium_id'].isin(list(updated))])
+        exists = {
+            sanatorium_id: indexes for sanatorium_id, indexes in self._sanatorium_exists.items()
+            if sanatorium_id not in updated
+        }
 
+        results = []
+        for sanatorium_id, settings, previous in sanatoriums:
+            if sanatorium_id not in updated:
+                results.append(previous)
+                continue
+
+            self.check_cancelled()
+            if previous is not None and keep_allocations:
+                result = self.distribute_sanatorium_delta(
+                    vouchers_index[sanatorium_id],
+                    settings,
+                    previous,
+                    affected[sanatorium_id]
+                )
+            else:
+                result = self.distribute_sanatorium(vouchers_index[sanatorium_id], settings)
+            self.observe_result(result)
+            results.append(result)
+
+        return self._collect_results(self._df, results, vouchers_index, exists)
+
+    def apply_vouchers_delta(
+            self,
+            vouchers: Union[list, pd.DataFrame, VouchersColumns],
+            removed_ids: Optional[List[Hashable]] = None
+    ) -> Dict[Hashable, List[str]]:
+        """
+        Функция применяет изменения к списку путёвок последнего распределения.
+
+        Изменённая путёвка заменяется новой строкой списка путёвок, путёвки без изменений
+        не учитываются. Индексы остальных путёвок не меняются, поэтому результаты
+        предыдущего распределения остаются действительными.
+
+        :param vouchers: Новые и изменённые путёвки.
+        :param removed_ids: ID путёвок, которые больше не участвуют в распределении.
+        :return: Затронутые изменениями месяцы заездов (ГГГГ-ММ) по санаториям.
+        """
+        assert self._distributed_results, 'Изменения списка путёвок применяются после распределения.'
+        source = self._vouchers_source
+        delta = self.get_vouchers_df(vouchers)
+        delta = delta.drop_duplicates('id', keep='last').reindex(columns=source.columns)
+
+        # изменённые путёвки — уже известные путёвки, у которых отличается хотя бы одно поле
+        positions = pd.Index(source['id']).get_indexer(delta['id'])
+        is_known = positions >= 0
+        is_changed = ~is_known
+        if is_known.any():
+            old = source.iloc[positions[is_known]]
+            new = delta[is_known]
+            is_equal = np.ones(len(new.index), dtype=bool)
+            for column in source.columns:
+                old_values = old[column].to_numpy(dtype=object)
+                new_values = new[column].to_numpy(dtype=object)
+                # пропуски разных типов (None, NaN, NaT, NA) считаются равными
+                old_values[pd.isna(old_values)] = None
+                new_values[pd.isna(new_values)] = None
+                is_equal &= old_values == new_values
+            is_changed[is_known] = ~is_equal
+        delta = delta[is_changed]
+
+        is_removed = source['id'].isin(delta['id']) | source['id'].isin(list(removed_ids or []))
+        affected = {}
+        for df in (source[is_removed], delta):
+            months = pd.to_datetime(df['date_begin']).to_numpy().astype('datetime64[M]')
+            for sanatorium_id, month in zip(df['sanatorium_id'].tolist(), np.datetime_as_string(months).tolist()):
+                affected.setdefault(sanatorium_id, set()).add(month)
+
+        # новые строки получают индексы после последнего индекса списка путёвок
+        start = int(source.index.max()) + 1 if len(source.index) else 0
+        delta.index = pd.RangeIndex(start, start + len(delta.index))
+        self._df = apply_vouchers_schema(
+            pd.concat([source[~is_removed], delta]) if len(delta.index) else source[~is_removed],
+            self.drop_unused_columns
+        )
+        self._vouchers_source = self._df
+        return {sanatorium_id: sorted(months) for sanatorium_id, months in affected.items()}
+
+    def distribute_sanatorium_delta(
+            self,
+            sanatorium_vouchers: SanatoriumVouchers,
+            settings: SanatoriumSettings,
+            previous: SanatoriumDistribution,
+            months: List[str]
+    ) -> SanatoriumDistribution:
+        """
+        Функция распределяет путёвки санатория после изменения списка путёвок,
+        сохраняя уже распределённые путёвки.
+
+        Распределённые ранее путёвки, которые остались в списке без изменений, сохраняют статус
+        и организацию. Для каждого направления распределяется только недостающее до настроек
+        кол-во путёвок — из оставшихся путёвок затронутых месяцев, по тем же правилам расчёта
+        по месяцам и заездным дням, что и в distribute_sanatorium. Месяцы без изменений не пересчитываются.
+        Недостающие путёвки добавляются, пока не будет распределено кол-во путёвок по настройкам
+        или пока не закончатся оставшиеся путёвки затронутых месяцев.
+
+        :param sanatorium_vouchers: Путёвки санатория.
+        :param settings: Настройки распределения санатория.
+        :param previous: Результат предыдущего распределения санатория.
+        :param months: Затронутые изменениями месяцы заездов (ГГГГ-ММ).
+        """
+        is_kept = np.isin(previous.indexes, sanatorium_vouchers.df.index.to_numpy())
+        result = SanatoriumDistribution.from_arrays(
+            settings.sanatorium_id,
+            previous.indexes[is_kept],
+            previous.statuses[is_kept],
+            previous.organizations[is_kept]
+        )
+        sanatorium_vouchers.remove(pd.Index(result.indexes))
+
+        # оставшиеся путёвки затронутых месяцев
+        day_codes = sanatorium_vouchers.days[sanatorium_vouchers.day_idx]
+        in_months = np.isin(day_codes.astype('datetime64[M]'), np.array(months, dtype='datetime64[M]'))
+        month_vouchers = SanatoriumVouchers(sanatorium_vouchers.df[in_months], day_codes[in_months])
+
+        with metrics.registry.timer('distribution_sanatorium_seconds', result.timings):
+            for direction_plan in settings.plan:
+                shortage = direction_plan.quota - int(np.count_nonzero(
+                    (result.statuses == direction_plan.status) &
+                    (result.organizations == direction_plan.organization_id)
+                ))
+                while shortage > 0 and len(month_vouchers):
+                    calendar = month_vouchers.calendar
+                    vouchers_per_months = self.get_vouchers_per_months(calendar, len(month_vouchers), shortage)
+                    vouchers_per_days = self.get_vouchers_per_days(calendar, vouchers_per_months, result.timings)
+                    if self.debug:
+                        result.vouchers_per_months.setdefault(direction_plan.direction, vouchers_per_months)
+                        result.vouchers_per_days.setdefault(direction_plan.direction, vouchers_per_days)
+                    distributed_vouchers = self.get_sanatorium_vouchers(
+                        month_vouchers,
+                        vouchers_per_days,
+                        direction_plan.direction
+                    )
+                    if not len(distributed_vouchers):
+                        break
+                    month_vouchers.remove(distributed_vouchers)
+                    result.append(distributed_vouchers, direction_plan.status, direction_plan.organization_id)
+                    shortage -= len(distributed_vouchers)
+        return result
+
+    def get_distribute_scenarios(
+            self,
+            scenarios: List[List[Union[SanatoriumSettings, Settings, dict]]]
+    ) -> List[ScenarioResult]:
+        """
+        Функция распределяет один список путёвок по нескольким сценариям настроек.
+
+        Путёвки разбиваются по санаториям один раз для всех сценариев, а кол-во путёвок
+        по месяцам и заездным дням считается сразу для всех сценариев санатория (см.
+        distribute_sanatorium_scenarios). Результат каждого сценария совпадает с результатом
+        get_distribute с настройками сценария.
+
+        :param scenarios: Настройки распределения санаториев каждого сценария.
+        :return: Результаты сценариев в том же порядке.
+        """
+        vouchers_index = self.get_vouchers_index()
+        # настройки санаториев каждого сценария (как и в get_sanatorium_setting, берутся первые настройки санатория)
+        scenarios = [[SanatoriumSettings.adapt(settings) for settings in scenario] for scenario in scenarios]
+        scenarios_settings = []
+        for scenario in scenarios:
+            scenario_settings = {}
+            for settings in scenario:
+                scenario_settings.setdefault(settings.sanatorium_id, settings)
+            scenarios_settings.append(scenario_settings)
+
+        results = [[] for _ in scenarios]
+        for sanatorium_id, _ in self.get_sanatoriums.items():
+            positions = [
+                position for position, scenario_settings in enumerate(scenarios_settings)
+                if sanatorium_id in scenario_settings
+            ]
+            if not positions:
+                continue
+            self.check_cancelled()
+            sanatorium_results = self.distribute_sanatorium_scenarios(
+                vouchers_index[sanatorium_id],
+                [scenarios_settings[position][sanatorium_id] for position in positions]
+            )
+            for position, result in zip(positions, sanatorium_results):
+                results[position].append(result)
+
+        return [
+            ScenarioResult(scenario, scenario_results, DistributedVouchers.from_results(self._df, scenario_results))
+            for scenario, scenario_results in zip(scenarios, results)
+        ]
+
+    @staticmethod
+    def observe_result(result: SanatoriumDistribution) -> NoReturn:
+        """Добавляет замеры распределения санатория в метрики и структурированный лог"""
+        if not metrics.registry.enabled:
+            return
+        metrics.registry.inc('distribution_sanatoriums_total', cache='miss')
+        metrics.registry.observe_samples(result.timings)
+        stages = {}
+        seconds = None
+        for name, labels, value in result.timings:
+            if name == 'distribution_stage_seconds':
+                stages.setdefault(labels['direction'], {})[labels['stage']] = round(value, 6)
+            elif name == 'distribution_sanatorium_seconds':
+                seconds = round(value, 6)
+        metrics.registry.log(
+            'sanatorium_distributed',
+            sanatorium_id=result.sanatorium_id,
+            vouchers=len(result.indexes),
+            seconds=seconds,
+            stages=stages,
+        )
+        # замеры уже учтены, в кэш результатов они не попадают
+        result.timings = []
+
+    def get_result_key(
+            self,
+            sanatorium_vouchers: SanatoriumVouchers,
+            settings: SanatoriumSettings
+    ) -> Optional[tuple]:
+        """
+        Функция возвращает ключ кэша результатов распределения санатория
+        или None, если кэш результатов отключён.
+
+        :param sanatorium_vouchers: Путёвки санатория.
+        :param settings: Настройки распределения санатория.
+        """
+        if self.results_cache.max_size <= 0:
+            return None
+        fingerprint = sanatorium_vouchers.fingerprint
+        if fingerprint is None:
+            return None
+        return settings.fingerprint, fingerprint, self.vectorized, self.debug
+
+    def _collect_results(
+            self,
+            source: pd.DataFrame,
+            results: List[SanatoriumDistribution],
+            vouchers_index: Dict[Hashable, SanatoriumVouchers],
+            exists: Optional[Dict[Hashable, np.ndarray]] = None
+    ) -> DistributedVouchers:
+        """
+        Функция собирает результаты распределения санаториев в общий список путёвок,
+        отладочные данные (в режиме отладки) и остаточный список путёвок.
+
+        :param source: Исходный список путёвок.
+        :param results: Результаты распределения санаториев.
+        :param vouchers_index: Путёвки санаториев.
+        :param exists: Индексы оставшихся путёвок санаториев, которых нет в vouchers_index
+                       (санатории без изменений при распределении изменений списка путёвок).
+        """
         # Для контрольной таблицы будем добавлять отладочную информацию
         self.dump_vouchers_per_months = {
             'to_sanatorium': [],
             'to_reserve': []
-        }
+        } if self.debug else {}
         self.dump_vouchers_per_days = {
             'to_sanatorium': [],
             'to_reserve': []
+        } if self.debug else {}
+        # настройки запоминаются, чтобы пересчитать данные контрольной таблицы по запросу,
+        # а результаты — чтобы перераспределять только санатории, затронутые изменениями списка путёвок
+        previous = self._distributed_results
+        self._distributed_settings = {}
+        self._distributed_results = {}
+
+        for sanatorium_result in results:
+            if sanatorium_result.sanatorium_id in vouchers_index:
+                vouchers_index[sanatorium_result.sanatorium_id].remove(pd.Index(sanatorium_result.indexes))
+            self._distributed_settings[sanatorium_result.sanatorium_id] = self.get_sanatorium_setting(
+                sanatorium_result.sanatorium_id
+            )
+            self._distributed_results[sanatorium_result.sanatorium_id] = sanatorium_result
+            if not self.debug:
+                continue
+            for direction, vouchers_per_months in sanatorium_result.vouchers_per_months.items():
+                self.dump_vouchers_per_months.setdefault(direction, []).append(vouchers_per_months)
+                self.dump_vouchers_per_days.setdefault(direction, []).append(
+                    sanatorium_result.vouchers_per_days[direction]
+                )
+        self.to_sanatorium_vouchers = DistributedVouchers.from_results(source, results)
+        # данные контрольной таблицы остаются актуальными для санаториев, результат которых взят из кэша
+        # (те же путёвки и настройки, что и при предыдущем распределении)
+        self._control_results = {
+            sanatorium_id: result for sanatorium_id, result in self._control_results.items()
+            if sanatorium_id in self._distributed_results
+            and self._distributed_results[sanatorium_id] is previous.get(sanatorium_id)
         }
 
-        self.to_sanatorium_vouchers = []
-        for sanatorium_id, _ in self.get_sanatoriums.items():
-            # получим настройки распределения
-            settings = self.get_sanatorium_setting(sanatorium_id)
+        # остаточный список путёвок по всем санаториям
+        self._vouchers_source = source
+        self._sanatorium_exists = dict(exists or {})
+        for sanatorium_id, vouchers in vouchers_index.items():
+            self._sanatorium_exists[sanatorium_id] = vouchers.df.index.to_numpy()
+        self._vouchers_exists = source.index.get_indexer(
+            np.concatenate(list(self._sanatorium_exists.values()))
+            if self._sanatorium_exists else np.empty(0, dtype=np.int64)
+        )
+        return self.to_sanatorium_vouchers
 
-            # объявляем базовые направления распределения
-            directions = ['to_sanatorium', 'to_reserve']
+    def distribute_sanatorium(
+            self,
+            sanatorium_vouchers: SanatoriumVouchers,
+            settings: SanatoriumSettings,
+            debug: Optional[bool] = None
+    ) -> SanatoriumDistribution:
+        """
+        Функция распределяет путёвки одного санатория по всем направлениям.
 
-            # дополним направления и отладочный словарь медсанчастями, если они указаны
-            if settings.to_medical_units:
-                for medical_unit_id in settings.to_medical_units.keys():
-                    directions.append('to_medical_unit_%d' % medical_unit_id)
-                    self.dump_vouchers_per_months['to_medical_unit_%d' % medical_unit_id] = []
-                    self.dump_vouchers_per_days['to_medical_unit_%d' % medical_unit_id] = []
+        :param sanatorium_vouchers: Путёвки санатория.
+        :param settings: Настройки распределения санатория.
+        :param debug: Сохранять в результате данные распределения по месяцам и дням
+                      (по умолчанию — в режиме отладки).
+        """
+        result = SanatoriumDistribution(settings.sanatorium_id)
+        debug = self.debug if debug is None else debug
 
-            # начнём распределение по заданным направлениям
-            for direction in directions:
-                # выделим срез данных только по текущему санаторию
-                is_sanatorium = self._df['sanatorium_id'] == sanatorium_id
-                df_sanatorium = self._df[is_sanatorium].sort_values(by=['date_begin', 'number'])
-                total_vouchers = len(df_sanatorium.index)
+        # замеры этапов сохраняются в результате, т.к. санаторий может распределяться в дочернем процессе
+        timer = functools.partial(metrics.registry.timer, 'distribution_stage_seconds', result.timings)
 
-                # сгруппируем путёвки по дате заезда (заездным дням)
-                begin_dates_df = df_sanatorium.groupby('date_begin')
+        # начнём распределение по заданным направлениям
+        with metrics.registry.timer('distribution_sanatorium_seconds', result.timings):
+            for direction_plan in settings.plan:
+                direction = direction_plan.direction
+                total_vouchers = len(sanatorium_vouchers)
+                direction_kind = metrics.get_direction_kind(direction)
+
+                # кол-во путёвок по заездным дням и месяцам
+                with timer(stage='calendar', direction=direction_kind):
+                    calendar = sanatorium_vouchers.calendar
 
                 # получим данные для распределения по месяцам
-                vouchers_per_months = self.get_vouchers_per_months(
-                    begin_dates_df,
-                    total_vouchers,
-                    settings,
-                    direction
-                )
-                self.dump_vouchers_per_months[direction].append(vouchers_per_months)
+                with timer(stage='get_vouchers_per_months', direction=direction_kind):
+                    vouchers_per_months = self.get_vouchers_per_months(
+                        calendar,
+                        total_vouchers,
+                        direction_plan.quota
+                    )
+                if debug:
+                    result.vouchers_per_months[direction] = vouchers_per_months
 
                 # получим данные для распределения по дням
-                vouchers_per_days = self.get_vouchers_per_days(begin_dates_df, vouchers_per_months)
-                self.dump_vouchers_per_days[direction].append(vouchers_per_days)
-
-                # вытащим посчитанные путёвки из общего массива путёвок в санатории
-                self.get_sanatorium_vouchers(df_sanatorium, vouchers_per_days, direction)
-        result = []
-        if self.to_sanatorium_vouchers:
-            result.extend(self.to_sanatorium_vouchers)
+                with timer(stage='get_vouchers_per_days', direction=direction_kind):
+                    vouchers_per_days = self.get_vouchers_per_days(calendar, vouchers_per_months, result.timings)
+                if debug:
+                    result.vouchers_per_days[direction] = vouchers_per_days
+
+                # вытащим индексы посчитанных путёвок из оставшихся путёвок санатория
+                with timer(stage='get_sanatorium_vouchers', direction=direction_kind):
+                    distributed_vouchers = self.get_sanatorium_vouchers(
+                        sanatorium_vouchers,
+                        vouchers_per_days,
+                        direction
+                    )
+                    sanatorium_vouchers.remove(distributed_vouchers)
+                result.append(distributed_vouchers, direction_plan.status, direction_plan.organization_id)
         return result
 
+    def distribute_sanatorium_scenarios(
+            self,
+            sanatorium_vouchers: SanatoriumVouchers,
+            settings: List[SanatoriumSettings]
+    ) -> List[SanatoriumDistribution]:
+        """
+        Функция распределяет путёвки одного санатория по нескольким сценариям настроек.
+
+        Путёвки каждого направления отбираются с начала заездного дня среди оставшихся, поэтому
+        для расчёта достаточно кол-ва оставшихся путёвок по дням: оно хранится в массиве
+        сценарии × заездные дни и уменьшается после каждого направления. Срез путёвок санатория
+        не изменяется, распределённые путёвки находятся по смещениям внутри заездных дней.
+
+        :param sanatorium_vouchers: Путёвки санатория.
+        :param settings: Настройки распределения санатория в каждом сценарии.
+        """
+        plans = [scenario_settings.plan for scenario_settings in settings]
+        day_counts = np.bincount(sanatorium_vouchers.day_idx, minlength=len(sanatorium_vouchers.days))
+        day_month = np.unique(sanatorium_vouchers.days.astype('datetime64[M]'), return_inverse=True)[1].ravel()
+        # позиция первой путёвки каждого заездного дня в срезе санатория
+        day_starts = np.cumsum(day_counts) - day_counts
+        indexes = sanatorium_vouchers.df.index
+
+        remaining = np.tile(day_counts, (len(settings), 1))
+        results = [SanatoriumDistribution(scenario_settings.sanatorium_id) for scenario_settings in settings]
+        for step in range(max(map(len, plans))):
+            active = np.array([step < len(plan) for plan in plans])
+            quotas = np.array([plan[step].quota if step < len(plan) else 0 for plan in plans], dtype=np.int64)
+            vouchers_per_days = self.get_scenarios_vouchers_per_days(remaining, day_month, quotas)
+            vouchers_per_days[~active] = 0
+
+            for position in np.flatnonzero(active):
+                direction_plan = plans[position][step]
+                counts = vouchers_per_days[position]
+                # первые counts[day] из оставшихся путёвок каждого заездного дня
+                starts = day_starts + day_counts - remaining[position]
+                selected = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+                results[position].append(indexes[selected], direction_plan.status, direction_plan.organization_id)
+            remaining -= vouchers_per_days
+        return results
+
+    def get_scenarios_vouchers_per_days(
+            self,
+            remaining: np.ndarray,
+            day_month: np.ndarray,
+            quotas: np.ndarray
+    ) -> np.ndarray:
+        """
+        Функция считает кол-во путёвок к распределению по заездным дням одного направления
+        сразу для всех сценариев (те же вычисления, что и в get_vouchers_per_months и get_vouchers_per_days).
+
+        :param remaining: Кол-во оставшихся путёвок (сценарии × заездные дни).
+        :param day_month: Номер месяца каждого заездного дня (дни отсортированы по возрастанию).
+        :param quotas: Кол-во путёвок к распределению по направлению в каждом сценарии.
+        :return: Кол-во путёвок к распределению (сценарии × заездные дни).
+        """
+        scenarios, days = remaining.shape
+        months = int(day_month[-1]) + 1 if days else 0
+        if not months:
+            return np.zeros((scenarios, days), dtype=np.int64)
+        month_starts = np.searchsorted(day_month, np.arange(months))
+
+        # по месяцам
+        total_vouchers = remaining.sum(axis=1)
+        has_vouchers = total_vouchers > 0
+        month_counts = np.add.reduceat(remaining, month_starts, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vouchers_in_months = np.where(has_vouchers[:, None], month_counts / total_vouchers[:, None], 0.0)
+        vouchers_to_sanatorium_in_months = quotas[:, None] * vouchers_in_months
+        vouchers_to_sanatorium_in_months_round = self.apportion_months_many(
+            quotas,
+            vouchers_to_sanatorium_in_months,
+            month_counts
+        )
+
+        # по дням
+        month_counts = month_counts[:, day_month]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vouchers_per_arrivals = np.where(month_counts > 0, remaining / month_counts, 0.0)
+        cnt_vouchers_per_arrival = vouchers_to_sanatorium_in_months[:, day_month] * vouchers_per_arrivals
+
+        # дни каждого месяца раскладываются в строки одинаковой длины (сценарии × месяцы),
+        # недостающие позиции указывают на пустой день с нулевым кол-вом путёвок
+        month_lengths = np.diff(np.append(month_starts, days))
+        offsets = np.arange(month_lengths.max())
+        month_days = np.where(
+            offsets < month_lengths[:, None],
+            month_starts[:, None] + offsets,
+            days
+        )
+        quotas_by_months = np.pad(cnt_vouchers_per_arrival, ((0, 0), (0, 1)))[:, month_days]
+        capacities_by_months = np.pad(remaining, ((0, 0), (0, 1)))[:, month_days]
+        vouchers_by_months = self.apportion_many(
+            vouchers_to_sanatorium_in_months_round.ravel(),
+            quotas_by_months.reshape(scenarios * months, -1),
+            capacities_by_months.reshape(scenarios * months, -1),
+        )
+
+        vouchers_per_days = np.zeros((scenarios, days + 1), dtype=np.int64)
+        vouchers_per_days[:, month_days] = vouchers_by_months.reshape(scenarios, months, -1)
+        return vouchers_per_days[:, :days]
+
+    @staticmethod
+    def apportion_many(totals: np.ndarray, quotas: np.ndarray, capacities: np.ndarray) -> np.ndarray:
+        """
+        Векторизованный вариант функции apportion: каждая строка массивов — отдельный месяц.
+
+        :param totals: Кол-во путёвок к распределению в каждом месяце.
+        :param quotas: Расчётное (дробное) кол-во путёвок по заездным дням (месяцы × дни).
+        :param capacities: Кол-во путёвок в заездные дни (месяцы × дни).
+        :return: Кол-во путёвок по заездным дням (месяцы × дни).
+        """
+        vouchers_per_days = np.minimum((quotas // 2).astype(np.int64) * 2, capacities // 2 * 2)
+        rest = totals - vouchers_per_days.sum(axis=1)
+        last_day = quotas.shape[1] - 1
+
+        for step in (2, 1):
+            adding = rest > 0
+            keys = np.where(adding[:, None], quotas - vouchers_per_days, vouchers_per_days - quotas)
+            rooms = np.where(adding[:, None], (capacities - vouchers_per_days) // step, vouchers_per_days // step)
+            # порядок дней — по убыванию ключа, при равенстве — более поздние дни
+            order = last_day - np.argsort(-keys[:, ::-1], axis=1, kind='stable')
+            rooms = np.maximum(np.take_along_axis(rooms, order, axis=1), 0)
+            portions = np.abs(rest) // step
+
+            # первый проход — не более одной порции на день, второй — всё оставшееся место
+            first = (rooms > 0) & (np.cumsum(rooms > 0, axis=1) <= portions[:, None])
+            rooms -= first
+            portions -= first.sum(axis=1)
+            second = np.minimum(np.maximum(portions[:, None] - (np.cumsum(rooms, axis=1) - rooms), 0), rooms)
+
+            changes = np.where(adding, 1, -1)[:, None] * (first + second) * step
+            np.put_along_axis(
+                vouchers_per_days,
+                order,
+                np.take_along_axis(vouchers_per_days, order, axis=1) + changes,
+                axis=1
+            )
+            rest -= changes.sum(axis=1)
+        return vouchers_per_days
+
+    @staticmethod
+    def apportion_months_many(totals: np.ndarray, quotas: np.ndarray, capacities: np.ndarray) -> np.ndarray:
+        """
+        Векторизованный вариант функции apportion_months: каждая строка массивов — отдельный сценарий.
+
+        :param totals: Кол-во путёвок к распределению в каждом сценарии.
+        :param quotas: Расчётное (дробное) кол-во путёвок по месяцам (сценарии × месяцы).
+        :param capacities: Кол-во путёвок в месяцах (сценарии × месяцы).
+        :return: Кол-во путёвок по месяцам (сценарии × месяцы).
+        """
+        vouchers_per_months = np.minimum(np.floor(quotas).astype(np.int64), capacities)
+        rest = totals - vouchers_per_months.sum(axis=1)
+        last_month = quotas.shape[1] - 1
+
+        while True:
+            rooms = vouchers_per_months < capacities
+            adding = (rest > 0) & rooms.any(axis=1)
+            if not adding.any():
+                break
+            # порядок месяцев — по убыванию остатка, при равенстве — более поздние месяцы
+            keys = np.where(rooms, quotas - vouchers_per_months, -np.inf)
+            order = last_month - np.argsort(-keys[:, ::-1], axis=1, kind='stable')
+            rooms = np.take_along_axis(rooms, order, axis=1)
+            # не более одной путёвки на месяц за проход
+            changes = rooms & (np.cumsum(rooms, axis=1) <= np.where(adding, rest, 0)[:, None])
+            np.put_along_axis(
+                vouchers_per_months,
+                order,
+                np.take_along_axis(vouchers_per_months, order, axis=1) + changes,
+                axis=1
+            )
+            rest -= changes.sum(axis=1)
+        return vouchers_per_months
+
+    def _distribute_parallel(
+            self,
+            sanatoriums: List[Tuple[SanatoriumVouchers, SanatoriumSettings]],
+            workers: int,
+            on_result: Optional[Callable[[SanatoriumDistribution], NoReturn]] = None
+    ) -> List[SanatoriumDistribution]:
+        """
+        Функция распределяет путёвки санаториев в пуле процессов.
+        Результаты возвращаются в том же порядке, в котором переданы санатории.
+
+        :param sanatoriums: Путёвки и настройки распределения санаториев.
+        :param workers: Кол-во процессов.
+        :param on_result: Функция, вызываемая для каждого результата по мере завершения групп санаториев.
+        """
+        chunks = self.get_chunks([len(vouchers) for vouchers, _ in sanatoriums], workers)
+        results = [None] * len(sanatoriums)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    distribute_sanatoriums,
+                    [sanatoriums[position] for position in chunk],
+                    self.vectorized,
+                    metrics.registry.enabled,
+                    self.debug
+                ): chunk
+                for chunk in chunks
+            }
+            for future in as_completed(futures):
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    for pending_future in futures:
+                        pending_future.cancel()
+                    self.check_cancelled()
+                for position, result in zip(futures[future], future.result()):
+                    results[position] = result
+                    if on_result is not None:
+                        on_result(result)
+        return results
+
+    def check_cancelled(self) -> NoReturn:
+        """Прерывает распределение, если оно отменено"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise DistributionCancelled()
+
+    @staticmethod
+    def get_chunks(sizes: List[int], workers: int) -> List[List[int]]:
+        """
+        Функция разбивает санатории на группы для пула процессов с учётом кол-ва путёвок.
+
+        Крупные санатории обрабатываются отдельными задачами и отправляются в пул первыми,
+        мелкие объединяются в группы, примерно равные по кол-ву путёвок.
+
+        :param sizes: Кол-во путёвок в каждом санатории.
+        :param workers: Кол-во процессов.
+        :return: Список групп из позиций санаториев.
+        """
+        # на каждый процесс приходится несколько групп, чтобы выровнять нагрузку
+        chunk_size = max(1, sum(sizes) // (workers * 4))
+        chunks = []
+        chunk = []
+        chunk_vouchers = 0
+        for position in sorted(range(len(sizes)), key=lambda idx: sizes[idx], reverse=True):
+            chunk.append(position)
+            chunk_vouchers += sizes[position]
+            if chunk_vouchers >= chunk_size:
+                chunks.append(chunk)
+                chunk = []
+                chunk_vouchers = 0
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def get_vouchers_index(self, df: Optional[pd.DataFrame] = None) -> Dict[Hashable, SanatoriumVouchers]:
+        """
+        Функция один раз разбивает путёвки по санаториям,
+        каждый срез отсортирован по дате заезда и номеру путёвки.
+
+        :param df: Путёвки (по умолчанию — весь список путёвок).
+        """
+        df = (self._df if df is None else df).sort_values(by=['date_begin', 'number'], kind='mergesort')
+        # даты заезда переводятся в целочисленные коды дней один раз на весь список путёвок
+        day_codes = pd.to_datetime(df['date_begin']).to_numpy().astype('datetime64[D]')
+        # хэши строк для отпечатков путёвок санаториев считаются сразу для всего списка
+        row_hashes = get_row_hashes(df) if self.results_cache.max_size > 0 else None
+        return {
+            sanatorium_id: SanatoriumVouchers(
+                df.iloc[positions],
+                day_codes[positions],
+                row_hashes[positions] if row_hashes is not None else None
+            )
+            for sanatorium_id, positions in df.groupby('sanatorium_id', sort=False).indices.items()
+        }
+
     @staticmethod
     def get_vouchers_per_months(
-            df: DataFrameGroupBy,
+            calendar: VouchersCalendar,
             total_vouchers: int,
-            settings: Settings,
-            direction: str,
+            vouchers_to_distribute: int,
     ) -> Dict[str, List]:
         """
         Функция получает данные для распределения по месяцам.
 
-        :param df: DataFrame сгруппированный по дате заезда.
+        :param calendar: Кол-во путёвок по заездным дням и месяцам.
         :param total_vouchers: Общее кол-во путёвок к распределению.
-        :param settings: Настройки распределения.
-        :param direction: Направление распределения.
+        :param vouchers_to_distribute: Кол-во путёвок к распределению по направлению.
         :return: Словарь содержащий год-месяц в виде индекса и массив из 4-х элементов, где
                  1-ый элемент — кол-во путёвок в месяце,
                  2-ой элемент — процент путёвок в месяце от общего числа путёвок к распределению,
                  3-ий элемент — кол-во путёвок к распределению помесячно,
                  4-ый элемент — кол-во путёвок к распределению помесячно (после округления),
         """
-        vouchers_per_months = {}
-        for begin_date, indexes in df.groups.items():
-            month = begin_date[:7]
-            vouchers_in_month = vouchers_per_months.get(month, [])
-            vouchers_per_months[month] = vouchers_in_month + list(indexes)
-
-        total_vouchers_to_sanatorium_by_months = 0
-        vouchers_to_distribute = getattr(settings, direction)
-
-        for date, indexes in vouchers_per_months.items():
-            total_vouchers_in_month = len(indexes)
-            vouchers_in_month = total_vouchers_in_month / total_vouchers
-            vouchers_to_sanatorium_in_month = vouchers_to_distribute * vouchers_in_month
-            vouchers_to_sanatorium_in_month_round = round(vouchers_to_sanatorium_in_month)
-            total_vouchers_to_sanatorium_by_months += vouchers_to_sanatorium_in_month_round
+        if not len(calendar.months):
+            return {}
+
+        vouchers_in_months = calendar.month_counts / total_vouchers
+        vouchers_to_sanatorium_in_months = vouchers_to_distribute * vouchers_in_months
+        # округляем помесячно так, чтобы сумма совпала с кол-вом путёвок к распределению,
+        # а кол-во путёвок месяца не превышало кол-во путёвок в месяце
+        vouchers_to_sanatorium_in_months_round = Distribution.apportion_months(
+            vouchers_to_distribute,
+            vouchers_to_sanatorium_in_months.tolist(),
+            calendar.month_counts.tolist()
+        )
 
-            vouchers_per_months[date] = [
+        return {
+            month: list(month_stat)
+            for month, *month_stat in zip(
+                calendar.month_labels,
                 # всего путёвок в месяце
-                total_vouchers_in_month,
-
+                calendar.month_counts.tolist(),
                 # процент путёвок в месяце
-                round(vouchers_in_month * 100),
-
+                np.rint(vouchers_in_months * 100).astype(np.int64).tolist(),
                 # кол-во путёвок к распределению помесячно
-                vouchers_to_sanatorium_in_month,
-                vouchers_to_sanatorium_in_month_round
-            ]
-
-        # проверим насколько получилось правильно посчитать заявок в заездные день за все месяцы,
-        # если общее число не равно указанному кол-во путёвок на распределение — добавим/вычтем
-        # недостающие в последний месяц
-        if total_vouchers_to_sanatorium_by_months != vouchers_to_distribute:
-            fault_vouchers_count = vouchers_to_distribute - total_vouchers_to_sanatorium_by_months
-            vouchers_per_months[list(vouchers_per_months.keys())[-1]][-1] += fault_vouchers_count
-
-        return vouchers_per_months
+                vouchers_to_sanatorium_in_months.tolist(),
+                vouchers_to_sanatorium_in_months_round,
+            )
+        }
 
-    def get_vouchers_per_days(self, df: DataFrameGroupBy, vouchers_per_months: Dict[str, List]) -> Dict[str, List]:
+    def get_vouchers_per_days(
+            self,
+            calendar: VouchersCalendar,
+            vouchers_per_months: Dict[str, List],
+            samples: Optional[list] = None
+    ) -> Dict[str, List]:
         """
         Функция получает данные для распределения по заездным дням.
 
-        :param df: DataFrame сгруппированный по дате заезда.
+        :param calendar: Кол-во путёвок по заездным дням и месяцам.
         :param vouchers_per_months: данные распределения по месяцам.
-        :return: Словарь, в виде индекса (день заезда) и массив значений из 4-х элементов, где:
+        :param samples: Список, в который добавляются приращения счётчиков корректировок
+                        (см. SanatoriumDistribution.timings), по умолчанию — сразу в счётчики.
+        :return: Словарь, в виде индекса (день заезда) и массив значений из 6-ти элементов, где:
+                 0-ой элемент — кол-во путёвок в день,
                  1-ый элемент — процент путёвок по заездам,
                  2-ой элемент — кол-во путёвок по заездам,
                  3-ий элемент — кол-во путёвок по заездам целочисленное (без дроби),
                  4-ий элемент — кол-во путёвок по заездам округлённое до ближайшего чётного числа,
-                 5-ый элемент — (опциональный) скорректированное кол-во путёвок за заезд.
+                 5-ый элемент — скорректированное кол-во путёвок за заезд.
         """
-        # посчитаем кол-во путёвок в день
-        vouchers_per_days = {}
-        arrivals_per_months = {}
-        for date, indexes in df.groups.items():
-            arrivals_per_months[date[:7]] = arrivals_per_months.get(date[:7], 0) + 1
-            vouchers_per_days[date] = len(indexes)
+        month_stats = list(vouchers_per_months.values())
+        month_counts = calendar.month_counts[calendar.day_month]
+        month_quotas = np.array([month_stat[2] for month_stat in month_stats], dtype=np.float64)[calendar.day_month]
 
         # сформируем массив данных для распределения по дням заезда
-        for date, total_vouchers_per_day in vouchers_per_days.items():
-            data_only_month = date[:7]
-            vouchers_per_arrivals = total_vouchers_per_day / vouchers_per_months[data_only_month][0]
-            cnt_vouchers_per_arrival = vouchers_per_months[data_only_month][2] * vouchers_per_arrivals
-            cnt_vouchers_per_arrival_int = int(cnt_vouchers_per_arrival)
-            vouchers_per_days[date] = [
+        vouchers_per_arrivals = calendar.day_counts / month_counts
+        cnt_vouchers_per_arrival = month_quotas * vouchers_per_arrivals
+        cnt_vouchers_per_arrival_int = cnt_vouchers_per_arrival.astype(np.int64)
+        # округляем до ближайшего чётного числа
+        cnt_vouchers_per_arrival_even = cnt_vouchers_per_arrival_int + cnt_vouchers_per_arrival_int % 2
+
+        vouchers_per_days = {
+            date: list(day_stat)
+            for date, *day_stat in zip(
+                calendar.day_labels,
                 # кол-во путёвок в день
-                total_vouchers_per_day,
+                calendar.day_counts.tolist(),
                 # процент путёвок по заездам
-                vouchers_per_arrivals * 100,
+                (vouchers_per_arrivals * 100).tolist(),
                 # кол-во путёвок по заездам
-                cnt_vouchers_per_arrival,
+                cnt_vouchers_per_arrival.tolist(),
                 # кол-во путёвок по заездам целочисленное (без дроби)
-                cnt_vouchers_per_arrival_int,
-                # округляем до ближайшего чётного числа
-                cnt_vouchers_per_arrival_int if self.is_even(
-                    cnt_vouchers_per_arrival_int) else cnt_vouchers_per_arrival_int + 1,
-
-            ]
+                cnt_vouchers_per_arrival_int.tolist(),
+                cnt_vouchers_per_arrival_even.tolist(),
+            )
+        }
 
-        need_correction = self._get_total_vouchers_by_months(vouchers_per_days, vouchers_per_months)
-        while need_correction:
-            # скорректируем кол-во путёвок за заезд исходя из расчётного кол-ва путёвок в месяц:
+        # скорректируем кол-во путёвок за заезд исходя из расчётного кол-ва путёвок в месяц
+        days_per_months = {}
+        for date in vouchers_per_days.keys():
+            days_per_months.setdefault(date[:7], []).append(date)
+        for month, dates in days_per_months.items():
+            vouchers_per_arrivals = self.apportion(
+                vouchers_per_months[month][-1],
+                [vouchers_per_days[date][2] for date in dates],
+                [vouchers_per_days[date][0] for date in dates],
+            )
+            for date, cnt_vouchers_per_arrival_correct in zip(dates, vouchers_per_arrivals):
+                # скорректированное кол-во путёвок за заезд
+                vouchers_per_days[date].append(cnt_vouchers_per_arrival_correct)
+            if metrics.registry.enabled:
+                metrics.registry.inc('distribution_correction_steps_total', sum(
+                    vouchers_per_days[date][-1] != vouchers_per_days[date][4] for date in dates
+                ), samples)
+
+        if self._get_total_vouchers_by_months(vouchers_per_days, vouchers_per_months):
             for month, total_vouchers_in_month in self._total_vouchers_by_months.items():
-                overload_ratio = vouchers_per_months[month][-1] - total_vouchers_in_month
-                abs_overload_ratio = abs(overload_ratio)
-                arrivals_in_month = arrivals_per_months[month]
-                overload_ration_in_day = overload_ratio / arrivals_in_month
-                if overload_ration_in_day > 0:
-                    overload_ration_in_day = math.ceil(overload_ration_in_day)
-                else:
-                    overload_ration_in_day = math.floor(overload_ration_in_day)
-
-                if overload_ration_in_day:
-                    for date, stat in sorted(list(vouchers_per_days.items()), reverse=True):
-                        new_vouchers_per_arrival = vouchers_per_days[date][-1] + overload_ration_in_day
-                        if (
-                                date[:7] == month and
-                                abs_overload_ratio > 0 and
-                                vouchers_per_days[date][0] >= new_vouchers_per_arrival
-                        ):
-                            vouchers_per_days[date].append(new_vouchers_per_arrival)
-                            abs_overload_ratio -= abs(overload_ration_in_day)
-            # Уберём переполнение, если оно есть:
-            for date, start in sorted(list(vouchers_per_days.items()), reverse=True):
-                if vouchers_per_days[date][-1] > vouchers_per_days[date][0]:
-                    vouchers_per_days[date][-1] = vouchers_per_days[date][0]
-            need_correction = self._get_total_vouchers_by_months(vouchers_per_days, vouchers_per_months)
+                if total_vouchers_in_month != vouchers_per_months[month][-1]:
+                    metrics.registry.inc('distribution_correction_failures_total', samples=samples)
+                    warnings.warn(
+                        'Не удалось распределить %d путёвок за %s: распределено %d путёвок.' % (
+                            vouchers_per_months[month][-1], month, total_vouchers_in_month
+                        ),
+                        RuntimeWarning
+                    )
         return vouchers_per_days
 
     def _get_total_vouchers_by_months(self, vouchers_per_days: dict, vouchers_per_months: dict) -> bool:
@@ -468,6 +2056,73 @@ class Distribution(object):
                 need_to_correct = True
         return need_to_correct
 
+    @staticmethod
+    def apportion(total: int, quotas: List[float], capacities: List[int]) -> List[int]:
+        """
+        Функция распределяет путёвки месяца по заездным дням методом наибольших остатков.
+
+        Сначала каждому дню выделяется чётное кол-во путёвок не больше расчётного, затем недостающие
+        (или лишние) путёвки раздаются парами, а после — по одной, в порядке убывания остатка
+        расчётного кол-ва. Кол-во путёвок за заезд никогда не превышает кол-во путёвок в заезде.
+        Функция выполняется за один проход и всегда завершается; если выделить ровно total путёвок
+        невозможно, сумма результата будет отличаться от total.
+
+        :param total: Кол-во путёвок к распределению в месяце.
+        :param quotas: Расчётное (дробное) кол-во путёвок по заездным дням.
+        :param capacities: Кол-во путёвок в заездные дни.
+        :return: Кол-во путёвок по заездным дням.
+        """
+        days = range(len(quotas))
+        vouchers_per_days = [min(int(quota // 2) * 2, capacity // 2 * 2) for quota, capacity in zip(quotas, capacities)]
+        rest = total - sum(vouchers_per_days)
+
+        for step in (2, 1):
+            if rest > 0:
+                # добавляем путёвки дням с наибольшим недобором, при равенстве — более поздним дням
+                order = sorted(days, key=lambda day: (quotas[day] - vouchers_per_days[day], day), reverse=True)
+                rooms = [(capacities[day] - vouchers_per_days[day]) // step for day in days]
+            else:
+                # убираем путёвки у дней с наибольшим перебором
+                order = sorted(days, key=lambda day: (vouchers_per_days[day] - quotas[day], day), reverse=True)
+                rooms = [vouchers_per_days[day] // step for day in days]
+            sign = 1 if rest > 0 else -1
+
+            # первый проход — не более одной порции на день, второй — всё оставшееся место
+            for limit in (1, None):
+                for day in order:
+                    portions = min(abs(rest) // step, rooms[day] if limit is None else min(rooms[day], limit))
+                    if portions > 0:
+                        vouchers_per_days[day] += sign * portions * step
+                        rooms[day] -= portions
+                        rest -= sign * portions * step
+        return vouchers_per_days
+
+    @staticmethod
+    def apportion_months(total: int, quotas: List[float], capacities: List[int]) -> List[int]:
+        """
+        Функция распределяет путёвки по месяцам методом наибольших остатков.
+
+        Каждому месяцу выделяется целая часть расчётного кол-ва, затем недостающие путёвки раздаются
+        по одной в порядке убывания остатка (при равенстве — более поздним месяцам). Кол-во путёвок
+        месяца никогда не превышает кол-во путёвок в месяце; если их не хватает, сумма результата меньше total.
+
+        :param total: Кол-во путёвок к распределению.
+        :param quotas: Расчётное (дробное) кол-во путёвок по месяцам.
+        :param capacities: Кол-во путёвок в месяцах.
+        :return: Кол-во путёвок по месяцам.
+        """
+        vouchers_per_months = [min(int(quota), capacity) for quota, capacity in zip(quotas, capacities)]
+        rest = total - sum(vouchers_per_months)
+        while rest > 0:
+            months = [month for month in range(len(quotas)) if vouchers_per_months[month] < capacities[month]]
+            if not months:
+                break
+            months.sort(key=lambda month: (quotas[month] - vouchers_per_months[month], month), reverse=True)
+            for month in months[:rest]:
+                vouchers_per_months[month] += 1
+                rest -= 1
+        return vouchers_per_months
+
     @staticmethod
     def is_even(number) -> bool:
         """
@@ -477,92 +2132,716 @@ class Distribution(object):
 
     def get_sanatorium_vouchers(
             self,
-            vouchers: pd.DataFrame,
+            vouchers: SanatoriumVouchers,
             vouchers_per_days: Dict[str, List],
             direction: str
-    ) -> NoReturn:
+    ) -> pd.Index:
         """
         Функция получает унифицированный список путёвок по расчётному плану распределения.
 
+        Из каждого заездного дня отбираются первые N путёвок (в порядке сортировки среза),
+        где N — расчётное кол-во путёвок за заезд.
+
+        :param vouchers: Оставшиеся путёвки санатория.
+        :param vouchers_per_days: Расчётные данные распределения путёвок по заездным дням.
+        :param direction: Направление распределения.
+        :return: Индексы распределённых путёвок.
+        """
+        if not self.vectorized:
+            return self._get_sanatorium_vouchers_by_rows(vouchers.df, vouchers_per_days, direction)
+
+        # расчётное кол-во путёвок по всем заездным дням санатория
+        quotas = np.zeros(len(vouchers.days), dtype=np.int64)
+        quotas[vouchers.calendar.day_positions] = [stat[-1] for stat in vouchers_per_days.values()]
+
+        is_selected = vouchers.ranks < quotas[vouchers.day_idx]
+        return vouchers.df.index[is_selected]
+
+    def _get_sanatorium_vouchers_by_rows(
+            self,
+            vouchers: pd.DataFrame,
+            vouchers_per_days: Dict[str, List],
+            direction: str
+    ) -> pd.Index:
+        """
+        Построчный вариант функции get_sanatorium_vouchers (используется при vectorized=False).
+
         :param vouchers: Список путёвок.
         :param vouchers_per_days: Расчётные данные распределения путёвок по заездным дням.
         :param direction: Направление распределения.
+        :return: Индексы распределённых путёвок.
         """
         cnt_vouchers_to_distribute = {}
         for date, stat in vouchers_per_days.items():
             cnt_vouchers_to_distribute[date] = stat[-1]
 
-        voucher_status = VoucherStatus()
-        delete_indexes = []
+        distributed_vouchers = []
         for index, row in vouchers.iterrows():
-            if cnt_vouchers_to_distribute[row['date_begin']] > 0:
-                voucher_to_distribute = row.copy()
-                voucher_to_distribute['status'] = getattr(voucher_status, direction)
-                if direction == 'to_sanatorium':
-                    voucher_to_distribute['organization_id'] = int(voucher_to_distribute['sanatorium_id'])
-                elif direction.startswith('to_medical_unit'):
-                    voucher_to_distribute['organization_id'] = int(direction[16:])
-                else:
-                    voucher_to_distribute['organization_id'] = None
-                self.to_sanatorium_vouchers.append(voucher_to_distribute)
-                cnt_vouchers_to_distribute[row['date_begin']] -= 1
-                delete_indexes.append(index)
-        self._df = vouchers.drop(labels=delete_indexes, axis=0)
-        self._vouchers_exists = self._df
+            date = pd.Timestamp(row['date_begin']).strftime('%Y-%m-%d')
+            if cnt_vouchers_to_distribute[date] > 0:
+                distributed_vouchers.append(index)
+                cnt_vouchers_to_distribute[date] -= 1
+        return pd.Index(distributed_vouchers, dtype=vouchers.index.dtype)
 
-    def get_sanatorium_setting(self, sanatorium_id: Optional[Hashable]) -> Union[Settings, None]:
+    def get_sanatorium_setting(self, sanatorium_id: Optional[Hashable]) -> Union[SanatoriumSettings, None]:
         """
         Функция находит и возвращает параметры распределения для конкретного санатория.
         """
-        for setting in self.settings:
-            if setting.sanatorium_id == sanatorium_id:
-                return setting
-        return None
+        return self._settings_index.get(sanatorium_id)
 
     def start(self) -> NoReturn:
         """
         Функция выполняет постоянное соединение с RabbitMQ и создаёт очередь в которой ожидает получение сообщений.
+
+        Распределение выполняется в пуле потоков, а поток соединения продолжает обслуживать
+        heartbeat, поэтому долгие распределения не приводят к разрыву соединения с брокером.
         """
         parameters = pika.URLParameters(self.ampq_url)
-        connection = pika.BlockingConnection(parameters)
-        self.channel = connection.channel()
-        self.channel.queue_declare(queue=self.request_queue)
-        self.channel.basic_consume(queue=self.request_queue, on_message_callback=self.receiver, auto_ack=True)
-        self.channel.start_consuming()
+        self.connection = pika.BlockingConnection(parameters)
+        self.channel = self.connection.channel()
+        self.declare_queues()
+        # ответы публикуются с подтверждением брокера, только после этого подтверждается сообщение
+        self.channel.confirm_delivery()
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.compute_workers)
+        self._stopped = False
+        self.resume_consuming()
+        try:
+            while not self._stopped:
+                self.connection.process_data_events(time_limit=1)
+        finally:
+            self._executor.shutdown(wait=False)
 
     def stop(self) -> NoReturn:
-        self.channel.stop_consuming()
+        self._stopped = True
+        self.pause_consuming()
+
+    def declare_queues(self) -> NoReturn:
+        """Объявляет очередь, из которой получаются сообщения"""
+        self.channel.queue_declare(queue=self.request_queue)
+
+    def pause_consuming(self) -> NoReturn:
+        """Перестаёт получать сообщения, пока заполнена очередь распределений"""
+        if self._consumer_tag is not None:
+            self.channel.basic_cancel(self._consumer_tag)
+            self._consumer_tag = None
+
+    def resume_consuming(self) -> NoReturn:
+        if self._consumer_tag is None and not self._stopped:
+            self._consumer_tag = self.channel.basic_consume(
+                queue=self.request_queue,
+                on_message_callback=self.receiver
+            )
 
     def receiver(self, ch, method, props, body: bytes):
-        """Функция обработки входящих сообщений от брокера RabbitMQ"""
+        """
+        Функция обработки входящих сообщений от брокера RabbitMQ.
+
+        Сообщение с некорректными настройками (см. validate_message) сразу отклоняется с текстом ошибки.
+        Сообщения одной кампании (campaign_id) накапливаются в течение coalesce_window секунд:
+        в обработку уходит только последняя ревизия, предыдущие подтверждаются как заменённые,
+        а уже выполняющееся распределение кампании отменяется.
+        """
         _ch: BlockingChannel = ch
         _method: Basic.Deliver = method
         _props: pika.BasicProperties = props
-        # TODO: Написать адаптер для перевода настроек в правильный формат.
-        self.settings = json.loads(body)
-        print(' [x] Received %r' % self.settings)
+        print(' [x] Received %r' % _props.correlation_id)
+        if metrics.registry.enabled:
+            self._received[_method.delivery_tag] = time.perf_counter()
+
+        try:
+            validate_message(body)
+        except Exception as e:
+            # некорректное сообщение отклоняется сразу, без повторных попыток
+            print(' [!] Rejected %r: %s' % (_props.correlation_id, e))
+            self.reply(_ch, _props, {'error': str(e)})
+            _ch.basic_nack(delivery_tag=_method.delivery_tag, requeue=False)
+            self.observe_message(_method, _props, 'rejected')
+            return
+
+        campaign_id, revision = self.get_campaign(body)
+        if campaign_id is None or self.coalesce_window <= 0 or self.connection is None:
+            return self.dispatch(_ch, _method, _props, body)
+
+        if campaign_id not in self._campaigns:
+            self._campaigns[campaign_id] = {
+                'revision': self._revisions.pop(campaign_id, None),
+                'waiting': None,
+                'running': None,
+            }
+        campaign = self._campaigns[campaign_id]
+        if campaign['revision'] is not None and revision < campaign['revision']:
+            # пришла ревизия старше уже полученной
+            if campaign['running'] is None and campaign['waiting'] is None:
+                del self._campaigns[campaign_id]
+                self.keep_revision(campaign_id, campaign['revision'])
+            return self.supersede(_ch, _method, _props)
+        campaign['revision'] = revision
+
+        if campaign['waiting'] is not None:
+            waiting = campaign['waiting']
+            self.connection.remove_timeout(waiting['timer'])
+            self.supersede(waiting['ch'], waiting['method'], waiting['props'])
+        if campaign['running'] is not None:
+            campaign['running'].set()
+
+        campaign['waiting'] = {
+            'ch': _ch,
+            'method': _method,
+            'props': _props,
+            'body': body,
+            'timer': self.connection.call_later(
+                self.coalesce_window,
+                functools.partial(self.dispatch_campaign, campaign_id)
+            ),
+        }
+
+    def get_campaign(self, body: bytes) -> Tuple[Optional[Hashable], Optional[float]]:
+        """
+        Функция возвращает ID кампании и номер ревизии настроек из сообщения.
+        Если ревизия не указана, ревизией считается порядок получения сообщений.
+
+        Сообщение с некорректным ID кампании (не строка и не целое число) или ревизией (не число)
+        обрабатывается как сообщение без кампании.
+        """
+        try:
+            message = json.loads(body)
+        except ValueError:
+            return None, None
+        if not isinstance(message, dict) or message.get('campaign_id') is None:
+            return None, None
+        campaign_id = message['campaign_id']
+        revision = message.get('revision')
+        if not isinstance(campaign_id, (str, int)) or isinstance(campaign_id, bool):
+            print(' [!] Invalid campaign_id %r, message is not coalesced' % (campaign_id,))
+            return None, None
+        if revision is not None:
+            if isinstance(revision, bool) or not isinstance(revision, (int, float)) or not math.isfinite(revision):
+                print(' [!] Invalid revision %r of campaign %r, message is not coalesced' % (revision, campaign_id))
+                return None, None
+        self._arrivals += 1
+        return campaign_id, float(self._arrivals if revision is None else revision)
+
+    def keep_revision(self, campaign_id: Hashable, revision: float) -> NoReturn:
+        """Запоминает последнюю ревизию кампании, у которой не осталось сообщений в обработке"""
+        self._revisions[campaign_id] = revision
+        self._revisions.move_to_end(campaign_id)
+        while len(self._revisions) > self.max_campaigns:
+            self._revisions.popitem(last=False)
+
+    def dispatch_campaign(self, campaign_id: Hashable) -> NoReturn:
+        """Передаёт в обработку последнюю ревизию настроек кампании по истечении окна ожидания"""
+        campaign = self._campaigns[campaign_id]
+        waiting, campaign['waiting'] = campaign['waiting'], None
+        campaign['running'] = threading.Event()
+        self.dispatch(waiting['ch'], waiting['method'], waiting['props'], waiting['body'], campaign_id)
+
+    def supersede(self, ch, method, props) -> NoReturn:
+        """Подтверждает сообщение, заменённое более новой ревизией настроек"""
+        self.reply(ch, props, {'superseded': True})
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        self.observe_message(method, props, 'superseded')
+        print(' [x] Superseded %r' % props.correlation_id)
+
+    def dispatch(self, ch, method, props, body: bytes, campaign_id: Optional[Hashable] = None) -> NoReturn:
+        """
+        Передаёт сообщение в пул потоков распределения; когда в обработке находится
+        max_pending сообщений, получение новых сообщений приостанавливается.
+        """
+        cancel_event = self._campaigns[campaign_id]['running'] if campaign_id is not None else None
+
+        self._pending += 1
+        if self._executor is None:
+            future = Future()
+            try:
+                future.set_result(self.handle_message(body, cancel_event))
+            except Exception as e:
+                future.set_exception(e)
+            self.complete(ch, method, props, body, future, campaign_id, cancel_event)
+            return
+
+        future = self._executor.submit(self.handle_message, body, cancel_event)
+        # подтверждение и ответ отправляются из потока соединения
+        future.add_done_callback(
+            lambda done: self.connection.add_callback_threadsafe(
+                functools.partial(self.complete, ch, method, props, body, done, campaign_id, cancel_event)
+            )
+        )
+        if self._pending >= self.max_pending:
+            self.pause_consuming()
 
-    def get_vouchers(self, limit: int, offset: int) -> NoReturn:
+    def complete(
+            self,
+            ch,
+            method,
+            props,
+            body: bytes,
+            future: Future,
+            campaign_id: Optional[Hashable] = None,
+            cancel_event: Optional[threading.Event] = None
+    ) -> NoReturn:
+        """
+        Функция завершает обработку сообщения (в потоке соединения).
+
+        Результат распределения публикуется в очередь reply_to с тем же correlation_id,
+        после чего сообщение подтверждается. При ошибке сообщение публикуется в очередь заново
+        со счётчиком попыток (см. retry); после max_attempts попыток сообщение отклоняется
+        окончательно, а в ответ отправляется текст ошибки.
+        """
+        self._pending -= 1
+        campaign = self._campaigns.get(campaign_id) if campaign_id is not None else None
+        if campaign is not None:
+            if campaign['running'] is cancel_event:
+                campaign['running'] = None
+            if campaign['running'] is None and campaign['waiting'] is None:
+                del self._campaigns[campaign_id]
+                self.keep_revision(campaign_id, campaign['revision'])
+
+        try:
+            result = future.result()
+        except DistributionCancelled:
+            self.supersede(ch, method, props)
+        except Exception as e:
+            attempts = self.get_attempts(props) + 1
+            print(' [!] Failed %r (attempt %d): %s' % (props.correlation_id, attempts, e))
+            if attempts < self.max_attempts:
+                if self.retry(ch, props, body, attempts):
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                else:
+                    # не удалось опубликовать сообщение заново — возвращаем его в очередь
+                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                self.observe_message(method, props, 'requeued')
+            else:
+                self.reply(ch, props, {'error': str(e)})
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                self.observe_message(method, props, 'failed')
+        else:
+            self.reply(ch, props, result)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            self.observe_message(method, props, 'done')
+            print(' [x] Done %r' % props.correlation_id)
+
+        if self._pending < self.max_pending:
+            self.resume_consuming()
+
+    @staticmethod
+    def get_attempts(props) -> int:
+        """Кол-во уже выполненных попыток обработки сообщения (заголовок ATTEMPTS_HEADER)"""
+        try:
+            return max(0, int((props.headers or {}).get(ATTEMPTS_HEADER, 0)))
+        except (TypeError, ValueError):
+            return 0
+
+    def retry(self, ch, props, body: bytes, attempts: int) -> bool:
+        """
+        Публикует сообщение заново в конец очереди с кол-вом выполненных попыток в заголовке.
+
+        Флаг redelivered для подсчёта попыток не подходит: его получают и сообщения, которые брокер
+        передал заранее (prefetch) и вернул в очередь при приостановке получения сообщений.
+
+        :return: Опубликовано ли сообщение.
+        """
+        # свойства сообщения (delivery_mode, priority, expiration, message_id и т.д.) сохраняются,
+        # меняется только заголовок с кол-вом попыток
+        properties = copy.copy(props)
+        properties.headers = dict(props.headers or {}, **{ATTEMPTS_HEADER: attempts})
+        try:
+            ch.basic_publish(
+                exchange='',
+                routing_key=self.request_queue,
+                properties=properties,
+                body=body,
+            )
+        except (UnroutableError, NackError) as e:
+            print(' [!] Retry of %r not published: %r' % (props.correlation_id, e))
+            return False
+        return True
+
+    def observe_message(self, method, props, result: str) -> NoReturn:
+        """
+        Добавляет в метрики время от получения сообщения до его подтверждения.
+
+        :param result: Результат обработки: done, failed, rejected, requeued или superseded.
+        """
+        received = self._received.pop(method.delivery_tag, None)
+        if not metrics.registry.enabled:
+            return
+        metrics.registry.inc('distribution_messages_total', result=result)
+        if received is not None:
+            seconds = time.perf_counter() - received
+            metrics.registry.observe('distribution_message_seconds', seconds, result=result)
+            metrics.registry.log(
+                'message_acked',
+                correlation_id=props.correlation_id,
+                result=result,
+                seconds=round(seconds, 6)
+            )
+
+    @staticmethod
+    def reply(ch, props, result: dict) -> bool:
+        """
+        Публикует результат обработки сообщения в очередь reply_to.
+
+        Если брокер не принял ответ (очереди reply_to уже нет или публикация не подтверждена),
+        ошибка выводится в лог, а сообщение всё равно подтверждается или отклоняется вызывающей функцией.
+
+        :return: Опубликован ли ответ.
+        """
+        if not props.reply_to:
+            return True
+        try:
+            ch.basic_publish(
+                exchange='',
+                routing_key=props.reply_to,
+                properties=pika.BasicProperties(
+                    correlation_id=props.correlation_id,
+                    content_type='application/json',
+                ),
+                body=json.dumps(result, default=json_default),
+            )
+        except (UnroutableError, NackError) as e:
+            print(' [!] Reply to %r not published: %r' % (props.correlation_id, e))
+            return False
+        return True
+
+    def handle_message(self, body: bytes, cancel_event: Optional[threading.Event] = None) -> dict:
+        """
+        Функция выполняет распределение по сообщению брокера.
+
+        Формат сообщения описан в функции parse_message.
+        Для каждого сообщения создаётся отдельное распределение, кэш результатов общий.
+
+        :param body: Тело сообщения.
+        :param cancel_event: Событие отмены распределения.
+        :return: Результат распределения.
+        """
+        message = parse_message(body)
+
+        distribution = Distribution(**self._options)
+        distribution.results_cache = self.results_cache
+        distribution.cancel_event = cancel_event
+        distribution.settings = [SanatoriumSettings.from_dict(item) for item in message['settings']]
+        distribution.distribution_date = message.get('distribution_date') or distribution.distribution_date
+        if distribution.vouchers_stream and message.get('scenarios') is None:
+            distribution.get_distribute_stream()
+            return distribution.get_result()
+        distribution.get_vouchers()
+        distribution.check_cancelled()
+        if message.get('scenarios') is not None:
+            results = distribution.get_distribute_scenarios([
+                [SanatoriumSettings.from_dict(item) for item in scenario['settings']]
+                for scenario in message['scenarios']
+            ])
+            return {
+                'scenarios': [
+                    dict(id=scenario['id'], **result.to_dict(rows=message.get('rows', True)))
+                    for scenario, result in zip(message['scenarios'], results)
+                ],
+            }
+        distribution.get_distribute()
+        return distribution.get_result()
+
+    def get_result(self) -> dict:
+        """
+        Результат распределения для ответа брокеру.
+
+        Путёвки упорядочиваются по санаториям в порядке настроек (внутри санатория — в порядке
+        распределения), поэтому ответ не зависит от режима работы: распределение полного списка
+        путёвок, пачками санаториев или по шардам (см. sharding.merge_results).
+        """
+        vouchers = self.to_sanatorium_vouchers
+        sanatorium_positions = {
+            sanatorium_id: position for position, sanatorium_id in enumerate(self._settings_index)
+        }
+        positions = np.array([
+            sanatorium_positions.get(sanatorium_id, -1)
+            for sanatorium_id in vouchers.column('sanatorium_id').tolist()
+        ], dtype=np.int64)
+        return {
+            'total': len(vouchers),
+            'rows': vouchers.take(np.argsort(positions, kind='stable')).to_records(),
+        }
+
+    def get_vouchers(self, limit: Optional[int] = None, offset: int = 0) -> NoReturn:
         """
         Метод заполняет массив путёвок GET запросами к API списка путёвок.
+
+        Если задан кэш путёвок, актуальный список путёвок загружается из кэша, а для устаревшего
+        списка API проверяет изменения условным запросом (ETag/Last-Modified). При загрузке
+        из кэша заполняется только DataFrame путёвок.
+
+        :param limit: Максимальное кол-во элементов в одном запросе.
+        :param offset: Отступ по списку найденных элементов.
+        """
+        filters = self.get_vouchers_filters()
+        # отметка времени ставится до запроса, чтобы путёвки, изменённые во время получения списка,
+        # попали в следующие изменения списка путёвок
+        self.vouchers_watermark = self.get_watermark()
+        if self.vouchers_cache is None:
+            self.vouchers = []
+            self._df = self.get_vouchers_df(self.fetch_vouchers(filters, limit, offset))
+            return
+
+        key = self.vouchers_cache.get_key(dict(filters, offset=offset))
+        meta = self.vouchers_cache.get_meta(key)
+        headers = {}
+        if meta is not None:
+            if self.vouchers_cache.is_fresh(meta):
+                df = self.vouchers_cache.load(key)
+                # список может быть вытеснен из кэша после чтения метаданных, тогда он запрашивается заново
+                if df is not None:
+                    self.vouchers_watermark = self.get_watermark(meta['created'])
+                    self.vouchers = []
+                    self._df = self.get_vouchers_df(df)
+                    return
+            else:
+                headers = self.vouchers_cache.get_conditional_headers(meta)
+
+        limit = int(limit or self.vouchers_page_limit)
+        r = self.request_vouchers_page(filters, limit, offset, headers=headers)
+        if r.status_code == requests.codes.not_modified:
+            r.close()
+            self.vouchers_cache.touch(key)
+            df = self.vouchers_cache.load(key)
+            if df is not None:
+                self.vouchers = []
+                self._df = self.get_vouchers_df(df)
+                return
+            # список вытеснен из кэша после проверки актуальности — запрашиваем без условий
+            r = self.request_vouchers_page(filters, limit, offset)
+        r.raise_for_status()
+
+        self.vouchers = []
+        self._df = self.get_vouchers_df(
+            self.fetch_vouchers(filters, limit, offset, first_page=self.read_vouchers_page(r))
+        )
+        self.vouchers_cache.save(
+            key,
+            self._df,
+            etag=r.headers.get('ETag'),
+            last_modified=r.headers.get('Last-Modified')
+        )
+
+    def get_vouchers_delta(self, removed_ids: Optional[List[Hashable]] = None) -> Dict[Hashable, List[str]]:
+        """
+        Метод получает из API путёвки, изменённые после последнего получения списка путёвок
+        (фильтр vouchers_watermark_filter), и применяет их к списку путёвок (см. apply_vouchers_delta).
+
+        API возвращает только путёвки с кодом статуса распределения, поэтому путёвки, которые
+        перестали участвовать в распределении, передаются явно.
+
+        :param removed_ids: ID путёвок, которые больше не участвуют в распределении.
+        :return: Затронутые изменениями месяцы заездов (ГГГГ-ММ) по санаториям.
+        """
+        assert self.vouchers_watermark, 'Изменения списка путёвок запрашиваются после получения списка путёвок.'
+        filters = dict(self.get_vouchers_filters(), **{self.vouchers_watermark_filter: self.vouchers_watermark})
+        watermark = self.get_watermark()
+        affected = self.apply_vouchers_delta(self.fetch_vouchers(filters), removed_ids)
+        self.vouchers_watermark = watermark
+        return affected
+
+    @staticmethod
+    def get_watermark(timestamp: Optional[float] = None) -> str:
+        """Отметка времени получения списка путёвок (по умолчанию — текущее время)"""
+        if timestamp is None:
+            timestamp = time.time()
+        return datetime.datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
+
+    def get_vouchers_df(
+            self,
+            vouchers: Union[list, pd.DataFrame, VouchersColumns],
+            index: Optional[pd.Index] = None
+    ) -> pd.DataFrame:
+        """
+        Функция формирует DataFrame путёвок с компактными типами полей (см. apply_vouchers_schema).
+        Колоночные буферы путёвок освобождаются по мере переноса в DataFrame.
+
+        :param vouchers: Список путёвок.
+        :param index: Индекс путёвок.
+        """
+        if isinstance(vouchers, pd.DataFrame):
+            source = 'frame'
+        elif isinstance(vouchers, VouchersColumns):
+            source = 'columns'
+        else:
+            source = 'records'
+        with metrics.registry.timer('distribution_dataframe_seconds', source=source):
+            if isinstance(vouchers, pd.DataFrame):
+                df = vouchers
+            elif isinstance(vouchers, VouchersColumns):
+                df = vouchers.to_df(index)
+            else:
+                df = pd.DataFrame(vouchers, index=index)
+            return apply_vouchers_schema(df, self.drop_unused_columns)
+
+    def get_vouchers_columns(self) -> VouchersColumns:
+        """Пустые колоночные буферы путёвок с типами полей списка путёвок"""
+        return VouchersColumns(
+            VOUCHERS_INT_COLUMNS,
+            VOUCHERS_DATE_COLUMNS,
+            VOUCHERS_COLUMNS if self.drop_unused_columns else None
+        )
+
+    def load_vouchers(self, source) -> VouchersColumns:
+        """
+        Функция загружает список путёвок из JSON ({"rows": [...]} или [...]) в колоночные буферы,
+        разбирая путёвки по мере чтения, без промежуточного списка словарей.
+
+        :param source: Путь к файлу, файловый объект (в т.ч. загруженный в Streamlit файл)
+                       или ответ requests, полученный с stream=True.
+        """
+        vouchers = self.get_vouchers_columns()
+        read_vouchers(source, vouchers)
+        return vouchers
+
+    def read_vouchers_page(self, r: requests.Response) -> dict:
+        """
+        Функция разбирает ответ API со страницей списка путёвок.
+
+        :param r: Ответ API (запрос выполнен с stream=True).
+        :return: Страница списка путёвок с ключами total и rows (колоночные буферы путёвок).
+        """
+        vouchers = self.get_vouchers_columns()
+        with r:
+            page = read_vouchers(r, vouchers)
+        page['rows'] = vouchers
+        return page
+
+    def fetch_vouchers(
+            self,
+            filters: dict,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            first_page: Optional[dict] = None
+    ) -> VouchersColumns:
+        """
+        Метод получает все страницы списка путёвок по фильтрам.
+
+        Первая страница запрашивается сразу, чтобы узнать общее кол-во путёвок,
+        остальные страницы запрашиваются параллельно в пуле потоков через одну сессию
+        и собираются в порядке отступов. Каждая страница разбирается сразу в колоночные буферы.
+
+        :param filters: Фильтры списка путёвок.
         :param limit: Максимальное кол-во элементов в одном запросе.
         :param offset: Отступ по списку найденных элементов.
+        :param first_page: Уже полученная первая страница списка путёвок.
         """
-        filters = {
+        limit = int(limit or self.vouchers_page_limit)
+
+        if first_page is None:
+            first_page = self.get_vouchers_page(filters, limit, offset)
+        offsets = range(offset + limit, first_page['total'], limit)
+        with ThreadPoolExecutor(max_workers=self.vouchers_fetch_workers) as executor:
+            # executor.map возвращает страницы в порядке отступов
+            pages = executor.map(lambda page_offset: self.get_vouchers_page(filters, limit, page_offset), offsets)
+
+            vouchers = first_page['rows']
+            for page in pages:
+                vouchers.extend(page['rows'])
+        return vouchers
+
+    def iter_sanatorium_vouchers(self, batch_size: Optional[int] = None) -> Iterator[Tuple[Hashable, pd.DataFrame]]:
+        """
+        Генератор путёвок по санаториям.
+
+        Путёвки запрашиваются пачками санаториев (фильтр sanatorium_id__in), поэтому после
+        получения пачки все путёвки её санаториев уже известны. Следующие пачки
+        запрашиваются в фоне, пока обрабатывается текущая.
+
+        :param batch_size: Кол-во санаториев в одном запросе к API.
+        :return: Пары из ID санатория и его путёвок.
+        """
+        batch_size = batch_size or self.vouchers_batch_size
+        sanatorium_ids = [setting.sanatorium_id for setting in self.settings]
+        batches = deque(sanatorium_ids[idx:idx + batch_size] for idx in range(0, len(sanatorium_ids), batch_size))
+
+        # сквозная нумерация путёвок по всем пачкам
+        total_vouchers = 0
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            def fetch_next_batch():
+                if batches:
+                    return executor.submit(self.fetch_vouchers, self.get_vouchers_filters(batches.popleft()))
+                return None
+
+            future = fetch_next_batch()
+            while future is not None:
+                vouchers = future.result()
+                # следующую пачку запрашиваем, пока распределяется текущая
+                future = fetch_next_batch()
+
+                index = pd.RangeIndex(total_vouchers, total_vouchers + len(vouchers))
+                total_vouchers += len(vouchers)
+                df = self.get_vouchers_df(vouchers, index=index)
+                if df.empty:
+                    continue
+                for sanatorium_id, df_sanatorium in df.groupby('sanatorium_id', sort=False):
+                    yield sanatorium_id, df_sanatorium
+
+    def get_vouchers_filters(self, sanatorium_ids: Optional[List[Hashable]] = None) -> dict:
+        """
+        Фильтры списка путёвок (без постраничной навигации).
+
+        :param sanatorium_ids: ID санаториев (по умолчанию — все санатории из настроек).
+        """
+        return {
             'status__code': self.vouchers_status_code,
-            'limit': limit,
-            'offset': offset,
-            'sanatorium_id__in': self.get_sanatorium_ids,
+            'sanatorium_id__in': (
+                self.get_sanatorium_ids if sanatorium_ids is None else ','.join(map(str, sanatorium_ids))
+            ),
             'date_begin__gte': self.distribution_date[0],
             'date_begin__lte': self.distribution_date[1],
         }
+
+    def get_vouchers_page(self, filters: dict, limit: int, offset: int) -> dict:
+        """
+        Метод запрашивает одну страницу списка путёвок.
+
+        :param filters: Фильтры списка путёвок.
+        :param limit: Максимальное кол-во элементов в одном запросе.
+        :param offset: Отступ по списку найденных элементов.
+        :return: Страница списка путёвок с ключами total и rows (колоночные буферы путёвок).
+        """
+        with metrics.registry.timer('distribution_fetch_page_seconds'):
+            r = self.request_vouchers_page(filters, limit, offset)
+            r.raise_for_status()
+            page = self.read_vouchers_page(r)
+        metrics.registry.inc('distribution_fetch_vouchers_total', len(page['rows']))
+        return page
+
+    def request_vouchers_page(
+            self,
+            filters: dict,
+            limit: int,
+            offset: int,
+            headers: Optional[dict] = None
+    ) -> requests.Response:
+        """
+        Метод выполняет запрос одной страницы списка путёвок.
+        Тело ответа не загружается целиком, а читается блоками при разборе (см. read_vouchers_page).
+
+        :param filters: Фильтры списка путёвок.
+        :param limit: Максимальное кол-во элементов в одном запросе.
+        :param offset: Отступ по списку найденных элементов.
+        :param headers: Дополнительные заголовки запроса.
+        """
         url = urljoin(self.vouchers_url, '/api/v1.0/voucher/')
-        r = requests.get(url, params=filters)
-        if r.status_code == requests.codes.ok:
-            data = r.json()
-            self.vouchers.extend(data['rows'])
-            if data['total'] - len(self.vouchers) > 0:
-                self.get_vouchers(limit=limit, offset=len(self.vouchers) + 1)
+        return self.session.get(url, params=dict(filters, limit=limit, offset=offset), headers=headers, stream=True)
+
+    @property
+    def session(self) -> requests.Session:
+        """HTTP сессия с пулом соединений и повторными запросами при ошибках сервера"""
+        if self._session is None:
+            retries = Retry(
+                total=self.vouchers_fetch_retries,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+            )
+            adapter = HTTPAdapter(pool_maxsize=self.vouchers_fetch_workers, max_retries=retries)
+            self._session = requests.Session()
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+        return self._session
 
     @property
     def get_sanatorium_ids(self):
@@ -582,15 +2861,70 @@ if __name__ == '__main__':
     vouchers_url = os.environ.get('VOUCHERS_URL', 'https://11b16e85-25b8-4ff2-9980-f2c136ddc8b7.mock.pstmn.io')
     status_code = os.environ.get('VOUCHERS_STATUS_CODE', 2)
     page_limit = os.environ.get('VOUCHERS_PAGE_ITEMS', 500)
-
-    d = Distribution(
+    fetch_workers = os.environ.get('VOUCHERS_FETCH_WORKERS', 4)
+    workers = os.environ.get('DISTRIBUTION_WORKERS', 1)
+    cache_dir = os.environ.get('VOUCHERS_CACHE_DIR')
+    cache_ttl = os.environ.get('VOUCHERS_CACHE_TTL', 3600)
+    cache_size = os.environ.get('VOUCHERS_CACHE_SIZE', 1024 ** 3)
+    prefetch_count = os.environ.get('PREFETCH_COUNT', 1)
+    compute_workers = os.environ.get('DISTRIBUTION_COMPUTE_WORKERS', 1)
+    max_pending = os.environ.get('MAX_PENDING_MESSAGES')
+    max_attempts = os.environ.get('MESSAGES_MAX_ATTEMPTS', 2)
+    coalesce_window = os.environ.get('MESSAGES_COALESCE_WINDOW', 0)
+    drop_unused_columns = os.environ.get('VOUCHERS_DROP_UNUSED_COLUMNS', '0') not in ('', '0', 'false', 'False')
+    metrics_port = os.environ.get('METRICS_PORT')
+    metrics_log = os.environ.get('METRICS_LOG', '0') not in ('', '0', 'false', 'False')
+    debug = os.environ.get('DISTRIBUTION_DEBUG', '0') not in ('', '0', 'false', 'False')
+    checkpoint_dir = os.environ.get('DISTRIBUTION_CHECKPOINT_DIR')
+    checkpoint_ttl = os.environ.get('DISTRIBUTION_CHECKPOINT_TTL', 86400)
+    vouchers_stream = os.environ.get('VOUCHERS_STREAM', '0') not in ('', '0', 'false', 'False')
+    batch_size = os.environ.get('VOUCHERS_BATCH_SIZE', 20)
+
+    # метрики собираются, только если указан порт HTTP сервера метрик или включены структурированные логи
+    if metrics_port or metrics_log:
+        metrics.registry.enable(log=metrics_log)
+    if metrics_port:
+        metrics.registry.start_http_server(int(metrics_port))
+
+    role = os.environ.get('DISTRIBUTION_ROLE', 'worker')
+    shards = int(os.environ.get('DISTRIBUTION_SHARDS', 1))
+
+    options = dict(
         ampq_url=ampq_url,
         request_queue=request_queue,
         vouchers_url=vouchers_url,
         vouchers_status_code=status_code,
         vouchers_page_limit=page_limit,
+        vouchers_fetch_workers=fetch_workers,
+        vouchers_stream=vouchers_stream,
+        vouchers_batch_size=batch_size,
+        vouchers_cache=VouchersCache(cache_dir, int(cache_ttl), int(cache_size)) if cache_dir else None,
+        workers=workers,
+        prefetch_count=prefetch_count,
+        compute_workers=compute_workers,
+        max_pending=max_pending,
+        max_attempts=max_attempts,
+        coalesce_window=coalesce_window,
+        drop_unused_columns=drop_unused_columns,
+        debug=debug,
+        checkpoints=Checkpoints(checkpoint_dir, int(checkpoint_ttl)) if checkpoint_dir else None,
     )
 
+    if role == 'coordinator':
+        from sharding import Coordinator
+        d = Coordinator(
+            ampq_url,
+            request_queue,
+            shards,
+            prefetch_count=int(prefetch_count),
+            job_timeout=float(os.environ.get('DISTRIBUTION_JOB_TIMEOUT', 3600))
+        )
+    elif role == 'shard':
+        from sharding import ShardWorker, get_shard_names
+        d = ShardWorker(get_shard_names(shards)[int(os.environ.get('DISTRIBUTION_SHARD', 0))], **options)
+    else:
+        d = Distribution(**options)
+
     try:
         d.start()
     except KeyboardInterrupt:
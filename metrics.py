@@ -0,0 +1,263 @@
+import bisect
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NoReturn, Tuple, List, Optional
+
+# границы корзин гистограмм (в секундах)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Counter(object):
+    """Счётчик Prometheus"""
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+
+    def inc(self, labels: tuple, value: float = 1) -> NoReturn:
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def samples(self) -> List[Tuple[str, tuple, float]]:
+        return [(self.name, labels, value) for labels, value in self.values.items()]
+
+
+class Histogram(object):
+    """Гистограмма Prometheus"""
+    type = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Tuple[str, ...] = (),
+            buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # кол-во наблюдений по корзинам (последняя корзина — +Inf), сумма и кол-во наблюдений
+        self.values = {}
+
+    def observe(self, labels: tuple, value: float) -> NoReturn:
+        counts, total = self.values.get(labels, (None, 0.0))
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.values[labels] = (counts, total + value)
+
+    def samples(self) -> List[Tuple[str, tuple, float]]:
+        samples = []
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((self.name + '_bucket', labels + (('le', format_value(bound)),), cumulative))
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, cumulative))
+        return samples
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry(object):
+    """
+    Реестр метрик распределения.
+
+    Пока сбор метрик выключен, все методы реестра ничего не делают, а timer возвращает
+    общий пустой контекстный менеджер, поэтому инструментирование не замедляет распределение.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        # выводить структурированные логи (JSON строки)
+        self.log_enabled = False
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def enable(self, log: bool = False) -> NoReturn:
+        self.enabled = True
+        self.log_enabled = log
+
+    def disable(self) -> NoReturn:
+        self.enabled = False
+        self.log_enabled = False
+
+    def register(self, metric) -> NoReturn:
+        self._metrics[metric.name] = metric
+
+    def inc(self, name: str, value: float = 1, samples: Optional[list] = None, **labels) -> NoReturn:
+        """
+        Увеличивает счётчик name.
+
+        :param name: Название счётчика.
+        :param value: Приращение.
+        :param samples: Список, в который добавляется приращение вместо счётчика
+                        (для подсчёта в дочерних процессах, см. observe_samples).
+        :param labels: Значения меток.
+        """
+        if self.enabled and samples is not None:
+            samples.append((name, labels, value))
+        elif self.enabled:
+            metric = self._metrics[name]
+            with self._lock:
+                metric.inc(tuple((label, str(labels[label])) for label in metric.labelnames), value)
+
+    def observe(self, name: str, value: float, **labels) -> NoReturn:
+        if self.enabled:
+            metric = self._metrics[name]
+            with self._lock:
+                metric.observe(tuple((label, str(labels[label])) for label in metric.labelnames), value)
+
+    def timer(self, name: str, samples: Optional[list] = None, **labels):
+        """
+        Контекстный менеджер, измеряющий время выполнения блока в гистограмме name.
+
+        :param name: Название гистограммы.
+        :param samples: Список, в который добавляется замер вместо гистограммы
+                        (для замеров в дочерних процессах, см. observe_samples).
+        :param labels: Значения меток.
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return self._timer(name, samples, labels)
+
+    @contextmanager
+    def _timer(self, name: str, samples: Optional[list], labels: dict):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if samples is None:
+                self.observe(name, time.perf_counter() - started, **labels)
+            else:
+                samples.append((name, labels, time.perf_counter() - started))
+
+    def observe_samples(self, samples: List[Tuple[str, dict, float]]) -> NoReturn:
+        """Добавляет в метрики замеры и приращения, сделанные через timer и inc со списком samples"""
+        for name, labels, value in samples:
+            if self._metrics[name].type == Counter.type:
+                self.inc(name, value, **labels)
+            else:
+                self.observe(name, value, **labels)
+
+    def log(self, event: str, **fields) -> NoReturn:
+        """Выводит структурированную строку лога"""
+        if self.log_enabled:
+            print(json.dumps(dict(ts=round(time.time(), 3), event=event, **fields), default=str), flush=True)
+
+    def render(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            for metric in self._metrics.values():
+                lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+                lines.append('# TYPE %s %s' % (metric.name, metric.type))
+                for name, labels, value in metric.samples():
+                    if labels:
+                        name += '{%s}' % ','.join(
+                            '%s="%s"' % (label, label_value.replace('\\', '\\\\').replace('"', '\\"'))
+                            for label, label_value in labels
+                        )
+                    lines.append('%s %s' % (name, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def start_http_server(self, port: int, host: str = '') -> ThreadingHTTPServer:
+        """Запускает HTTP сервер метрик (GET /metrics) в отдельном потоке"""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+
+class NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+# общий реестр метрик процесса
+registry = Registry()
+registry.register(Histogram(
+    'distribution_fetch_page_seconds',
+    'Время получения одной страницы списка путёвок из API.',
+))
+registry.register(Counter(
+    'distribution_fetch_vouchers_total',
+    'Кол-во путёвок, полученных из API.',
+))
+registry.register(Histogram(
+    'distribution_dataframe_seconds',
+    'Время построения DataFrame путёвок.',
+    ('source',),
+))
+registry.register(Histogram(
+    'distribution_stage_seconds',
+    'Время этапа распределения одного санатория по одному направлению.',
+    ('stage', 'direction'),
+))
+registry.register(Histogram(
+    'distribution_sanatorium_seconds',
+    'Время распределения одного санатория по всем направлениям.',
+))
+registry.register(Counter(
+    'distribution_sanatoriums_total',
+    'Кол-во санаториев по результату поиска в кэше результатов.',
+    ('cache',),
+))
+registry.register(Counter(
+    'distribution_correction_steps_total',
+    'Кол-во заездных дней, в которых кол-во путёвок скорректировано под расчётное кол-во за месяц.',
+))
+registry.register(Counter(
+    'distribution_correction_failures_total',
+    'Кол-во месяцев, в которых не удалось распределить расчётное кол-во путёвок.',
+))
+registry.register(Histogram(
+    'distribution_message_seconds',
+    'Время от получения сообщения брокера до его подтверждения.',
+    ('result',),
+))
+registry.register(Counter(
+    'distribution_messages_total',
+    'Кол-во обработанных сообщений брокера.',
+    ('result',),
+))
+
+
+def get_direction_kind(direction: str) -> str:
+    """Направление распределения без номера МСЧ (чтобы не плодить значения метки)"""
+    return 'to_medical_unit' if direction.startswith('to_medical_unit') else direction
+
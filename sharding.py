@@ -0,0 +1,253 @@
+import bisect
+import functools
+import hashlib
+import json
+import uuid
+
+try:
+    import pika
+except ModuleNotFoundError:
+    pass
+
+from typing import NoReturn, List, Dict, Hashable
+
+from distributor import Distribution, SanatoriumSettings, parse_message, json_default
+
+# exchange, через который координатор рассылает задания шардам
+SHARD_EXCHANGE = 'distribution.shards'
+
+
+def get_shard_names(shards: int) -> List[str]:
+    """Имена шардов, они же ключи маршрутизации заданий"""
+    return ['shard-%d' % shard for shard in range(shards)]
+
+
+class HashRing(object):
+    """Кольцо консистентного хэширования: санаторий всегда попадает в один и тот же шард"""
+
+    def __init__(self, nodes: List[str], replicas: int = 100):
+        """
+        :param nodes: Имена шардов.
+        :param replicas: Кол-во точек каждого шарда на кольце.
+        """
+        self._ring = sorted(
+            (self.get_hash('%s#%d' % (node, replica)), node) for node in nodes for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in self._ring]
+
+    @staticmethod
+    def get_hash(key: Hashable) -> int:
+        return int(hashlib.md5(str(key).encode()).hexdigest()[:16], 16)
+
+    def get_node(self, key: Hashable) -> str:
+        idx = bisect.bisect(self._hashes, self.get_hash(key)) % len(self._hashes)
+        return self._ring[idx][1]
+
+
+def merge_results(results: List[dict], sanatorium_ids: List[Hashable]) -> dict:
+    """
+    Функция объединяет результаты распределения шардов в один результат.
+    Путёвки упорядочиваются по санаториям в порядке настроек исходного сообщения,
+    так же, как в ответе одного обработчика (Distribution.get_result).
+
+    :param results: Результаты распределения шардов.
+    :param sanatorium_ids: ID санаториев в порядке настроек.
+    """
+    rows_by_sanatoriums = {}
+    for result in results:
+        for row in result['rows']:
+            rows_by_sanatoriums.setdefault(str(row['sanatorium_id']), []).append(row)
+
+    rows = []
+    for sanatorium_id in sanatorium_ids:
+        rows.extend(rows_by_sanatoriums.pop(str(sanatorium_id), []))
+    return {'total': len(rows), 'rows': rows}
+
+
+class ShardWorker(Distribution):
+    """Обработчик заданий одного шарда (очередь шарда привязана к exchange координатора)"""
+
+    def __init__(self, shard: str, **kwargs):
+        """
+        :param shard: Имя шарда.
+        """
+        self.shard = shard
+        kwargs['request_queue'] = 'distribution.%s' % shard
+        super().__init__(**kwargs)
+
+    def declare_queues(self) -> NoReturn:
+        super().declare_queues()
+        self.channel.exchange_declare(exchange=SHARD_EXCHANGE, exchange_type='direct')
+        self.channel.queue_bind(queue=self.request_queue, exchange=SHARD_EXCHANGE, routing_key=self.shard)
+
+
+class Coordinator(object):
+    """
+    Координатор распределения.
+
+    Делит сообщение с настройками распределения по санаториям между шардами (консистентным
+    хэшированием по sanatorium_id), публикует задания шардам и, когда получены ответы
+    всех шардов, отправляет объединённый результат в reply_to исходного сообщения.
+    """
+
+    def __init__(
+            self,
+            ampq_url: str,
+            request_queue: str,
+            shards: int,
+            prefetch_count: int = 1,
+            job_timeout: float = 3600
+    ):
+        """
+        :param ampq_url: Адрес подключения к серверу RabbitMQ.
+        :param request_queue: Очередь, в которой передаются настройки распределения.
+        :param shards: Кол-во шардов.
+        :param prefetch_count: Кол-во одновременно обрабатываемых сообщений.
+        :param job_timeout: Время (в секундах), в течение которого ожидаются ответы шардов.
+        """
+        assert shards > 0, 'Необходимо указать кол-во шардов.'
+        assert job_timeout > 0, 'Время ожидания ответов шардов должно быть больше нуля.'
+        self.ampq_url = ampq_url
+        self.request_queue = request_queue
+        self.prefetch_count = prefetch_count
+        self.job_timeout = job_timeout
+        self.ring = HashRing(get_shard_names(shards))
+        self.connection = None
+        self.channel = None
+        self.reply_queue = None
+        # задания, ожидающие ответов шардов
+        self.jobs = {}
+
+    def start(self) -> NoReturn:
+        self.connection = pika.BlockingConnection(pika.URLParameters(self.ampq_url))
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue=self.request_queue)
+        self.channel.exchange_declare(exchange=SHARD_EXCHANGE, exchange_type='direct')
+        self.reply_queue = self.channel.queue_declare(queue='', exclusive=True).method.queue
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        self.channel.basic_consume(queue=self.reply_queue, on_message_callback=self.on_reply, auto_ack=True)
+        self.channel.basic_consume(queue=self.request_queue, on_message_callback=self.receiver)
+        self.channel.start_consuming()
+
+    def stop(self) -> NoReturn:
+        self.channel.stop_consuming()
+
+    def split(self, message: dict) -> Dict[str, dict]:
+        """
+        Функция делит настройки распределения по шардам.
+
+        Сценарии используют общий список путёвок всех своих санаториев, поэтому сообщение
+        со сценариями целиком передаётся одному шарду (шарду первого санатория).
+
+        :param message: Разобранное сообщение с настройками распределения.
+        :return: Сообщения для шардов по именам шардов.
+        """
+        if message.get('scenarios') is not None:
+            if not message['settings']:
+                return {}
+            return {
+                self.ring.get_node(message['settings'][0]['sanatorium_id']): {
+                    'scenarios': message['scenarios'],
+                    'rows': message.get('rows', True),
+                    'distribution_date': message['distribution_date'],
+                },
+            }
+
+        parts = {}
+        for settings in message['settings']:
+            shard = self.ring.get_node(settings['sanatorium_id'])
+            parts.setdefault(shard, {'settings': [], 'distribution_date': message['distribution_date']})
+            parts[shard]['settings'].append(settings)
+        return parts
+
+    def receiver(self, ch, method, props, body: bytes):
+        """Функция обработки входящих сообщений с настройками распределения"""
+        print(' [x] Received %r' % props.correlation_id)
+        try:
+            message = parse_message(body)
+            # настройки проверяются до деления по шардам: некорректное сообщение отклоняется сразу,
+            # а не ошибкой в потоке соединения или в одном из шардов
+            sanatorium_ids = [SanatoriumSettings.from_dict(settings).sanatorium_id for settings in message['settings']]
+            for scenario in message.get('scenarios') or []:
+                for settings in scenario['settings']:
+                    SanatoriumSettings.from_dict(settings)
+            parts = self.split(message)
+        except Exception as e:
+            print(' [!] Rejected %r: %s' % (props.correlation_id, e))
+            self.reply(ch, props, {'error': str(e)})
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+        job_id = uuid.uuid4().hex
+        self.jobs[job_id] = {
+            'method': method,
+            'props': props,
+            'sanatorium_ids': sanatorium_ids,
+            'scenarios': message.get('scenarios'),
+            'shards': set(parts.keys()),
+            'results': {},
+            'timer': None,
+        }
+        if not parts:
+            self.finish(ch, job_id)
+            return
+        self.jobs[job_id]['timer'] = self.connection.call_later(
+            self.job_timeout,
+            functools.partial(self.expire, ch, job_id)
+        )
+
+        for shard, part in parts.items():
+            ch.basic_publish(
+                exchange=SHARD_EXCHANGE,
+                routing_key=shard,
+                properties=pika.BasicProperties(
+                    reply_to=self.reply_queue,
+                    correlation_id='%s:%s' % (job_id, shard),
+                    content_type='application/json',
+                ),
+                body=json.dumps(part, default=json_default),
+            )
+
+    def on_reply(self, ch, method, props, body: bytes):
+        """Функция обработки ответов шардов"""
+        job_id, _, shard = (props.correlation_id or '').partition(':')
+        job = self.jobs.get(job_id)
+        if job is None or shard not in job['shards']:
+            return
+        job['results'][shard] = json.loads(body)
+        if len(job['results']) == len(job['shards']):
+            self.finish(ch, job_id)
+
+    def expire(self, ch, job_id: str) -> NoReturn:
+        """Отклоняет исходное сообщение, если не все шарды ответили за job_timeout секунд"""
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return
+        shards = ', '.join(sorted(job['shards'] - set(job['results'])))
+        print(' [!] Timed out %r: no reply from %s' % (job['props'].correlation_id, shards))
+        self.reply(ch, job['props'], {'error': 'Шарды %s не ответили за %s сек.' % (shards, self.job_timeout)})
+        ch.basic_nack(delivery_tag=job['method'].delivery_tag, requeue=False)
+
+    def finish(self, ch, job_id: str) -> NoReturn:
+        """Отправляет объединённый результат и подтверждает исходное сообщение"""
+        job = self.jobs.pop(job_id)
+        if job['timer'] is not None:
+            self.connection.remove_timeout(job['timer'])
+        results = [job['results'][shard] for shard in sorted(job['results'])]
+        errors = [result['error'] for result in results if 'error' in result]
+        if errors:
+            result = {'error': '; '.join(errors)}
+        elif job['scenarios'] is not None:
+            # сценарии обработаны одним шардом
+            result = results[0] if results else {'scenarios': [
+                {'id': scenario['id'], 'total': 0, 'summary': [], 'rows': []} for scenario in job['scenarios']
+            ]}
+        else:
+            result = merge_results(results, job['sanatorium_ids'])
+        self.reply(ch, job['props'], result)
+        ch.basic_ack(delivery_tag=job['method'].delivery_tag)
+        print(' [x] Done %r' % job['props'].correlation_id)
+
+    @staticmethod
+    def reply(ch, props, result: dict) -> bool:
+        return Distribution.reply(ch, props, result)
@@ -1,4 +1,5 @@
-import json
+import hashlib
+import threading
 
 import pandas as pd
 import streamlit as st
@@ -8,6 +9,78 @@ from test_options import TestOptions
 
 st.set_page_config('Алгоритм распределения путёвок', layout='wide')
 
+# кол-во строк на одной странице таблиц
+PAGE_SIZE = 500
+# кол-во загруженных файлов, для которых хранятся результаты распределения
+MAX_FILES = 2
+
+
+@st.cache(allow_output_mutation=True)
+def get_sessions() -> dict:
+    """
+    Хранилище распределений между перезапусками скрипта: по хэшу файла путёвок
+    хранится объект Distribution и результаты последнего распределения.
+    """
+    return {}
+
+
+@st.cache(allow_output_mutation=True)
+def get_sessions_lock() -> threading.Lock:
+    """
+    Блокировка хранилища распределений: скрипт выполняется в отдельном потоке
+    для каждой вкладки браузера, а хранилище общее для всего процесса.
+    """
+    return threading.Lock()
+
+
+def get_session(file_hash: str, vouchers_file) -> dict:
+    with get_sessions_lock():
+        sessions = get_sessions()
+        if file_hash not in sessions:
+            while len(sessions) >= MAX_FILES:
+                sessions.pop(next(iter(sessions)))
+            # путёвки разбираются из файла по мере чтения сразу в колоночные буферы
+            vouchers_file.seek(0)
+            sessions[file_hash] = {
+                'dist': Distribution(
+                    vouchers_file=vouchers_file,
+                    drop_unused_columns=True,
+                    debug=False
+                ),
+                # распределение и результаты файла изменяются только под этой блокировкой
+                'lock': threading.Lock(),
+                'settings': None,
+                'df': None,
+                'control': {},
+                'df_exists': None,
+            }
+        return sessions[file_hash]
+
+
+def distribute(session: dict, settings: list, settings_key: tuple):
+    """Распределяет путёвки файла заново, если настройки изменились (вызывается под блокировкой файла)"""
+    if session['settings'] != settings_key:
+        session['dist'].settings = settings
+        session['settings'] = settings_key
+        session['df'] = session['dist'].dataframe
+        session['control'] = {}
+        session['df_exists'] = None
+
+
+def write_paginated(container, df: pd.DataFrame, key: str):
+    """Выводит таблицу постранично"""
+    pages = max(1, (len(df.index) + PAGE_SIZE - 1) // PAGE_SIZE)
+    page = 1
+    if pages > 1:
+        page = container.number_input(
+            label='Страница (из %d)' % pages,
+            min_value=1,
+            max_value=pages,
+            value=1,
+            key=key
+        )
+    container.write(df.iloc[(page - 1) * PAGE_SIZE:page * PAGE_SIZE])
+
 st.sidebar.header('Распределение путёвок')
 st.sidebar.header('Шаг 1')
 json_file_vouchers = st.sidebar.file_uploader(
@@ -16,8 +89,9 @@ json_file_vouchers = st.sidebar.file_uploader(
     type=['json', 'txt']
 )
 if json_file_vouchers is not None:
-    vouchers_data = json.loads(json_file_vouchers.getvalue())
-    dist = Distribution(vouchers=vouchers_data.get('rows', []))
+    # хэш считается по буферу загруженного файла без копирования его содержимого
+    session = get_session(hashlib.sha1(json_file_vouchers.getbuffer()).hexdigest(), json_file_vouchers)
+    dist = session['dist']
 
     st.sidebar.header('Шаг 2')
     st.sidebar.subheader('Настройка распределения:')
@@ -31,10 +105,6 @@ if json_file_vouchers is not None:
         sanatorium_settings.sanatorium_id = sanatorium_id
         test_options.total_vouchers = total_vouchers
 
-        # выделим срез данных только по текущему санаторию
-        is_sanatorium = dist.df['sanatorium_id'] == sanatorium_id
-        df_sanatorium = dist.df[is_sanatorium].sort_values(by=['date_begin', 'number'])
-
         # выводим данные по санатория
         st.sidebar.success('ID санатория: %d' % sanatorium_id)
         exists_vouchers = st.sidebar.empty()
@@ -93,9 +163,13 @@ if json_file_vouchers is not None:
         st.sidebar.markdown('---')
 
     st.header('Результаты распределения')
-    dist.settings = settings
-    df = dist.dataframe
-    st.write(df)
+    # распределяем заново только при изменении настроек,
+    # при этом пересчитываются только санатории с изменёнными настройками
+    settings_key = tuple(sanatorium_settings.fingerprint for sanatorium_settings in settings)
+    with session['lock']:
+        distribute(session, settings, settings_key)
+        df = session['df']
+    write_paginated(st, df, 'result_page')
 
     st.subheader('Контрольная таблица')
     col1, col2 = st.beta_columns([4, 1])
@@ -105,7 +179,15 @@ if json_file_vouchers is not None:
     directions = ['В санаторий', 'В резерв'] + ['МСЧ %d' % (x + 1) for x in range(test_options.medical_units)]
     direction = col2.radio('Направление распределения:', directions)
 
-    control_table = dist.get_control_df(_directions[directions.index(direction)]).set_index('День заезда')
+    # контрольная таблица считается только для выбранного направления,
+    # данные распределения по месяцам и дням пересчитываются по запросу
+    _direction = _directions[directions.index(direction)]
+    with session['lock']:
+        # настройки могли измениться в другой вкладке с тем же файлом путёвок
+        distribute(session, settings, settings_key)
+        if _direction not in session['control']:
+            session['control'][_direction] = dist.get_control_df(_direction).set_index('День заезда')
+        control_table = session['control'][_direction]
 
     COLUMNS_CHECK = {}
 
@@ -140,5 +222,10 @@ if json_file_vouchers is not None:
         )
     )
 
-    with st.beta_expander('Остаточный список'):
-        st.write(dist.df_exists)
+    if st.checkbox('Остаточный список'):
+        with session['lock']:
+            distribute(session, settings, settings_key)
+            if session['df_exists'] is None:
+                session['df_exists'] = dist.df_exists
+            df_exists = session['df_exists']
+        write_paginated(st, df_exists, 'exists_page')
@@ -0,0 +1,242 @@
+import collections
+import itertools
+import json
+import queue
+import types
+
+# очередь запросов распределения в тестах обработчиков сообщений
+REQUEST_QUEUE = 'request_queue'
+
+
+class UnroutableError(Exception):
+    pass
+
+
+class NackError(Exception):
+    pass
+
+
+class BasicProperties(object):
+    def __init__(
+            self,
+            reply_to=None,
+            correlation_id=None,
+            content_type=None,
+            headers=None,
+            delivery_mode=None,
+            priority=None,
+            expiration=None,
+            message_id=None
+    ):
+        self.reply_to = reply_to
+        self.correlation_id = correlation_id
+        self.content_type = content_type
+        self.headers = headers
+        self.delivery_mode = delivery_mode
+        self.priority = priority
+        self.expiration = expiration
+        self.message_id = message_id
+
+
+class Broker(object):
+    """
+    Брокер сообщений в памяти вместо RabbitMQ для тестов обработчиков сообщений.
+
+    Поддерживает очереди, direct exchange, prefetch, подтверждения, возврат сообщений в очередь
+    (с флагом redelivered) и таймеры соединения. Сообщения доставляются обработчикам
+    при вызове process_data_events соединения, время таймеров виртуальное (см. run_next_timer).
+    """
+
+    def __init__(self):
+        self.queues = collections.defaultdict(collections.deque)
+        self.bindings = collections.defaultdict(list)
+        self.channels = []
+        # очереди, публикация в которые завершается ошибкой брокера
+        self.unroutable = set()
+        self.nacked = set()
+        # тела подтверждённых и окончательно отклонённых сообщений
+        self.acked = []
+        self.rejected = []
+        # опубликованные сообщения: очередь (ключ маршрутизации) и свойства
+        self.published = []
+        self.now = 0.0
+        self.connection = Connection(self)
+
+    def channel(self) -> 'Channel':
+        channel = Channel(self)
+        self.channels.append(channel)
+        return channel
+
+    def publish(self, exchange: str, routing_key: str, properties: BasicProperties, body) -> None:
+        if routing_key in self.unroutable:
+            raise UnroutableError(routing_key)
+        if routing_key in self.nacked:
+            raise NackError(routing_key)
+        self.published.append((routing_key, properties))
+        queues = [routing_key] if exchange == '' else self.bindings[(exchange, routing_key)]
+        for name in queues:
+            self.queues[name].append((properties, body, False))
+
+    def get_replies(self, name: str) -> list:
+        """Тела ответов из очереди (очередь очищается)"""
+        replies = [json.loads(body) for _, body, _ in self.queues[name]]
+        self.queues[name].clear()
+        return replies
+
+    def deliver(self) -> bool:
+        """Доставляет сообщения обработчикам с учётом prefetch, возвращает True, если что-то доставлено"""
+        delivered = False
+        for channel in self.channels:
+            while channel.buffered:
+                delivered = True
+                channel.dispatch(channel.buffered.popleft())
+            for consumer_tag, (name, callback, auto_ack) in list(channel.consumers.items()):
+                while self.queues[name] and channel.can_deliver(auto_ack):
+                    properties, body, redelivered = self.queues[name].popleft()
+                    delivery_tag = next(channel.delivery_tags)
+                    method = types.SimpleNamespace(
+                        delivery_tag=delivery_tag,
+                        redelivered=redelivered,
+                        consumer_tag=consumer_tag
+                    )
+                    if not auto_ack:
+                        channel.unacked[delivery_tag] = (name, properties, body)
+                    channel.buffered.append((consumer_tag, callback, method, properties, body))
+            while channel.buffered:
+                delivered = True
+                channel.dispatch(channel.buffered.popleft())
+        return delivered
+
+
+class Channel(object):
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self.prefetch_count = 0
+        self.consumers = {}
+        self.unacked = {}
+        # сообщения, полученные от брокера, но ещё не переданные обработчику
+        self.buffered = collections.deque()
+        self.delivery_tags = itertools.count(1)
+        self.consuming = False
+        self._consumer_tags = itertools.count(1)
+
+    def can_deliver(self, auto_ack: bool) -> bool:
+        return auto_ack or not self.prefetch_count or len(self.unacked) < self.prefetch_count
+
+    def dispatch(self, delivery) -> None:
+        consumer_tag, callback, method, properties, body = delivery
+        callback(self, method, properties, body)
+
+    def queue_declare(self, queue: str, exclusive: bool = False):
+        if not queue:
+            queue = 'amq.gen-%d' % len(self.broker.queues)
+        self.broker.queues[queue]
+        return types.SimpleNamespace(method=types.SimpleNamespace(queue=queue))
+
+    def exchange_declare(self, exchange: str, exchange_type: str) -> None:
+        pass
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str) -> None:
+        self.broker.bindings[(exchange, routing_key)].append(queue)
+
+    def basic_qos(self, prefetch_count: int) -> None:
+        self.prefetch_count = prefetch_count
+
+    def confirm_delivery(self) -> None:
+        pass
+
+    def basic_consume(self, queue: str, on_message_callback, auto_ack: bool = False) -> str:
+        consumer_tag = 'ctag%d' % next(self._consumer_tags)
+        self.consumers[consumer_tag] = (queue, on_message_callback, auto_ack)
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag: str) -> None:
+        # как в pika: полученные, но не переданные обработчику сообщения возвращаются в очередь
+        self.consumers.pop(consumer_tag, None)
+        for delivery in [delivery for delivery in self.buffered if delivery[0] == consumer_tag]:
+            self.buffered.remove(delivery)
+            self.basic_nack(delivery[2].delivery_tag, requeue=True)
+
+    def start_consuming(self) -> None:
+        self.consuming = True
+        while self.consuming:
+            self.broker.connection.process_data_events(time_limit=1)
+
+    def stop_consuming(self) -> None:
+        self.consuming = False
+
+    def basic_publish(self, exchange: str, routing_key: str, properties: BasicProperties, body) -> None:
+        self.broker.publish(exchange, routing_key, properties, body)
+
+    def basic_ack(self, delivery_tag: int) -> None:
+        _, _, body = self.unacked.pop(delivery_tag)
+        self.broker.acked.append(body)
+
+    def basic_nack(self, delivery_tag: int, requeue: bool = True) -> None:
+        name, properties, body = self.unacked.pop(delivery_tag)
+        if requeue:
+            self.broker.queues[name].appendleft((properties, body, True))
+        else:
+            self.broker.rejected.append(body)
+
+
+class Connection(object):
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self.callbacks = queue.Queue()
+        self.timers = {}
+        # вызывается, когда нет ни сообщений, ни обратных вызовов, ни наступивших таймеров
+        self.on_idle = None
+        self._timer_ids = itertools.count(1)
+
+    def channel(self) -> Channel:
+        return self.broker.channel()
+
+    def add_callback_threadsafe(self, callback) -> None:
+        self.callbacks.put(callback)
+
+    def call_later(self, delay: float, callback) -> int:
+        timer_id = next(self._timer_ids)
+        self.timers[timer_id] = (self.broker.now + delay, callback)
+        return timer_id
+
+    def remove_timeout(self, timer_id: int) -> None:
+        self.timers.pop(timer_id, None)
+
+    def run_timers(self) -> bool:
+        """Выполняет наступившие таймеры, возвращает True, если что-то выполнено"""
+        done = False
+        for timer_id, (due, callback) in sorted(self.timers.items(), key=lambda item: item[1][0]):
+            if due <= self.broker.now and self.timers.pop(timer_id, None) is not None:
+                callback()
+                done = True
+        return done
+
+    def run_next_timer(self) -> bool:
+        """Сдвигает время до ближайшего таймера и выполняет его, возвращает False, если таймеров нет"""
+        if not self.timers:
+            return False
+        self.broker.now = max(self.broker.now, min(due for due, _ in self.timers.values()))
+        return self.run_timers()
+
+    def process_data_events(self, time_limit: float = 0) -> None:
+        """Выполняет наступившие таймеры, доставляет сообщения и ждёт обратные вызовы из других потоков"""
+        if self.run_timers() or self.broker.deliver():
+            return
+        try:
+            callback = self.callbacks.get(timeout=time_limit) if time_limit else self.callbacks.get_nowait()
+        except queue.Empty:
+            if self.on_idle is not None:
+                self.on_idle()
+            return
+        callback()
+
+
+def create_pika(broker: Broker) -> types.ModuleType:
+    """Модуль с интерфейсом pika, подключающийся к брокеру в памяти"""
+    pika = types.ModuleType('pika')
+    pika.BasicProperties = BasicProperties
+    pika.URLParameters = lambda url: url
+    pika.BlockingConnection = lambda parameters: broker.connection
+    pika.exceptions = types.SimpleNamespace(UnroutableError=UnroutableError, NackError=NackError)
+    return pika
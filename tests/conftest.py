@@ -0,0 +1,127 @@
+import collections
+import json
+import os
+import sys
+import warnings
+
+import pytest
+
+# модули сервиса лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+warnings.filterwarnings('ignore', category=FutureWarning)
+
+import distributor  # noqa: E402
+import sharding  # noqa: E402
+from benchmarks.generator import generate_settings, generate_vouchers  # noqa: E402
+from broker_stub import REQUEST_QUEUE, Broker, NackError, UnroutableError, create_pika  # noqa: E402
+from distributor import Distribution  # noqa: E402
+from stub_api import VouchersApi  # noqa: E402
+
+
+@pytest.fixture
+def broker(monkeypatch) -> Broker:
+    """Брокер сообщений в памяти вместо RabbitMQ для обработчиков сообщений и шардов"""
+    broker = Broker()
+    pika = create_pika(broker)
+    monkeypatch.setattr(distributor, 'pika', pika, raising=False)
+    monkeypatch.setattr(sharding, 'pika', pika, raising=False)
+    monkeypatch.setattr(distributor, 'UnroutableError', UnroutableError, raising=False)
+    monkeypatch.setattr(distributor, 'NackError', NackError, raising=False)
+    return broker
+
+
+@pytest.fixture(scope='module')
+def start_api():
+    """
+    Фабрика заглушек API списка путёвок со сгенерированным списком путёвок (в атрибуте df).
+    Заглушки останавливаются после тестов модуля.
+    """
+    apis = []
+
+    def start(sanatoriums: int = 3, vouchers_per_sanatorium: int = 100, **kwargs) -> VouchersApi:
+        df = generate_vouchers(sanatoriums=sanatoriums, vouchers_per_sanatorium=vouchers_per_sanatorium)
+        api = VouchersApi(df.to_dict('records'), **kwargs).start()
+        api.df = df
+        apis.append(api)
+        return api
+
+    yield start
+    for api in apis:
+        api.stop()
+
+
+def get_api_options(api: VouchersApi) -> dict:
+    """Параметры распределения, получающего путёвки из заглушки API"""
+    return dict(
+        ampq_url='amqp://localhost',
+        vouchers_url=api.url,
+        vouchers_status_code=2,
+        vouchers_page_limit=100,
+    )
+
+
+@pytest.fixture(scope='session')
+def api_options():
+    return get_api_options
+
+
+@pytest.fixture(scope='session')
+def create_distribution():
+    """
+    Фабрика распределений. Путёвки — заглушка API (распределение получает путёвки из API
+    и обрабатывает сообщения очереди REQUEST_QUEUE) или список путёвок (DataFrame или список словарей).
+    Без settings настройки формируются по списку путёвок (generate_settings).
+    """
+
+    def create(vouchers, settings: list = None, **kwargs) -> Distribution:
+        if isinstance(vouchers, VouchersApi):
+            df = vouchers.df
+            kwargs = dict(get_api_options(vouchers), request_queue=REQUEST_QUEUE, **kwargs)
+        else:
+            df = vouchers
+            records = vouchers.to_dict('records') if hasattr(vouchers, 'to_dict') else vouchers
+            kwargs = dict(kwargs, vouchers=records)
+        distribution = Distribution(**kwargs)
+        distribution.settings = generate_settings(df) if settings is None else settings
+        return distribution
+
+    return create
+
+
+def get_message_settings(settings: list) -> list:
+    """Настройки санаториев в формате сообщения брокера"""
+    return [
+        {
+            'sanatorium_id': int(item.sanatorium_id),
+            'to_sanatorium': item.to_sanatorium,
+            'to_reserve': item.to_reserve,
+            'to_medical_units': item.to_medical_units,
+        }
+        for item in settings
+    ]
+
+
+@pytest.fixture(scope='session')
+def get_message():
+    """Фабрика тел сообщений брокера с настройками, сформированными по списку путёвок"""
+
+    def get(vouchers, **kwargs) -> bytes:
+        df = vouchers.df if isinstance(vouchers, VouchersApi) else vouchers
+        return json.dumps(dict(kwargs, settings=get_message_settings(generate_settings(df)))).encode()
+
+    return get
+
+
+@pytest.fixture(scope='session')
+def count_plans():
+    """Кол-во распределённых путёвок по направлениям: (ID санатория, статус, организация) — кол-во путёвок"""
+
+    def count(vouchers) -> collections.Counter:
+        return collections.Counter(zip(
+            vouchers.column('sanatorium_id').tolist(),
+            vouchers.statuses.tolist(),
+            vouchers.organizations.tolist(),
+        ))
+
+    return count
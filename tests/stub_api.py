@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from typing import List, Optional
+
+
+class VouchersApi(object):
+    """
+    Локальная заглушка API списка путёвок (GET /?limit=&offset=&sanatorium_id__in=...).
+
+    Страницы с меньшим отступом отвечают дольше, чтобы параллельно запрошенные страницы
+    приходили не по порядку, а первые запросы страниц из fail_offsets завершаются ошибкой 503.
+    """
+
+    def __init__(self, rows: List[dict], fail_offsets: Optional[set] = None, delay: float = 0.005):
+        self.rows = rows
+        self.fail_offsets = set(fail_offsets or ())
+        self.delay = delay
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return 'http://127.0.0.1:%d/' % self._server.server_port
+
+    def start(self) -> 'VouchersApi':
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                api.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_rows(self, query: dict) -> List[dict]:
+        rows = self.rows
+        if query.get('sanatorium_id__in'):
+            sanatorium_ids = set(query['sanatorium_id__in'][0].split(','))
+            rows = [row for row in rows if str(row['sanatorium_id']) in sanatorium_ids]
+        return rows
+
+    def handle(self, handler: BaseHTTPRequestHandler):
+        query = parse_qs(urlparse(handler.path).query)
+        limit, offset = int(query['limit'][0]), int(query['offset'][0])
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = offset in self.fail_offsets
+            self.fail_offsets.discard(offset)
+            if fail:
+                self.failures += 1
+        try:
+            rows = self.get_rows(query)
+            time.sleep(self.delay * (1 + max(0, len(rows) - offset) / max(limit, 1)))
+            if fail:
+                body = b''
+                handler.send_response(503)
+            else:
+                body = json.dumps({'total': len(rows), 'rows': rows[offset:offset + limit]}).encode()
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Content-Length', str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
@@ -0,0 +1,83 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from benchmarks.generator import ARRIVAL_PATTERNS, generate_vouchers
+from distributor import Distribution
+
+
+def get_cases(seed: int, count: int = 500) -> list:
+    """Случайные наборы (кол-во путёвок, расчётное кол-во, кол-во путёвок в заездах или месяцах)"""
+    rnd = np.random.default_rng(seed)
+    cases = []
+    for _ in range(count):
+        capacities = rnd.integers(0, 12, size=rnd.integers(1, 9))
+        if not capacities.sum():
+            continue
+        total = int(rnd.integers(0, capacities.sum() + 1))
+        quotas = total * capacities / capacities.sum()
+        cases.append((total, quotas.tolist(), capacities.tolist()))
+    return cases
+
+
+@pytest.mark.parametrize('apportion', [Distribution.apportion, Distribution.apportion_months])
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_apportion_exact(apportion, seed):
+    """Если путёвок хватает, распределяется ровно total путёвок, не больше кол-ва путёвок в заезде"""
+    for total, quotas, capacities in get_cases(seed):
+        result = apportion(total, quotas, capacities)
+
+        assert sum(result) == total, (total, quotas, capacities, result)
+        assert all(0 <= value <= capacity for value, capacity in zip(result, capacities))
+
+
+@pytest.mark.parametrize('apportion', [Distribution.apportion, Distribution.apportion_months])
+def test_apportion_unreachable(apportion):
+    """Если путёвок не хватает, функция завершается и выделяет все путёвки заездов"""
+    assert apportion(20, [7.0, 7.0, 6.0], [3, 0, 5]) == [3, 0, 5]
+    assert apportion(5, [5.0], [0]) == [0]
+    assert apportion(3, [], []) == []
+
+
+def test_apportion_removes_surplus():
+    """Лишние путёвки (расчётное кол-во больше total) убираются у дней с наибольшим перебором"""
+    result = Distribution.apportion(3, [4.0, 2.5, 2.0], [6, 6, 6])
+
+    assert sum(result) == 3
+    assert all(value >= 0 for value in result)
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_apportion_months_many(seed):
+    """Векторизованный вариант совпадает с apportion_months для каждой строки"""
+    cases = [case for case in get_cases(seed) if len(case[1]) == 4]
+    totals = np.array([total for total, _, _ in cases])
+    quotas = np.array([quotas for _, quotas, _ in cases])
+    capacities = np.array([capacities for _, _, capacities in cases])
+
+    result = Distribution.apportion_months_many(totals, quotas, capacities)
+
+    assert result.tolist() == [Distribution.apportion_months(*case) for case in cases]
+
+
+@pytest.mark.parametrize('arrival_pattern', sorted(ARRIVAL_PATTERNS))
+@pytest.mark.parametrize('seed', [1, 2])
+def test_quotas_met(create_distribution, count_plans, arrival_pattern, seed):
+    """По каждому направлению распределяется ровно кол-во путёвок по настройкам, без предупреждений коррекции"""
+    df = generate_vouchers(
+        sanatoriums=6,
+        vouchers_per_sanatorium=200,
+        arrival_pattern=arrival_pattern,
+        sanatorium_skew=1.0,
+        day_skew=0.5,
+        seed=seed
+    )
+    distribution = create_distribution(df, results_cache_size=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        counts = count_plans(distribution.get_distribute())
+
+    for settings in distribution.settings:
+        for plan in settings.plan:
+            assert counts[(settings.sanatorium_id, plan.status, plan.organization_id)] == plan.quota
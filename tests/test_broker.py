@@ -0,0 +1,169 @@
+import json
+
+import pytest
+
+from broker_stub import REQUEST_QUEUE, BasicProperties, Broker
+from distributor import ATTEMPTS_HEADER, Distribution
+
+
+@pytest.fixture(scope='module')
+def api(start_api):
+    return start_api(sanatoriums=3, vouchers_per_sanatorium=100)
+
+
+def publish(broker: Broker, body: bytes, correlation_id: str, reply_to: str = 'client'):
+    broker.publish('', REQUEST_QUEUE, BasicProperties(reply_to=reply_to, correlation_id=correlation_id), body)
+
+
+def fail(self, body, cancel_event=None):
+    raise RuntimeError('API недоступен')
+
+
+@pytest.fixture
+def run(broker, api, create_distribution):
+    """Обрабатывает сообщения очереди, пока в очереди и в обработке ничего не осталось"""
+
+    def run(distribution: Distribution = None, **kwargs) -> Distribution:
+        distribution = distribution or create_distribution(api, settings=[], **kwargs)
+
+        def on_idle():
+            if not distribution._pending and not broker.connection.run_next_timer():
+                distribution.stop()
+
+        broker.connection.on_idle = on_idle
+        distribution.start()
+        return distribution
+
+    return run
+
+
+@pytest.mark.parametrize('error', ['unroutable', 'nacked'])
+def test_reply_not_published(broker, api, get_message, run, error):
+    """Если брокер не принял ответ, сообщение всё равно подтверждается"""
+    getattr(broker, error).add('client')
+    publish(broker, get_message(api.df), 'request')
+    run()
+
+    assert len(broker.acked) == 1
+    assert not broker.rejected
+    assert not broker.queues[REQUEST_QUEUE]
+
+
+def test_prefetched_messages_retried(broker, api, get_message, run, monkeypatch):
+    """
+    Сообщения, возвращённые в очередь при приостановке получения (redelivered),
+    после первой ошибки обрабатываются повторно, а не отклоняются сразу
+    """
+    attempts = []
+    handle_message = Distribution.handle_message
+
+    def fail_first(self, body, cancel_event=None):
+        correlation_id = json.loads(body)['correlation_id']
+        attempts.append(correlation_id)
+        if attempts.count(correlation_id) == 1:
+            raise RuntimeError('API недоступен')
+        return handle_message(self, body, cancel_event)
+
+    monkeypatch.setattr(Distribution, 'handle_message', fail_first)
+    for idx in range(3):
+        publish(broker, get_message(api.df, correlation_id=idx), str(idx))
+    run(prefetch_count=3, compute_workers=1, max_pending=1)
+
+    assert sorted(attempts) == [0, 0, 1, 1, 2, 2]
+    assert len(broker.acked) == 6
+    assert not broker.rejected
+    assert all('rows' in reply for reply in broker.get_replies('client'))
+
+
+def test_rejected_after_max_attempts(broker, api, get_message, run, monkeypatch):
+    """После max_attempts попыток сообщение отклоняется с текстом ошибки"""
+    monkeypatch.setattr(Distribution, 'handle_message', fail)
+    publish(broker, get_message(api), 'failing')
+    run(max_attempts=3)
+
+    assert len(broker.rejected) == 1
+    assert len(broker.acked) == 2
+    replies = broker.get_replies('client')
+    assert len(replies) == 1 and 'error' in replies[0]
+
+
+@pytest.mark.parametrize('settings', [[{'to_sanatorium': 1}], [1, 2], [{'sanatorium_id': 1, 'to_reserve': 'x'}]])
+def test_invalid_settings_rejected(broker, run, monkeypatch, settings):
+    """Сообщение с некорректными настройками отклоняется сразу, без повторных попыток"""
+    attempts = []
+    monkeypatch.setattr(Distribution, 'handle_message', lambda self, body, cancel_event=None: attempts.append(body))
+    publish(broker, json.dumps({'settings': settings}).encode(), 'invalid')
+    run(max_attempts=3)
+
+    assert not attempts
+    assert len(broker.rejected) == 1
+    assert not broker.acked
+    replies = broker.get_replies('client')
+    assert len(replies) == 1 and 'error' in replies[0]
+
+
+def test_retry_keeps_properties(broker, api, get_message, run, monkeypatch):
+    """Сообщение публикуется заново с теми же свойствами, меняется только заголовок с кол-вом попыток"""
+    monkeypatch.setattr(Distribution, 'handle_message', fail)
+    properties = BasicProperties(
+        reply_to='client',
+        correlation_id='persistent',
+        content_type='application/json',
+        headers={'source': 'ui'},
+        delivery_mode=2,
+        priority=5,
+        expiration='60000',
+        message_id='m1',
+    )
+    broker.publish('', REQUEST_QUEUE, properties, get_message(api))
+    run(max_attempts=2)
+
+    retried = [props for routing_key, props in broker.published if routing_key == REQUEST_QUEUE][1:]
+    assert len(retried) == 1
+    assert retried[0].headers == {'source': 'ui', ATTEMPTS_HEADER: 1}
+    for name in ('reply_to', 'correlation_id', 'content_type', 'delivery_mode', 'priority', 'expiration', 'message_id'):
+        assert getattr(retried[0], name) == getattr(properties, name)
+    assert properties.headers == {'source': 'ui'}
+
+
+@pytest.mark.parametrize('campaign', [
+    {'campaign_id': [1, 2]},
+    {'campaign_id': {'id': 1}},
+    {'campaign_id': True},
+    {'campaign_id': 'a', 'revision': 'second'},
+    {'campaign_id': 'a', 'revision': [2]},
+    {'campaign_id': 'a', 'revision': float('nan')},
+])
+def test_invalid_campaign(broker, api, get_message, run, campaign):
+    """Сообщение с некорректным ID кампании или ревизией распределяется как сообщение без кампании"""
+    publish(broker, get_message(api.df, **campaign), 'request')
+    distribution = run(coalesce_window=1)
+
+    assert len(broker.acked) == 1
+    assert 'rows' in broker.get_replies('client')[0]
+    assert not distribution._campaigns and not distribution._revisions
+
+
+def test_revision_kept_after_campaign_done(broker, api, create_distribution, get_message, run):
+    """Ревизия старше уже распределённой заменяется и после завершения распределения кампании"""
+    distribution = create_distribution(api, settings=[], coalesce_window=1)
+    publish(broker, get_message(api.df, campaign_id='a', revision=2), 'second')
+    run(distribution)
+    assert 'rows' in broker.get_replies('client')[0]
+    assert not distribution._campaigns
+
+    publish(broker, get_message(api.df, campaign_id='a', revision=1), 'first')
+    run(distribution)
+    assert broker.get_replies('client') == [{'superseded': True}]
+    assert not distribution._campaigns
+    assert distribution._revisions == {'a': 2}
+
+
+def test_revisions_bounded(broker, api, get_message, run):
+    """Хранятся ревизии не больше max_campaigns кампаний, первыми удаляются давно не активные"""
+    for campaign_id in ('a', 'b', 'c'):
+        publish(broker, get_message(api.df, campaign_id=campaign_id, revision=1), campaign_id)
+    distribution = run(coalesce_window=1, max_campaigns=2)
+
+    assert len(broker.acked) == 3
+    assert list(distribution._revisions) == ['b', 'c']
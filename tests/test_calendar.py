@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from benchmarks.generator import ARRIVAL_PATTERNS, generate_vouchers
+
+
+def count_days(df: pd.DataFrame) -> pd.Series:
+    """Кол-во путёвок по датам заезда (ГГГГ-ММ-ДД)"""
+    return df.groupby(pd.to_datetime(df['date_begin']).dt.strftime('%Y-%m-%d')).size()
+
+
+def get_months_by_rows(df: pd.DataFrame, vouchers_to_distribute: int) -> dict:
+    """Данные распределения по месяцам, посчитанные по группам путёвок (без округления)"""
+    months = {}
+    for date, count in count_days(df).items():
+        months[date[:7]] = months.get(date[:7], 0) + count
+    return {
+        month: [count, round(count / len(df) * 100), vouchers_to_distribute * (count / len(df))]
+        for month, count in months.items()
+    }
+
+
+def get_days_by_rows(df: pd.DataFrame, months: dict) -> dict:
+    """Данные распределения по заездным дням, посчитанные по группам путёвок (без коррекции)"""
+    days = {}
+    for date, count in count_days(df).items():
+        vouchers_per_arrivals = count / months[date[:7]][0]
+        cnt_vouchers_per_arrival = months[date[:7]][2] * vouchers_per_arrivals
+        cnt_vouchers_per_arrival_int = int(cnt_vouchers_per_arrival)
+        days[date] = [
+            count,
+            vouchers_per_arrivals * 100,
+            cnt_vouchers_per_arrival,
+            cnt_vouchers_per_arrival_int,
+            cnt_vouchers_per_arrival_int + cnt_vouchers_per_arrival_int % 2,
+        ]
+    return days
+
+
+@pytest.mark.parametrize('arrival_pattern', sorted(ARRIVAL_PATTERNS))
+def test_calendar_matches_groups(create_distribution, arrival_pattern):
+    """Кол-во путёвок по месяцам и заездным дням совпадает с подсчётом по группам путёвок"""
+    df = generate_vouchers(sanatoriums=3, vouchers_per_sanatorium=150, arrival_pattern=arrival_pattern, day_skew=0.5)
+    distribution = create_distribution(df)
+
+    for sanatorium_id, sanatorium_vouchers in distribution.get_vouchers_index().items():
+        # первые путёвки санатория уже распределены: дни без оставшихся путёвок в расчёт не попадают
+        sanatorium_vouchers.remove(sanatorium_vouchers.df.index[:40])
+        remaining = sanatorium_vouchers.df
+        calendar = sanatorium_vouchers.calendar
+        quota = len(remaining) // 2
+
+        months = distribution.get_vouchers_per_months(calendar, len(remaining), quota)
+        days = distribution.get_vouchers_per_days(calendar, months)
+
+        expected_months = get_months_by_rows(remaining, quota)
+        assert {month: stat[:3] for month, stat in months.items()} == expected_months
+        assert {date: stat[:5] for date, stat in days.items()} == get_days_by_rows(remaining, expected_months)
+        assert sum(stat[3] for stat in months.values()) == quota
+        assert sum(stat[-1] for stat in days.values()) == quota
@@ -0,0 +1,186 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.generator import generate_vouchers
+from checkpoint import Checkpoint, Checkpoints, RECORD_HEADER
+
+
+def append_results(checkpoint: Checkpoint, count: int) -> list:
+    """Дописывает результаты санаториев 1..count (по count путёвок) и возвращает их"""
+    results = []
+    for sanatorium_id in range(1, count + 1):
+        arrays = (
+            np.arange(sanatorium_id, sanatorium_id + count, dtype=np.int64),
+            np.full(count, sanatorium_id % 4 + 1, dtype=np.int8),
+            np.full(count, -1 if sanatorium_id % 2 else sanatorium_id, dtype=np.int32),
+        )
+        checkpoint.append(sanatorium_id, *arrays)
+        results.append((sanatorium_id, arrays))
+    return results
+
+
+def assert_results(checkpoint: Checkpoint, results: list):
+    assert list(checkpoint.results) == [sanatorium_id for sanatorium_id, _ in results]
+    for sanatorium_id, arrays in results:
+        for restored, expected in zip(checkpoint.results[sanatorium_id], arrays):
+            assert restored.dtype == expected.dtype
+            assert restored.tolist() == expected.tolist()
+
+
+def get_offsets(path: str) -> list:
+    """Смещения концов записей файла контрольной точки"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    records, _ = Checkpoint.read_records(data)
+    offsets = []
+    offset = 0
+    for meta, arrays in records:
+        size, = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size + size + len(arrays[0]) * 13
+        offsets.append(offset)
+    return offsets
+
+
+def test_reopen(tmp_path):
+    """Сохранённые результаты читаются при повторном открытии, новые записи дописываются"""
+    path = str(tmp_path / 'key.checkpoint')
+    checkpoint = Checkpoint(path, 'key').open()
+    results = append_results(checkpoint, 3)
+    checkpoint.close()
+
+    checkpoint = Checkpoint(path, 'key').open()
+    assert_results(checkpoint, results)
+    checkpoint.append(9, np.array([1]), np.array([1]), np.array([9]))
+    checkpoint.close()
+    assert list(Checkpoint(path, 'key').open().results) == [1, 2, 3, 9]
+
+
+@pytest.mark.parametrize('cut', [1, 5, 20])
+def test_truncated_record(tmp_path, cut):
+    """Не дописанная до конца последняя запись отбрасывается, файл обрезается до целых записей"""
+    path = str(tmp_path / 'key.checkpoint')
+    checkpoint = Checkpoint(path, 'key').open()
+    results = append_results(checkpoint, 3)
+    checkpoint.close()
+    offsets = get_offsets(path)
+    with open(path, 'r+b') as f:
+        f.truncate(offsets[-1] - cut)
+
+    checkpoint = Checkpoint(path, 'key').open()
+    assert_results(checkpoint, results[:2])
+    checkpoint.close()
+    assert os.path.getsize(path) == offsets[-2]
+
+
+def test_crc_mismatch(tmp_path):
+    """Запись с неверной контрольной суммой в середине файла отбрасывается вместе со следующими"""
+    path = str(tmp_path / 'key.checkpoint')
+    checkpoint = Checkpoint(path, 'key').open()
+    results = append_results(checkpoint, 3)
+    checkpoint.close()
+    offsets = get_offsets(path)
+    with open(path, 'r+b') as f:
+        # последний байт массивов второго санатория
+        f.seek(offsets[2] - 1)
+        byte = f.read(1)
+        f.seek(offsets[2] - 1)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    checkpoint = Checkpoint(path, 'key').open()
+    assert_results(checkpoint, results[:1])
+    checkpoint.close()
+    assert os.path.getsize(path) == offsets[1]
+
+
+def test_key_mismatch(tmp_path):
+    """Контрольная точка другого распределения не используется и перезаписывается"""
+    path = str(tmp_path / 'key.checkpoint')
+    checkpoint = Checkpoint(path, 'key').open()
+    append_results(checkpoint, 3)
+    checkpoint.close()
+
+    checkpoint = Checkpoint(path, 'other').open()
+    assert checkpoint.results == {}
+    checkpoint.close()
+    assert len(get_offsets(path)) == 1
+    assert Checkpoint(path, 'key').open().results == {}
+
+
+def test_opened_once(tmp_path):
+    """Пока контрольная точка открыта, распределение с тем же ключом её не получает"""
+    checkpoints = Checkpoints(str(tmp_path), ttl=0)
+    checkpoint = checkpoints.open('key')
+    append_results(checkpoint, 2)
+    assert checkpoints.open('key') is None
+    # открытая контрольная точка не удаляется по истечении времени жизни
+    checkpoints.open('other').close()
+    assert sorted(checkpoints.keys()) == ['key', 'other']
+
+    checkpoint.close()
+    checkpoint.close()
+    checkpoint = checkpoints.open('key')
+    assert checkpoint is not None
+    checkpoint.remove()
+    assert checkpoints.keys() == []
+    assert checkpoints.open('key') is not None
+
+
+def test_resume(create_distribution, tmp_path):
+    """Прерванное распределение продолжается с последнего распределённого санатория"""
+    df = generate_vouchers(sanatoriums=5, vouchers_per_sanatorium=100)
+    expected = create_distribution(df, debug=False, results_cache_size=0).get_distribute().to_records()
+    checkpoints = Checkpoints(str(tmp_path))
+
+    interrupted = create_distribution(df, debug=False, results_cache_size=0, checkpoints=checkpoints)
+    distribute_sanatorium = interrupted.distribute_sanatorium
+    distributed = []
+
+    def interrupt(sanatorium_vouchers, settings, debug=None):
+        if len(distributed) == 2:
+            raise KeyboardInterrupt
+        distributed.append(settings.sanatorium_id)
+        return distribute_sanatorium(sanatorium_vouchers, settings, debug)
+
+    interrupted.distribute_sanatorium = interrupt
+    with pytest.raises(KeyboardInterrupt):
+        interrupted.get_distribute()
+    assert len(checkpoints.keys()) == 1
+
+    resumed = create_distribution(df, debug=False, results_cache_size=0, checkpoints=checkpoints)
+    distribute_sanatorium = resumed.distribute_sanatorium
+    resumed_ids = []
+
+    def count(sanatorium_vouchers, settings, debug=None):
+        resumed_ids.append(settings.sanatorium_id)
+        return distribute_sanatorium(sanatorium_vouchers, settings, debug)
+
+    resumed.distribute_sanatorium = count
+    assert resumed.get_distribute().to_records() == expected
+    assert len(resumed_ids) == 3 and not set(resumed_ids) & set(distributed)
+    # контрольная точка завершённого распределения удаляется
+    assert checkpoints.keys() == []
+
+
+def test_same_key_concurrently(create_distribution, tmp_path):
+    """Распределение с ключом уже открытой контрольной точки выполняется без неё и не трогает файл"""
+    df = generate_vouchers(sanatoriums=3, vouchers_per_sanatorium=100)
+    checkpoints = Checkpoints(str(tmp_path))
+    first = create_distribution(df, debug=False, results_cache_size=0, checkpoints=checkpoints)
+    second = create_distribution(df, debug=False, results_cache_size=0, checkpoints=checkpoints)
+    vouchers_index = first.get_vouchers_index()
+    # санатории в том же порядке, что и в get_distribute
+    sanatoriums = [
+        (vouchers_index[sanatorium_id], first.get_sanatorium_setting(sanatorium_id))
+        for sanatorium_id, _ in first.get_sanatoriums.items()
+    ]
+    checkpoint = first.open_checkpoint(sanatoriums)
+    append_results(checkpoint, 1)
+    size = os.path.getsize(checkpoint.path)
+
+    assert second.open_checkpoint(sanatoriums) is None
+    assert second.get_distribute().to_records() == first.get_distribute().to_records()
+    assert checkpoints.keys() == [checkpoint.key]
+    assert os.path.getsize(checkpoint.path) == size
+    checkpoint.close()
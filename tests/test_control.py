@@ -0,0 +1,127 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from benchmarks.generator import generate_settings, generate_vouchers
+from distributor import Distribution
+
+DIRECTIONS = ['to_sanatorium', 'to_reserve', 'to_medical_unit_1']
+
+
+def get_control_rows(vouchers_per_months: list, vouchers_per_days: list) -> list:
+    """Строки контрольной таблицы, посчитанные вложенными циклами по месяцам и дням (как до векторизации)"""
+    rows = []
+    for sanatorium_idx, months in enumerate(vouchers_per_months):
+        for month, month_stat in months.items():
+            month_str = datetime.datetime.strptime(month, '%Y-%m').strftime('%B')
+            rows.append([month_str, '%d%%' % month_stat[1]] + [''] * 10)
+            totals = [0] * 5
+            for date, day_stat in vouchers_per_days[sanatorium_idx].items():
+                if date[:7] == month:
+                    correct = day_stat[5] if len(day_stat) == 6 else day_stat[4]
+                    rows.append([
+                        date, day_stat[0], '', '', day_stat[1], day_stat[2], day_stat[3], day_stat[3],
+                        day_stat[4], day_stat[4], correct, correct - day_stat[0],
+                    ])
+                    totals = [total + value for total, value in zip(totals, day_stat[1:5] + [correct])]
+            rows.append([
+                'ИТОГО %s' % month_str, month_stat[0], month_stat[2], month_stat[3], totals[0], totals[1],
+                totals[2], totals[2], totals[3], totals[3], totals[4], '',
+            ])
+    return rows
+
+
+def assert_rows_equal(df: pd.DataFrame, rows: list):
+    assert len(df.index) == len(rows)
+    for row, expected in zip(df.values.tolist(), rows):
+        assert row == [pytest.approx(value) if isinstance(value, float) else value for value in expected]
+
+
+def count_distributed(distribution: Distribution) -> list:
+    """Подменяет distribute_sanatorium экземпляра и возвращает список ID распределённых санаториев"""
+    calls = []
+    distribute_sanatorium = distribution.distribute_sanatorium
+
+    def counted(sanatorium_vouchers, settings, debug=None):
+        calls.append(settings.sanatorium_id)
+        return distribute_sanatorium(sanatorium_vouchers, settings, debug)
+
+    distribution.distribute_sanatorium = counted
+    return calls
+
+
+def test_control_equals_debug(create_distribution):
+    """Контрольная таблица по запросу совпадает с таблицей по отладочным данным распределения"""
+    df = generate_vouchers(sanatoriums=3, vouchers_per_sanatorium=150)
+    debug = create_distribution(df, debug=True)
+    debug.get_distribute()
+    distribution = create_distribution(df, debug=False)
+    distribution.get_distribute()
+
+    for direction in DIRECTIONS:
+        pd.testing.assert_frame_equal(distribution.get_control_df(direction), debug.get_control_df(direction))
+
+
+def test_control_cached(create_distribution):
+    """Санатории пересчитываются для контрольной таблицы один раз и заново — только после изменения настроек"""
+    df = generate_vouchers(sanatoriums=3, vouchers_per_sanatorium=150)
+    distribution = create_distribution(df, debug=False)
+    distribution.get_distribute()
+    calls = count_distributed(distribution)
+
+    for direction in DIRECTIONS:
+        distribution.get_control_df(direction)
+    distribution.get_sanatorium_control_df(distribution.settings[0].sanatorium_id, 'to_reserve')
+    assert sorted(calls) == sorted(settings.sanatorium_id for settings in distribution.settings)
+
+    settings = generate_settings(df)
+    settings[0].to_reserve -= 1
+    distribution.settings = settings
+    calls.clear()
+    distribution.get_distribute()
+    for direction in DIRECTIONS:
+        distribution.get_control_df(direction)
+    # санаторий с изменёнными настройками распределяется заново и пересчитывается для контрольной таблицы
+    assert calls == [settings[0].sanatorium_id, settings[0].sanatorium_id]
+
+
+def test_control_small_calendar():
+    """Контрольная таблица небольшого календаря (без корректировки в одном из дней)"""
+    vouchers_per_months = [
+        {'2021-01': [6, 60, 3.0, 3], '2021-02': [4, 40, 2.0, 2]},
+        {'2021-03': [2, 100, 1.0, 1]},
+    ]
+    vouchers_per_days = [
+        {
+            '2021-01-05': [4, 66.66666666666667, 2.0, 2, 2, 2],
+            '2021-01-20': [2, 33.333333333333336, 1.0, 1, 2, 1],
+            '2021-02-10': [4, 100.0, 2.0, 2, 2],
+        },
+        {'2021-03-01': [2, 100.0, 1.0, 1, 2, 1]},
+    ]
+    df = Distribution.build_control_df(vouchers_per_months, vouchers_per_days)
+
+    assert_rows_equal(df, get_control_rows(vouchers_per_months, vouchers_per_days))
+    assert df.values.tolist()[:4] == [
+        ['January', '60%', '', '', '', '', '', '', '', '', '', ''],
+        ['2021-01-05', 4, '', '', 66.66666666666667, 2.0, 2, 2, 2, 2, 2, -2],
+        ['2021-01-20', 2, '', '', 33.333333333333336, 1.0, 1, 1, 2, 2, 1, -1],
+        ['ИТОГО January', 6, 3.0, 3, 100.0, 3.0, 3, 3, 4, 4, 3, ''],
+    ]
+
+
+@pytest.mark.parametrize('direction', DIRECTIONS)
+def test_control_matches_rows(create_distribution, direction):
+    """Контрольная таблица совпадает с таблицей, посчитанной вложенными циклами"""
+    df = generate_vouchers(sanatoriums=3, vouchers_per_sanatorium=150, day_skew=0.5)
+    distribution = create_distribution(df, debug=True)
+    distribution.get_distribute()
+
+    assert_rows_equal(
+        distribution.get_control_df(direction),
+        get_control_rows(
+            distribution.dump_vouchers_per_months[direction],
+            distribution.dump_vouchers_per_days[direction]
+        )
+    )
@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks.generator import generate_vouchers
+
+
+@pytest.mark.parametrize('random_state', [2, 7, 27])
+def test_delta_meets_quotas(create_distribution, count_plans, random_state):
+    """После изменения списка путёвок с сохранением распределения квоты санаториев выполняются"""
+    df = generate_vouchers(sanatoriums=6, vouchers_per_sanatorium=300, seed=3)
+    records = df.to_dict('records')
+    distribution = create_distribution(df, debug=False)
+    distribution.get_distribute()
+
+    ids = df.sample(frac=1, random_state=random_state)['id'].tolist()
+    removed = ids[:30]
+    changed = dict(next(record for record in records if record['id'] == ids[30]))
+    changed['number'] = 'X%s' % changed['number']
+    counts = count_plans(distribution.get_distribute_delta([changed], removed))
+
+    for settings in distribution.settings:
+        for plan in settings.plan:
+            key = (settings.sanatorium_id, plan.status, plan.organization_id)
+            assert counts[key] == plan.quota, key
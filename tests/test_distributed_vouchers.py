@@ -0,0 +1,77 @@
+import numpy as np
+
+from benchmarks.generator import generate_vouchers
+from distributor import DistributedVouchers, VoucherStatus
+
+
+def get_rows_table(df, records: list) -> list:
+    """Таблица распределённых путёвок, построенная по строкам (как до колоночного представления)"""
+    vouchers = df.set_index('id')
+    rows = []
+    for record in records:
+        voucher = vouchers.loc[record['id']]
+        if record['status'] == VoucherStatus.TO_SANATORIUM:
+            status = 'В санаторий'
+        elif record['status'] == VoucherStatus.TO_RESERVE:
+            status = 'В резерв'
+        elif record['status'] == VoucherStatus.TO_MEDICAL_UNIT:
+            status = 'В МСЧ'
+        else:
+            status = 'Куда-то'
+        rows.append([
+            record['id'],
+            record['sanatorium_id'],
+            record['organization_id'],
+            voucher['number'],
+            voucher['date_begin'],
+            voucher['date_end'],
+            voucher['duration'],
+            voucher['arrival_number'],
+            status,
+        ])
+    return rows
+
+
+def test_dataframe_matches_rows(create_distribution):
+    """Таблица колоночного результата совпадает с таблицей, построенной по строкам"""
+    df = generate_vouchers(sanatoriums=4, vouchers_per_sanatorium=150)
+    distribution = create_distribution(df, results_cache_size=0)
+    vouchers = distribution.get_distribute()
+
+    assert vouchers.statuses.dtype == np.int8
+    assert vouchers.organizations.dtype == np.int32
+    assert set(vouchers.statuses.tolist()) == {
+        VoucherStatus.TO_SANATORIUM, VoucherStatus.TO_RESERVE, VoucherStatus.TO_MEDICAL_UNIT
+    }
+    table = distribution.dataframe
+    assert table.index.tolist() == list(range(1, len(vouchers) + 1))
+    assert table.values.tolist() == get_rows_table(vouchers.source, vouchers.to_records())
+
+
+def test_status_labels():
+    """Названия статусов одинаковы для отдельного статуса и массива статусов"""
+    statuses = np.array([
+        VoucherStatus.TO_SANATORIUM,
+        VoucherStatus.TO_RESERVE,
+        VoucherStatus.TO_EXCHANGE,
+        VoucherStatus.TO_MEDICAL_UNIT,
+    ], dtype=np.int8)
+    assert VoucherStatus.get_labels(statuses).tolist() == [
+        VoucherStatus.get_label(status) for status in statuses.tolist()
+    ] == ['В санаторий', 'В резерв', 'Куда-то', 'В МСЧ']
+
+
+def test_organization_ids():
+    """Путёвки без организации (резерв) отдаются с организацией None"""
+    df = generate_vouchers(sanatoriums=1, vouchers_per_sanatorium=3)
+    vouchers = DistributedVouchers(
+        df,
+        np.array([2, 0], dtype=np.intp),
+        np.array([VoucherStatus.TO_RESERVE, VoucherStatus.TO_SANATORIUM], dtype=np.int8),
+        np.array([DistributedVouchers.NO_ORGANIZATION, 7], dtype=np.int32),
+    )
+    assert vouchers.to_records() == [
+        {'id': df['id'][2], 'sanatorium_id': df['sanatorium_id'][2], 'status': 2, 'organization_id': None},
+        {'id': df['id'][0], 'sanatorium_id': df['sanatorium_id'][0], 'status': 1, 'organization_id': 7},
+    ]
+    assert vouchers.take(np.array([1, 0])).to_records() == vouchers.to_records()[::-1]
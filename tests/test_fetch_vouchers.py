@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+PAGE_LIMIT = 100
+
+
+@pytest.fixture
+def fetch(start_api, create_distribution):
+    """Получает список путёвок из новой заглушки API, возвращает распределение, заглушку и время получения"""
+
+    def fetch(workers: int, fail_offsets=()) -> tuple:
+        api = start_api(sanatoriums=5, vouchers_per_sanatorium=400, fail_offsets=fail_offsets)
+        distribution = create_distribution(
+            api,
+            vouchers_page_limit=PAGE_LIMIT,
+            vouchers_fetch_workers=workers,
+            vouchers_fetch_retries=3,
+        )
+        started = time.perf_counter()
+        distribution.get_vouchers()
+        return distribution, api, time.perf_counter() - started
+
+    return fetch
+
+
+def test_pages_in_offset_order(fetch):
+    """Страницы, полученные параллельно и не по порядку, собираются в порядке отступов"""
+    distribution, api, seconds = fetch(workers=4)
+    pages = api.requests
+    print('\n [x] %d pages, %.1f pages/sec, max in flight %d' % (pages, pages / seconds, api.max_in_flight))
+
+    assert pages == len(api.rows) // PAGE_LIMIT
+    assert api.max_in_flight > 1
+    assert distribution.df['id'].tolist() == api.df['id'].tolist()
+
+
+def test_pages_retried(fetch):
+    """Страницы, на которые API ответил ошибкой, запрашиваются повторно"""
+    fail_offsets = {0, PAGE_LIMIT * 3, PAGE_LIMIT * 7}
+    distribution, api, _ = fetch(workers=4, fail_offsets=fail_offsets)
+
+    assert api.failures == len(fail_offsets)
+    assert api.requests == len(api.rows) // PAGE_LIMIT + len(fail_offsets)
+    assert distribution.df['id'].tolist() == api.df['id'].tolist()
+
+
+def test_parallel_faster_than_sequential(fetch):
+    """Пропускная способность (страниц в секунду) с пулом потоков выше, чем при последовательных запросах"""
+    _, _, sequential = fetch(workers=1)
+    _, api, parallel = fetch(workers=4)
+    print('\n [x] pages/sec: sequential %.1f, parallel %.1f' % (api.requests / sequential, api.requests / parallel))
+
+    assert parallel < sequential
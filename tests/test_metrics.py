@@ -0,0 +1,101 @@
+import pytest
+
+import metrics
+from benchmarks.generator import generate_vouchers
+
+CORRECTION_METRICS = ('distribution_correction_steps_total', 'distribution_correction_failures_total')
+
+
+@pytest.fixture
+def registry(monkeypatch) -> metrics.Registry:
+    """Общий реестр метрик процесса со включённым сбором метрик и пустыми значениями метрик"""
+    for metric in metrics.registry._metrics.values():
+        monkeypatch.setattr(metric, 'values', {})
+    metrics.registry.enable()
+    yield metrics.registry
+    metrics.registry.disable()
+
+
+def get_values(registry: metrics.Registry, names: tuple) -> dict:
+    return {name: dict(registry._metrics[name].values) for name in names}
+
+
+def test_render():
+    """Метрики выводятся в текстовом формате Prometheus"""
+    registry = metrics.Registry()
+    registry.register(metrics.Counter('requests_total', 'Кол-во запросов.', ('result',)))
+    registry.register(metrics.Histogram('request_seconds', 'Время запроса.', buckets=(0.1, 1)))
+    registry.enable()
+    registry.inc('requests_total', result='ok')
+    registry.inc('requests_total', 2, result='a "b"\\c')
+    registry.observe('request_seconds', 0.5)
+    registry.observe('request_seconds', 3)
+
+    assert registry.render() == '\n'.join([
+        '# HELP requests_total Кол-во запросов.',
+        '# TYPE requests_total counter',
+        'requests_total{result="ok"} 1',
+        'requests_total{result="a \\"b\\"\\\\c"} 2',
+        '# HELP request_seconds Время запроса.',
+        '# TYPE request_seconds histogram',
+        'request_seconds_bucket{le="0.1"} 0',
+        'request_seconds_bucket{le="1"} 1',
+        'request_seconds_bucket{le="+Inf"} 2',
+        'request_seconds_sum 3.5',
+        'request_seconds_count 2',
+    ]) + '\n'
+
+
+def test_disabled_registry():
+    """Пока сбор метрик выключен, реестр ничего не считает, а timer возвращает общий пустой менеджер"""
+    registry = metrics.Registry()
+    registry.register(metrics.Counter('requests_total', 'Кол-во запросов.'))
+    registry.register(metrics.Histogram('request_seconds', 'Время запроса.'))
+    samples = []
+
+    assert registry.timer('request_seconds') is metrics.NULL_TIMER
+    assert registry.timer('request_seconds', samples) is metrics.NULL_TIMER
+    with registry.timer('request_seconds', samples):
+        pass
+    registry.inc('requests_total')
+    registry.inc('requests_total', samples=samples)
+    registry.observe('request_seconds', 1)
+
+    assert samples == []
+    assert registry.render() == '\n'.join([
+        '# HELP requests_total Кол-во запросов.',
+        '# TYPE requests_total counter',
+        '# HELP request_seconds Время запроса.',
+        '# TYPE request_seconds histogram',
+    ]) + '\n'
+
+
+def test_samples():
+    """Замеры и приращения, сохранённые в список, добавляются в метрики через observe_samples"""
+    registry = metrics.Registry()
+    registry.register(metrics.Counter('requests_total', 'Кол-во запросов.', ('result',)))
+    registry.register(metrics.Histogram('request_seconds', 'Время запроса.'))
+    registry.enable()
+    samples = []
+    with registry.timer('request_seconds', samples):
+        pass
+    registry.inc('requests_total', 3, samples, result='ok')
+
+    assert registry._metrics['requests_total'].values == {}
+    registry.observe_samples(samples)
+    assert registry._metrics['requests_total'].values == {(('result', 'ok'),): 3}
+    assert registry._metrics['request_seconds'].values[()][0][-1] == 0
+
+
+def test_correction_metrics_from_workers(create_distribution, registry):
+    """Счётчики корректировок из дочерних процессов попадают в метрики основного процесса"""
+    df = generate_vouchers(sanatoriums=4, vouchers_per_sanatorium=150, day_skew=0.5)
+    create_distribution(df, results_cache_size=0, workers=1).get_distribute()
+    expected = get_values(registry, CORRECTION_METRICS)
+    assert expected['distribution_correction_steps_total'][()] > 0
+
+    for metric in registry._metrics.values():
+        metric.values.clear()
+    create_distribution(df, results_cache_size=0, workers=2).get_distribute()
+    assert get_values(registry, CORRECTION_METRICS) == expected
+    assert registry._metrics['distribution_sanatoriums_total'].values[(('cache', 'miss'),)] == 4
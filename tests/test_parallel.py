@@ -0,0 +1,36 @@
+import pytest
+
+from benchmarks.generator import generate_vouchers
+from distributor import Distribution
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+@pytest.mark.parametrize('debug', [False, True])
+def test_parallel_equals_sequential(create_distribution, workers, debug):
+    """Распределение санаториев в пуле процессов совпадает с распределением в основном процессе"""
+    df = generate_vouchers(sanatoriums=7, vouchers_per_sanatorium=80, sanatorium_skew=1.0)
+    sequential = create_distribution(df, debug=debug, results_cache_size=0)
+    expected = sequential.get_distribute()
+    parallel = create_distribution(df, debug=debug, results_cache_size=0, workers=workers)
+
+    assert parallel.get_distribute().to_records() == expected.to_records()
+    if debug:
+        assert parallel.dump_vouchers_per_days == sequential.dump_vouchers_per_days
+
+
+@pytest.mark.parametrize('sizes, workers', [
+    ([100, 1, 1, 1, 50, 3], 2),
+    ([5] * 10, 3),
+    ([1], 4),
+    ([0, 0, 7], 2),
+])
+def test_chunks(sizes, workers):
+    """Каждый санаторий попадает ровно в одну группу, крупные санатории — первыми"""
+    chunks = Distribution.get_chunks(sizes, workers)
+    positions = [position for chunk in chunks for position in chunk]
+
+    assert sorted(positions) == list(range(len(sizes)))
+    assert [sizes[position] for position in positions] == sorted(sizes, reverse=True)
+    chunk_size = max(1, sum(sizes) // (workers * 4))
+    # все группы, кроме последней, набирают не меньше chunk_size путёвок
+    assert all(sum(sizes[position] for position in chunk) >= chunk_size for chunk in chunks[:-1])
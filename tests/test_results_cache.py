@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.generator import generate_settings, generate_vouchers
+from distributor import SanatoriumVouchers
+
+
+def test_nested_fields(create_distribution):
+    """Вложенные объекты в полях путёвки не мешают кэшу результатов и не влияют на его ключ"""
+    df = generate_vouchers(sanatoriums=3, vouchers_per_sanatorium=100)
+    records = [dict(record, tourist={'name': 'x'}) for record in df.to_dict('records')]
+    distribution = create_distribution(records, generate_settings(df))
+    expected = distribution.get_distribute().to_records()
+    assert len(distribution.results_cache) == 3
+
+    records = [dict(record, tourist={'name': 'y'}) for record in records]
+    changed = create_distribution(records, generate_settings(df))
+    changed.results_cache = distribution.results_cache
+    changed.results_cache.hits = 0
+    assert changed.get_distribute().to_records() == expected
+    assert changed.results_cache.hits == 3
+
+
+def test_unhashable_fingerprint():
+    """Если поля путёвок не удалось хэшировать, отпечатка (и ключа кэша) нет"""
+    df = pd.DataFrame({'id': [1, 2], 'sanatorium_id': [1, 1], 'number': [{'series': 'A'}, {'series': 'B'}]})
+    vouchers = SanatoriumVouchers(df, np.array(['2022-01-01', '2022-01-02'], dtype='datetime64[D]'))
+
+    assert vouchers.fingerprint is None
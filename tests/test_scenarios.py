@@ -0,0 +1,44 @@
+import pytest
+
+from benchmarks.generator import ARRIVAL_PATTERNS, generate_settings, generate_vouchers
+
+
+def get_scenarios(df) -> list:
+    """Сценарии настроек: обычные, с квотами больше путёвок санатория, без части санаториев и с повтором санатория"""
+    oversubscribed = generate_settings(df, to_sanatorium=0.7, to_reserve=0.4, to_medical_unit=0.2)
+    partial = generate_settings(df, medical_units=1, to_sanatorium=0.3)[1:]
+    repeated = generate_settings(df, medical_units=0)
+    return [
+        generate_settings(df),
+        oversubscribed,
+        partial,
+        repeated + generate_settings(df, medical_units=3, to_sanatorium=0.1),
+        generate_settings(df, to_sanatorium=2.0, to_reserve=1.0),
+    ]
+
+
+@pytest.mark.parametrize('arrival_pattern', sorted(ARRIVAL_PATTERNS))
+def test_scenarios_equal_distribute(create_distribution, count_plans, arrival_pattern):
+    """Результат каждого сценария совпадает с get_distribute с настройками сценария"""
+    df = generate_vouchers(sanatoriums=4, vouchers_per_sanatorium=150, arrival_pattern=arrival_pattern, day_skew=0.5)
+    scenarios = get_scenarios(df)
+    distribution = create_distribution(df, results_cache_size=0)
+    results = distribution.get_distribute_scenarios(scenarios)
+    assert len(results) == len(scenarios)
+
+    for scenario, result in zip(scenarios, results):
+        expected = create_distribution(df, scenario, results_cache_size=0).get_distribute()
+        assert result.vouchers.to_records() == expected.to_records()
+
+        # сводка сценария считает распределённые путёвки по тем же направлениям
+        counts = count_plans(expected)
+        for settings, (_, row) in zip(
+                [settings for settings in result.settings for _ in settings.plan],
+                result.summary.iterrows()
+        ):
+            plan = next(plan for plan in settings.plan if plan.direction == row['direction'])
+            assert row['distributed'] == counts[(settings.sanatorium_id, plan.status, plan.organization_id)]
+
+    # квоты сценариев с нехваткой путёвок выполнить нельзя
+    for result in results[1], results[4]:
+        assert result.summary['distributed'].sum() < result.summary['requested'].sum()
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.generator import generate_vouchers
+from distributor import apply_vouchers_schema
+
+
+def test_schema_dtypes():
+    """Поля путёвок приводятся к компактным типам без изменения значений"""
+    df = generate_vouchers(sanatoriums=3, vouchers_per_sanatorium=50)
+    df.loc[::2, 'organization_id'] = 5
+    df['payload'] = [{'nested': [position]} for position in range(len(df))]
+    typed = apply_vouchers_schema(df)
+
+    assert typed['id'].dtype == np.int32
+    assert typed['sanatorium_id'].dtype == np.int32
+    assert typed['organization_id'].dtype == pd.Int32Dtype()
+    assert typed['duration'].dtype == np.int16
+    assert typed['arrival_number'].dtype == np.int16
+    assert pd.api.types.is_datetime64_any_dtype(typed['date_begin'])
+    assert pd.api.types.is_datetime64_any_dtype(typed['date_end'])
+    assert typed['payload'].tolist() == df['payload'].tolist()
+
+    for column in ('id', 'sanatorium_id', 'duration', 'arrival_number'):
+        assert typed[column].tolist() == df[column].tolist(), column
+    assert typed['organization_id'].astype(object).where(typed['organization_id'].notna(), None).tolist() == \
+        df['organization_id'].tolist()
+    assert typed['date_begin'].dt.strftime('%Y-%m-%d').tolist() == df['date_begin'].tolist()
+    # поля с уже приведёнными типами не копируются
+    assert apply_vouchers_schema(typed) is typed
+
+
+def test_schema_special_ids():
+    """Нечисловые ID хранятся категориями, ID вне диапазона int32 — в int64"""
+    df = pd.DataFrame({
+        'id': [2 ** 40, 1, 2],
+        'sanatorium_id': ['a', 'b', 'a'],
+        'number': ['1', '2', '3'],
+        'payload': [1, 2, 3],
+    })
+    typed = apply_vouchers_schema(df, drop_unused_columns=True)
+
+    assert list(typed.columns) == ['id', 'sanatorium_id', 'number']
+    assert typed['id'].dtype == np.int64
+    assert typed['id'].tolist() == df['id'].tolist()
+    assert typed['sanatorium_id'].dtype == 'category'
+    assert typed['sanatorium_id'].tolist() == ['a', 'b', 'a']
+
+
+def test_schema_keeps_results(create_distribution):
+    """Результат распределения не зависит от типов полей и удаления неиспользуемых полей"""
+    df = generate_vouchers(sanatoriums=4, vouchers_per_sanatorium=150)
+    raw = df.astype(object)
+    raw['payload'] = 'x'
+    expected = create_distribution(df, results_cache_size=0).get_distribute().to_records()
+
+    for drop_unused_columns in (False, True):
+        distribution = create_distribution(raw, results_cache_size=0, drop_unused_columns=drop_unused_columns)
+        assert distribution.get_distribute().to_records() == expected
@@ -0,0 +1,76 @@
+import pytest
+
+from distributor import DirectionPlan, DistributedVouchers, Distribution, SanatoriumSettings, Settings, VoucherStatus
+
+
+def create_settings(sanatorium_id: int, to_sanatorium: int = 10, medical_units: dict = None) -> Settings:
+    settings = Settings()
+    settings.sanatorium_id = sanatorium_id
+    settings.to_sanatorium = to_sanatorium
+    settings.to_reserve = 4
+    settings.to_medical_units = {2: 3, 1: 1} if medical_units is None else medical_units
+    return settings
+
+
+def test_plan():
+    """План распределения составляется по настройкам в порядке распределения"""
+    settings = SanatoriumSettings.from_dict({
+        'sanatorium_id': 7,
+        'to_sanatorium': '10',
+        'to_reserve': 4,
+        # ключи МСЧ в сообщении брокера — строки
+        'to_medical_units': {'2': 3, '1': 1},
+    })
+
+    assert settings.plan == (
+        DirectionPlan('to_sanatorium', VoucherStatus.TO_SANATORIUM, 7, 10),
+        DirectionPlan('to_reserve', VoucherStatus.TO_RESERVE, DistributedVouchers.NO_ORGANIZATION, 4),
+        DirectionPlan('to_medical_unit_2', VoucherStatus.TO_MEDICAL_UNIT, 2, 3),
+        DirectionPlan('to_medical_unit_1', VoucherStatus.TO_MEDICAL_UNIT, 1, 1),
+    )
+    assert settings.directions == ['to_sanatorium', 'to_reserve', 'to_medical_unit_2', 'to_medical_unit_1']
+    assert settings.fingerprint == create_settings(7).fingerprint
+    assert SanatoriumSettings.adapt(create_settings(7)) == settings
+    assert SanatoriumSettings.adapt(settings) is settings
+
+
+def test_immutable():
+    """Проверенные настройки не изменяются после создания"""
+    settings = SanatoriumSettings.adapt(create_settings(7))
+    with pytest.raises(AttributeError):
+        settings.to_sanatorium = 1
+    with pytest.raises(AttributeError):
+        settings.plan[0].quota = 1
+    assert isinstance(settings.plan, tuple)
+    hash(settings)
+
+
+@pytest.mark.parametrize('data', [
+    [],
+    {'to_sanatorium': 1},
+    {'sanatorium_id': 1, 'to_sanatorium': -1},
+    {'sanatorium_id': 1, 'to_sanatorium': 1.5},
+    {'sanatorium_id': 1, 'to_reserve': 'x'},
+    {'sanatorium_id': 1, 'to_medical_units': [1, 2]},
+    {'sanatorium_id': 1, 'to_medical_units': {'1': 1, 1: 2}},
+    {'sanatorium_id': 1, 'to_medical_units': {'a': 1}},
+])
+def test_invalid(data):
+    with pytest.raises(AssertionError):
+        SanatoriumSettings.from_dict(data)
+
+
+def test_lookup():
+    """Настройки индексируются по санаториям при установке, при повторе санатория используются первые"""
+    distribution = Distribution(vouchers=[])
+    distribution.settings = [create_settings(1), create_settings(2), create_settings(1, to_sanatorium=99)]
+    first, second, repeated = distribution.settings
+
+    assert all(isinstance(settings, SanatoriumSettings) for settings in distribution.settings)
+    assert distribution.get_sanatorium_setting(1) is first
+    assert distribution.get_sanatorium_setting(2) is second
+    assert distribution.get_sanatorium_setting(3) is None
+    assert repeated.to_sanatorium == 99
+    # поиск не проходит по списку настроек
+    distribution._settings = None
+    assert distribution.get_sanatorium_setting(1) is first
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from broker_stub import REQUEST_QUEUE, BasicProperties
+from sharding import Coordinator, ShardWorker, get_shard_names
+
+SHARDS = 3
+
+
+@pytest.fixture(scope='module')
+def api(start_api):
+    return start_api(sanatoriums=6, vouchers_per_sanatorium=100)
+
+
+@pytest.fixture
+def run(broker, api, api_options):
+    """
+    Публикует сообщение координатору и обрабатывает сообщения, пока не останется ни сообщений,
+    ни ожидающих заданий. Шарды обрабатывают задания в потоке соединения.
+    Возвращает координатор и ответы на сообщение.
+    """
+
+    def run(body: bytes, shards: list) -> tuple:
+        for shard in shards:
+            worker = ShardWorker(shard, **api_options(api))
+            worker.connection = broker.connection
+            worker.channel = broker.channel()
+            worker.declare_queues()
+            worker.resume_consuming()
+
+        coordinator = Coordinator('amqp://localhost', REQUEST_QUEUE, SHARDS, job_timeout=60)
+        broker.connection.on_idle = lambda: broker.connection.run_next_timer() or coordinator.stop()
+        broker.publish('', REQUEST_QUEUE, BasicProperties(reply_to='client', correlation_id='request'), body)
+        coordinator.start()
+        return coordinator, broker.get_replies('client')
+
+    return run
+
+
+def test_sharded_equals_single(broker, api, create_distribution, get_message, run):
+    """Результат распределения по шардам совпадает с распределением одним обработчиком"""
+    body = get_message(api)
+    coordinator, replies = run(body, get_shard_names(SHARDS))
+    expected = create_distribution(api, settings=[]).handle_message(body)
+
+    assert len(replies) == 1
+    assert replies[0]['total'] == expected['total']
+    # путёвки в ответе упорядочены по санаториям в порядке настроек при любом режиме работы
+    assert replies[0]['rows'] == json.loads(json.dumps(expected['rows']))
+    # подтверждены исходное сообщение и задания всех шардов
+    shards = {coordinator.ring.get_node(item['sanatorium_id']) for item in json.loads(body)['settings']}
+    assert len(broker.acked) == 1 + len(shards)
+    assert not broker.rejected
+    assert not coordinator.jobs
+
+
+@pytest.mark.parametrize('settings', [[{'to_sanatorium': 1}], [1, 2], [{'sanatorium_id': 1, 'to_reserve': 'x'}]])
+def test_invalid_settings(broker, run, settings):
+    """Сообщение с некорректными настройками отклоняется координатором, задания шардам не публикуются"""
+    coordinator, replies = run(json.dumps({'settings': settings}).encode(), [])
+
+    assert len(replies) == 1 and 'error' in replies[0]
+    assert len(broker.rejected) == 1
+    assert not coordinator.jobs
+    assert not any(broker.queues['distribution.%s' % shard] for shard in get_shard_names(SHARDS))
+
+
+def test_shard_timeout(broker, api, get_message, run):
+    """Если шард не ответил за job_timeout секунд, сообщение отклоняется с текстом ошибки"""
+    shards = get_shard_names(SHARDS)
+    coordinator, replies = run(get_message(api), shards[:-1])
+
+    assert len(replies) == 1 and shards[-1] in replies[0]['error']
+    assert len(broker.rejected) == 1
+    assert not coordinator.jobs
+    assert broker.now >= coordinator.job_timeout
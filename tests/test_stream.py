@@ -0,0 +1,63 @@
+import pytest
+
+from benchmarks.generator import generate_settings
+
+
+@pytest.fixture(scope='module')
+def api(start_api):
+    return start_api(sanatoriums=5, vouchers_per_sanatorium=200)
+
+
+@pytest.fixture
+def create_stream(create_distribution):
+    def create(api, settings: list, **kwargs):
+        return create_distribution(api, settings, vouchers_batch_size=2, results_cache_size=0, **kwargs)
+
+    return create
+
+
+def order(record: dict) -> tuple:
+    return record['sanatorium_id'], record['status'], str(record['organization_id']), record['id']
+
+
+def test_stream_equals_full(api, create_stream):
+    """Распределение пачками санаториев совпадает с распределением полного списка путёвок"""
+    settings = generate_settings(api.df)
+    full = create_stream(api, settings)
+    full.get_vouchers()
+    expected = full.get_distribute()
+
+    stream = create_stream(api, settings)
+    vouchers = stream.get_distribute_stream()
+
+    # санатории распределяются в порядке настроек, а не в порядке списка путёвок
+    assert sorted(vouchers.to_records(), key=order) == sorted(expected.to_records(), key=order)
+    assert sorted(stream.df_exists['ID']) == sorted(full.df_exists['ID'])
+    # от полученных санаториев хранятся только ID путёвок и санаториев
+    assert list(vouchers.source.columns) == ['id', 'sanatorium_id']
+    assert len(vouchers.source) == len(api.df)
+
+
+def test_stream_without_settings(api, create_stream):
+    """Путёвки санатория без настроек не распределяются и остаются в остаточном списке"""
+    settings = generate_settings(api.df)
+    skipped = settings.pop().sanatorium_id
+    distribution = create_stream(api, settings)
+    # API возвращает путёвки санатория, которого нет в настройках
+    distribution.get_vouchers_filters = lambda sanatorium_ids=None: {'status__code': 2}
+    vouchers = distribution.get_distribute_stream()
+
+    assert skipped not in set(vouchers.column('sanatorium_id'))
+    exists = distribution.df_exists
+    assert (exists['Санаторий ID'] == skipped).sum() == (api.df['sanatorium_id'] == skipped).sum()
+
+
+def test_handle_message_stream(api, create_stream, get_message):
+    """Обработчик сообщений брокера распределяет путёвки пачками санаториев"""
+    body = get_message(api)
+    full = create_stream(api, []).handle_message(body)
+    stream = create_stream(api, [], vouchers_stream=True).handle_message(body)
+
+    assert stream['total'] == full['total']
+    assert stream['rows'] == full['rows']
+    assert stream['total'] > 0
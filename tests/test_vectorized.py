@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+
+from benchmarks.generator import ARRIVAL_PATTERNS, generate_vouchers
+
+
+@pytest.mark.parametrize('arrival_pattern', sorted(ARRIVAL_PATTERNS))
+@pytest.mark.parametrize('seed', [1, 2])
+def test_vectorized_matches_rows(create_distribution, arrival_pattern, seed):
+    """Векторизованный отбор путёвок совпадает с построчным проходом по DataFrame"""
+    df = generate_vouchers(
+        sanatoriums=4,
+        vouchers_per_sanatorium=150,
+        arrival_pattern=arrival_pattern,
+        sanatorium_skew=1.0,
+        day_skew=0.5,
+        seed=seed
+    )
+    vectorized = create_distribution(df, vectorized=True, results_cache_size=0)
+    vectorized.get_distribute()
+    rows = create_distribution(df, vectorized=False, results_cache_size=0)
+    rows.get_distribute()
+
+    assert vectorized.to_sanatorium_vouchers.to_records() == rows.to_sanatorium_vouchers.to_records()
+    pd.testing.assert_frame_equal(vectorized.df_exists, rows.df_exists)
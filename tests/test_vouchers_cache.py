@@ -0,0 +1,93 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from vouchers_cache import VouchersCache
+
+
+def test_object_columns(tmp_path):
+    """Вложенные объекты, списки и логические значения сохраняются без преобразования в строки"""
+    cache = VouchersCache(str(tmp_path))
+    df = pd.DataFrame({
+        'id': [1, 2, 3],
+        'tourist': [{'name': 'x'}, None, {'name': 'y', 'children': [1]}],
+        'tags': [[1, 2], [], [3]],
+        'is_paid': [True, False, None],
+        'number': ['1', None, '3'],
+    })
+    cache.save('key', df)
+    loaded = cache.load('key')
+
+    assert loaded['tourist'].tolist() == df['tourist'].tolist()
+    assert loaded['tags'].tolist() == df['tags'].tolist()
+    assert loaded['is_paid'].tolist() == df['is_paid'].tolist()
+    assert loaded['number'].tolist() == df['number'].tolist()
+
+
+def test_evicted_after_meta(tmp_path, start_api, create_distribution):
+    """Список, вытесненный из кэша после чтения метаданных, запрашивается из API заново"""
+    api = start_api(sanatoriums=2, vouchers_per_sanatorium=100)
+    cache = VouchersCache(str(tmp_path))
+    distribution = create_distribution(api, vouchers_cache=cache)
+    distribution.get_vouchers()
+    requests = api.requests
+
+    # другой процесс удаляет список между чтением метаданных и загрузкой
+    get_meta = cache.get_meta
+
+    def get_meta_and_evict(key):
+        meta = get_meta(key)
+        cache.delete(key)
+        cache.get_meta = get_meta
+        return meta
+
+    cache.get_meta = get_meta_and_evict
+    distribution.get_vouchers()
+
+    assert api.requests > requests
+    assert distribution.df['id'].tolist() == api.df['id'].tolist()
+
+
+def test_failed_save_cleaned(tmp_path, monkeypatch):
+    """Если записать список не удалось, временный каталог удаляется, а прежний список остаётся"""
+    cache = VouchersCache(str(tmp_path))
+    df = pd.DataFrame({'id': [1, 2], 'number': ['1', '2']})
+    cache.save('key', df)
+
+    def fail(*args, **kwargs):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(np, 'save', fail)
+    with pytest.raises(OSError):
+        cache.save('key', df)
+
+    assert os.listdir(str(tmp_path)) == ['key']
+    assert cache.load('key')['id'].tolist() == [1, 2]
+
+
+def test_touch_atomic(tmp_path):
+    """Метаданные, которые перезаписываются при продлении времени жизни, всегда читаются целиком"""
+    cache = VouchersCache(str(tmp_path))
+    cache.save('key', pd.DataFrame({'id': list(range(1000))}), etag='"v1"')
+    stop = threading.Event()
+    missing = []
+
+    def read():
+        while not stop.is_set():
+            if cache.get_meta('key') is None:
+                missing.append(True)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for _ in range(500):
+            cache.touch('key')
+    finally:
+        stop.set()
+        reader.join()
+
+    assert not missing
+    assert sorted(os.listdir(os.path.join(str(tmp_path), 'key'))) == ['0.npy', VouchersCache.META_FILE]
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.generator import generate_vouchers
+from distributor import get_row_hashes
+
+
+def test_vouchers_index(create_distribution):
+    """Срез санатория совпадает с отбором его путёвок из списка, отсортированного по дате заезда и номеру"""
+    df = generate_vouchers(sanatoriums=5, vouchers_per_sanatorium=120, sanatorium_skew=1.0)
+    distribution = create_distribution(df)
+    source = distribution.get_distribute().source
+    vouchers_index = distribution.get_vouchers_index()
+
+    assert sorted(vouchers_index) == sorted(source['sanatorium_id'].unique().tolist())
+    for sanatorium_id, sanatorium_vouchers in vouchers_index.items():
+        expected = source[source['sanatorium_id'] == sanatorium_id].sort_values(
+            by=['date_begin', 'number'], kind='mergesort'
+        )
+        pd.testing.assert_frame_equal(sanatorium_vouchers.df, expected)
+        days = pd.to_datetime(expected['date_begin']).to_numpy().astype('datetime64[D]')
+        assert (sanatorium_vouchers.days[sanatorium_vouchers.day_idx] == days).all()
+        assert sanatorium_vouchers.row_hashes.tolist() == get_row_hashes(expected).tolist()
+
+
+def test_remove(create_distribution):
+    """Убранные путёвки не попадают в срез, календарь и отпечаток пересчитываются"""
+    df = generate_vouchers(sanatoriums=2, vouchers_per_sanatorium=100)
+    distribution = create_distribution(df)
+    sanatorium_vouchers = next(iter(distribution.get_vouchers_index().values()))
+    total = len(sanatorium_vouchers)
+    calendar = sanatorium_vouchers.calendar
+    fingerprint = sanatorium_vouchers.fingerprint
+
+    removed = sanatorium_vouchers.df.index[::3]
+    sanatorium_vouchers.remove(removed)
+    assert len(sanatorium_vouchers) == len(sanatorium_vouchers.df.index) == total - len(removed)
+    assert not sanatorium_vouchers.df.index.isin(removed).any()
+    assert sanatorium_vouchers.calendar is not calendar
+    assert sanatorium_vouchers.calendar.day_counts.sum() == total - len(removed)
+    assert sanatorium_vouchers.fingerprint != fingerprint
+    # порядковые номера путёвок внутри заездных дней начинаются с нуля
+    ranks = sanatorium_vouchers.ranks
+    assert (ranks[np.r_[True, sanatorium_vouchers.day_idx[1:] != sanatorium_vouchers.day_idx[:-1]]] == 0).all()
+
+
+def test_partitioned_once(create_distribution):
+    """Путёвки разбиваются по санаториям один раз за распределение"""
+    df = generate_vouchers(sanatoriums=4, vouchers_per_sanatorium=100)
+    distribution = create_distribution(df, results_cache_size=0)
+    get_vouchers_index = distribution.get_vouchers_index
+    calls = []
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return get_vouchers_index(*args, **kwargs)
+
+    distribution.get_vouchers_index = counted
+    distribution.get_distribute()
+    assert len(calls) == 1
@@ -0,0 +1,134 @@
+import io
+import json
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.generator import generate_settings, generate_vouchers
+from distributor import Distribution
+from vouchers_loader import VouchersColumns, read_vouchers
+
+ROWS = [
+    {
+        'id': 1,
+        'sanatorium_id': 2,
+        'number': 'a"},{"b',
+        'date_begin': '2021-01-05',
+        'payload': {'nested': [1, {'x': '},{'}], 'y': None},
+    },
+    {'id': 2, 'sanatorium_id': None, 'number': 'Путёвка №2 — ✓ 😀', 'tags': [1, 2, [3, {}]]},
+    {'id': 3, 'number': 'x\\', 'date_begin': None},
+    {'id': 4, 'sanatorium_id': 3, 'number': '}, {', 'extra': {'rows': [{'id': 0}]}},
+    {'id': 5, 'sanatorium_id': 3, 'number': '\\"}],"', 'date_begin': '2021-02-10'},
+]
+DOCUMENTS = [
+    ('object', json.dumps({'total': 5, 'rows': ROWS, 'page': {'next': None}, 'after': '],}'}, ensure_ascii=False)),
+    ('ascii', json.dumps({'total': 5, 'rows': ROWS}, ensure_ascii=True)),
+    ('indent', json.dumps({'rows': ROWS, 'total': 5}, ensure_ascii=False, indent=2)),
+    ('array', json.dumps(ROWS, ensure_ascii=False)),
+]
+
+
+def is_missing(value) -> bool:
+    return value is None or isinstance(value, float) and math.isnan(value)
+
+
+def get_records(df: pd.DataFrame) -> list:
+    """Путёвки DataFrame без пустых полей (null и отсутствующие в путёвке поля)"""
+    return [
+        {key: value for key, value in record.items() if not is_missing(value)}
+        for record in df.to_dict('records')
+    ]
+
+
+# путёвки без пустых полей (вложенные null сохраняются)
+EXPECTED = [{key: value for key, value in row.items() if value is not None} for row in ROWS]
+
+
+def load(chunks) -> tuple:
+    vouchers = VouchersColumns()
+    meta = read_vouchers(chunks, vouchers)
+    return get_records(vouchers.to_df()), meta
+
+
+@pytest.mark.parametrize('name, document', DOCUMENTS)
+def test_chunk_boundaries(name, document):
+    """Путёвки и остальные поля JSON не зависят от того, где поток разбит на блоки"""
+    data = document.encode()
+    expected = json.loads(document)
+    expected_meta = {} if isinstance(expected, list) else {
+        key: value for key, value in expected.items() if key != 'rows'
+    }
+
+    for offset in range(len(data) + 1):
+        assert load([data[:offset], data[offset:]]) == (EXPECTED, expected_meta), offset
+    for chunk_size in (1, 2, 3, 7):
+        vouchers = VouchersColumns()
+        assert read_vouchers(data, vouchers, chunk_size) == expected_meta
+        assert get_records(vouchers.to_df()) == EXPECTED, chunk_size
+
+
+@pytest.mark.parametrize('document, meta', [
+    ('[]', {}),
+    ('{}', {}),
+    (' {"rows": [], "total": 0} ', {'total': 0}),
+    ('﻿{"total": 0, "rows": []}', {'total': 0}),
+])
+def test_empty(document, meta):
+    assert load([document.encode()]) == ([], meta)
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        load([b'{"rows": [{"id": 1}'])
+    with pytest.raises(ValueError):
+        load([b'{"rows": [{"id": 1}}'])
+
+
+def test_typed_columns():
+    """Целочисленные поля и даты собираются в типизированные массивы с пропусками"""
+    vouchers = VouchersColumns(
+        int_columns={'id': np.int32, 'sanatorium_id': np.int32, 'organization_id': np.int32},
+        date_columns=('date_begin',),
+        columns=('id', 'sanatorium_id', 'organization_id', 'date_begin'),
+    )
+    rows = [
+        {'id': 1, 'sanatorium_id': 2, 'organization_id': 'a', 'date_begin': '2021-01-05', 'payload': 1},
+        {'id': 2, 'organization_id': 2 ** 40, 'date_begin': None},
+        {'id': 3, 'sanatorium_id': None, 'organization_id': 3},
+    ]
+    read_vouchers(json.dumps({'rows': rows}).encode(), vouchers, chunk_size=5)
+    df = vouchers.to_df()
+
+    assert list(df.columns) == ['id', 'sanatorium_id', 'organization_id', 'date_begin']
+    assert df['id'].dtype == np.int32
+    assert df['id'].tolist() == [1, 2, 3]
+    assert df['sanatorium_id'].dtype == pd.Int32Dtype()
+    assert df['sanatorium_id'].isna().tolist() == [False, True, True]
+    assert df['organization_id'].tolist() == ['a', 2 ** 40, 3]
+    assert df['date_begin'].tolist()[0] == pd.Timestamp('2021-01-05')
+    assert df['date_begin'].isna().tolist() == [False, True, True]
+
+
+@pytest.mark.parametrize('as_path', [False, True])
+def test_upload(tmp_path, as_path):
+    """Распределение загруженного файла (как в test_ui) совпадает с распределением списка путёвок"""
+    df = generate_vouchers(sanatoriums=3, vouchers_per_sanatorium=100)
+    records = df.to_dict('records')
+    for record in records:
+        record['payload'] = {'comment': 'путёвка "%s" },{' % record['number']}
+    data = json.dumps({'total': len(records), 'rows': records}, ensure_ascii=False).encode()
+    if as_path:
+        vouchers_file = tmp_path / 'vouchers.json'
+        vouchers_file.write_bytes(data)
+    else:
+        vouchers_file = io.BytesIO(data)
+
+    uploaded = Distribution(vouchers_file=vouchers_file, drop_unused_columns=True, debug=False)
+    uploaded.settings = generate_settings(df)
+    expected = Distribution(vouchers=records, debug=False)
+    expected.settings = generate_settings(df)
+
+    pd.testing.assert_frame_equal(uploaded.dataframe, expected.dataframe)
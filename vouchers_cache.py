@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from typing import NoReturn, Optional, List, Dict
+
+
+class VouchersCache(object):
+    """
+    Локальный кэш списков путёвок.
+
+    Каждый список путёвок хранится в отдельном каталоге: по одному файлу .npy на колонку
+    (значения, которые не являются строками или числами, — строками JSON) и файл meta.json
+    с названиями колонок, временем получения и валидаторами ответа API (ETag, Last-Modified).
+    Устаревшие списки удаляются по времени жизни, а при превышении общего размера кэша —
+    начиная с тех, к которым дольше всего не обращались.
+    """
+    META_FILE = 'meta.json'
+
+    def __init__(self, path: str, ttl: int = 3600, max_size: int = 1024 ** 3):
+        """
+        :param path: Каталог кэша.
+        :param ttl: Время (в секундах), в течение которого список путёвок считается актуальным.
+        :param max_size: Максимальный размер кэша в байтах.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def get_key(filters: dict) -> str:
+        """Ключ кэша по фильтрам списка путёвок"""
+        return hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get_meta(self, key: str) -> Optional[dict]:
+        """Метаданные списка путёвок или None, если списка нет в кэше"""
+        try:
+            with open(os.path.join(self.path, key, self.META_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, meta: dict) -> bool:
+        """Проверяет, не истекло ли время жизни списка путёвок"""
+        return time.time() - meta['created'] < self.ttl
+
+    @staticmethod
+    def get_conditional_headers(meta: dict) -> Dict[str, str]:
+        """Заголовки условного запроса для проверки актуальности списка путёвок"""
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def load(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        Загружает список путёвок из кэша.
+
+        :param key: Ключ кэша.
+        :return: Список путёвок или None, если списка нет в кэше.
+        """
+        meta = self.get_meta(key)
+        if meta is None:
+            return None
+
+        entry_path = os.path.join(self.path, key)
+        columns = {}
+        try:
+            for idx, column in enumerate(meta['columns']):
+                values = np.load(os.path.join(entry_path, '%d.npy' % idx))
+                if column.get('json'):
+                    decoded = np.empty(len(values), dtype=object)
+                    for position, value in enumerate(values.tolist()):
+                        decoded[position] = json.loads(value)
+                    values = decoded
+                elif column['nulls'] or values.dtype.kind == 'U':
+                    values = values.astype(object)
+                if column['nulls']:
+                    values[np.load(os.path.join(entry_path, '%d.nulls.npy' % idx))] = None
+                columns[column['name']] = values
+
+            # время последнего обращения — для вытеснения при превышении размера кэша
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            # список удалён из кэша во время чтения (вытеснен другим процессом)
+            return None
+        return pd.DataFrame(columns, columns=[column['name'] for column in meta['columns']])
+
+    def save(
+            self,
+            key: str,
+            df: pd.DataFrame,
+            etag: Optional[str] = None,
+            last_modified: Optional[str] = None
+    ) -> NoReturn:
+        """
+        Сохраняет список путёвок в кэш.
+
+        :param key: Ключ кэша.
+        :param df: Список путёвок.
+        :param etag: Заголовок ETag ответа API.
+        :param last_modified: Заголовок Last-Modified ответа API.
+        """
+        entry_path = tempfile.mkdtemp(dir=self.path, prefix='.')
+        try:
+            self.write_entry(entry_path, df, etag, last_modified)
+        except Exception:
+            # временный каталог не виден в keys() и не удаляется при вытеснении
+            shutil.rmtree(entry_path, ignore_errors=True)
+            raise
+
+        self.delete(key)
+        os.replace(entry_path, os.path.join(self.path, key))
+        self.evict()
+
+    def write_entry(
+            self,
+            entry_path: str,
+            df: pd.DataFrame,
+            etag: Optional[str] = None,
+            last_modified: Optional[str] = None
+    ) -> NoReturn:
+        """Записывает колонки и метаданные списка путёвок в каталог"""
+        columns = []
+        size = 0
+        for idx, name in enumerate(df.columns):
+            values = df[name].to_numpy()
+            nulls = None
+            is_json = False
+            if values.dtype == object:
+                nulls = pd.isna(values)
+                if pd.api.types.is_numeric_dtype(df[name].dtype):
+                    # целые числа с пропусками (Int32, Int16) храним числами, а пропуски — отдельной маской
+                    values = df[name].fillna(0).to_numpy(dtype=df[name].dtype.numpy_dtype)
+                elif all(isinstance(value, str) for value in values[~nulls]):
+                    # строки храним в виде массива unicode, а пропуски — отдельной маской
+                    values = np.where(nulls, '', values).astype(str)
+                else:
+                    # остальные значения (вложенные объекты, списки, логические значения) — строками JSON
+                    is_json = True
+                    values = np.array(
+                        [json.dumps(value, default=str) for value in np.where(nulls, None, values)],
+                        dtype=str
+                    )
+            np.save(os.path.join(entry_path, '%d.npy' % idx), values, allow_pickle=False)
+            size += values.nbytes
+            if nulls is not None and nulls.any():
+                np.save(os.path.join(entry_path, '%d.nulls.npy' % idx), nulls, allow_pickle=False)
+                size += nulls.nbytes
+            columns.append({'name': name, 'nulls': bool(nulls is not None and nulls.any()), 'json': is_json})
+
+        self.write_meta(entry_path, {
+            'created': time.time(),
+            'etag': etag,
+            'last_modified': last_modified,
+            'columns': columns,
+            'rows': len(df.index),
+            'size': size,
+        })
+
+    def write_meta(self, entry_path: str, meta: dict) -> NoReturn:
+        """
+        Записывает метаданные списка путёвок: во временный файл, который затем заменяет meta.json,
+        чтобы другие процессы не прочитали файл, записанный наполовину.
+        """
+        fd, meta_path = tempfile.mkstemp(dir=entry_path, prefix='.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(meta, f)
+            os.replace(meta_path, os.path.join(entry_path, self.META_FILE))
+        except Exception:
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            raise
+
+    def touch(self, key: str) -> NoReturn:
+        """Продлевает время жизни списка путёвок после успешной проверки актуальности"""
+        meta = self.get_meta(key)
+        if meta is not None:
+            meta['created'] = time.time()
+            try:
+                self.write_meta(os.path.join(self.path, key), meta)
+            except OSError:
+                # список удалён из кэша другим процессом
+                pass
+
+    def delete(self, key: str) -> NoReturn:
+        shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+
+    def evict(self) -> NoReturn:
+        """
+        Удаляет списки путёвок без валидаторов с истёкшим временем жизни
+        и давно не используемые списки, пока размер кэша превышает допустимый.
+        """
+        entries = []
+        for key in self.keys():
+            meta = self.get_meta(key)
+            if meta is None:
+                continue
+            if not self.is_fresh(meta) and not (meta.get('etag') or meta.get('last_modified')):
+                self.delete(key)
+                continue
+            try:
+                entries.append((os.path.getmtime(os.path.join(self.path, key)), key, meta['size']))
+            except OSError:
+                # список уже удалён другим процессом
+                continue
+
+        total_size = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self.delete(key)
+            total_size -= size
+
+    def keys(self) -> List[str]:
+        return [key for key in os.listdir(self.path) if not key.startswith('.')]
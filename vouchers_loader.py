@@ -0,0 +1,427 @@
+import codecs
+import json
+import os
+
+from array import array
+from operator import itemgetter
+from json.decoder import WHITESPACE
+
+import numpy as np
+import pandas as pd
+
+from typing import NoReturn, Optional, Iterable, Iterator, Dict, List
+
+# размер блока, которым читается JSON (в байтах)
+CHUNK_SIZE = 1024 ** 2
+
+
+class IntColumn(object):
+    """
+    Буфер целочисленного поля: значения хранятся в array('q') и маске пропусков.
+    Если в поле встречается нецелое значение (например, строковый ID), буфер
+    переходит к хранению значений в списке.
+    """
+
+    def __init__(self, dtype=np.int64):
+        """
+        :param dtype: Тип, к которому приводится поле, если значения в нём помещаются.
+        """
+        self.dtype = dtype
+        self.values = array('q')
+        self.nulls = array('q')
+        self.objects = None
+
+    def __len__(self) -> int:
+        return len(self.values) if self.objects is None else len(self.objects)
+
+    def append(self, value) -> NoReturn:
+        if self.objects is None:
+            if type(value) is int:
+                try:
+                    self.values.append(value)
+                    return
+                except OverflowError:
+                    pass
+            elif value is None:
+                self.nulls.append(len(self.values))
+                self.values.append(0)
+                return
+            self.to_objects()
+        self.objects.append(value)
+
+    def fill(self, count: int) -> NoReturn:
+        for _ in range(count):
+            self.append(None)
+
+    def extend_values(self, values: list) -> NoReturn:
+        if self.objects is None:
+            try:
+                self.values.extend(array('q', values))
+                return
+            except (TypeError, OverflowError):
+                pass
+            if None in values:
+                # пропуски заменяются нулями и отмечаются в маске
+                offset = len(self.values)
+                try:
+                    self.values.extend(array('q', [0 if value is None else value for value in values]))
+                except (TypeError, OverflowError):
+                    pass
+                else:
+                    self.nulls.extend(array('q', [
+                        offset + position for position, value in enumerate(values) if value is None
+                    ]))
+                    return
+        for value in values:
+            self.append(value)
+
+    def extend(self, column: 'IntColumn') -> NoReturn:
+        if self.objects is None and column.objects is None:
+            offset = len(self.values)
+            self.nulls.extend(array('q', (position + offset for position in column.nulls)))
+            self.values.extend(column.values)
+            return
+        self.to_objects()
+        self.objects.extend(column.get_objects())
+
+    def get_objects(self) -> list:
+        if self.objects is not None:
+            return self.objects
+        objects = self.values.tolist()
+        for position in self.nulls:
+            objects[position] = None
+        return objects
+
+    def to_objects(self) -> NoReturn:
+        """Переводит буфер к хранению значений в списке"""
+        if self.objects is None:
+            self.objects = self.get_objects()
+            self.values = array('q')
+            self.nulls = array('q')
+
+    def to_array(self):
+        if self.objects is not None:
+            return np.array(self.objects, dtype=object)
+        values = np.frombuffer(self.values, dtype=np.int64) if len(self.values) else np.empty(0, dtype=np.int64)
+        mask = np.zeros(len(values), dtype=bool)
+        mask[np.frombuffer(self.nulls, dtype=np.int64) if len(self.nulls) else []] = True
+        dtype = self.dtype
+        if len(values) and not np.iinfo(dtype).min <= values.min() <= values.max() <= np.iinfo(dtype).max:
+            dtype = np.int64
+        values = values.astype(dtype)
+        if mask.any():
+            return pd.arrays.IntegerArray(values, mask)
+        return values
+
+
+class DateColumn(object):
+    """Буфер поля с датами: коды значений и словарь значений (различных дат немного)"""
+
+    def __init__(self):
+        self.codes = array('i')
+        self.categories = {}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def append(self, value) -> NoReturn:
+        if value is None:
+            self.codes.append(-1)
+            return
+        code = self.categories.get(value)
+        if code is None:
+            code = self.categories[value] = len(self.categories)
+        self.codes.append(code)
+
+    def fill(self, count: int) -> NoReturn:
+        self.codes.extend(array('i', [-1]) * count)
+
+    def extend_values(self, values: list) -> NoReturn:
+        categories = self.categories
+        codes = list(map(categories.get, values))
+        if None in codes:
+            # новые даты и пропуски
+            codes = [
+                -1 if value is None else categories.setdefault(value, len(categories)) for value in values
+            ]
+        self.codes.extend(array('i', codes))
+
+    def extend(self, column: 'DateColumn') -> NoReturn:
+        mapping = [self.categories.setdefault(value, len(self.categories)) for value in column.categories]
+        if mapping == list(range(len(mapping))):
+            self.codes.extend(column.codes)
+            return
+        # последний элемент — код пропуска (-1)
+        codes = np.array(mapping + [-1], dtype=np.int32)[np.frombuffer(column.codes, dtype=np.int32)]
+        self.codes.frombytes(codes.tobytes())
+
+    def to_array(self):
+        codes = np.frombuffer(self.codes, dtype=np.int32) if len(self.codes) else np.empty(0, dtype=np.int32)
+        dates = pd.to_datetime(pd.Index(list(self.categories), dtype=object))
+        return dates.take(codes, allow_fill=True, fill_value=pd.NaT).to_numpy()
+
+
+class ObjectColumn(object):
+    """Буфер произвольного поля"""
+
+    def __init__(self):
+        self.objects = []
+
+    def __len__(self) -> int:
+        return len(self.objects)
+
+    def append(self, value) -> NoReturn:
+        self.objects.append(value)
+
+    def fill(self, count: int) -> NoReturn:
+        # отсутствующие поля, как и в DataFrame из списка словарей, заполняются NaN
+        self.objects.extend([np.nan] * count)
+
+    def extend_values(self, values: list) -> NoReturn:
+        self.objects.extend(values)
+
+    def extend(self, column: 'ObjectColumn') -> NoReturn:
+        self.objects.extend(column.objects)
+
+    def to_array(self):
+        return np.array(self.objects, dtype=object) if self.objects else np.empty(0, dtype=object)
+
+
+class VouchersColumns(object):
+    """
+    Список путёвок в виде колоночных буферов.
+
+    Путёвки добавляются небольшими пачками по мере разбора JSON, поэтому список словарей
+    всех путёвок в памяти не создаётся. Поля, отсутствующие в части путёвок, заполняются пропусками.
+    """
+
+    def __init__(
+            self,
+            int_columns: Optional[Dict[str, type]] = None,
+            date_columns: Iterable[str] = (),
+            columns: Optional[Iterable[str]] = None
+    ):
+        """
+        :param int_columns: Целочисленные поля и типы, к которым они приводятся.
+        :param date_columns: Поля с датами.
+        :param columns: Сохраняемые поля (по умолчанию — все поля путёвок).
+        """
+        self.int_columns = dict(int_columns or {})
+        self.date_columns = tuple(date_columns)
+        self.columns = None if columns is None else set(columns)
+        self._columns = {}
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def get_column(self, name: str):
+        column = self._columns.get(name)
+        if column is None:
+            if name in self.int_columns:
+                column = IntColumn(self.int_columns[name])
+            elif name in self.date_columns:
+                column = DateColumn()
+            else:
+                column = ObjectColumn()
+            column.fill(self._length)
+            self._columns[name] = column
+        return column
+
+    def append(self, row: dict) -> NoReturn:
+        """Добавляет одну путёвку"""
+        for name, value in row.items():
+            if self.columns is None or name in self.columns:
+                self.get_column(name).append(value)
+        self._length += 1
+        self.fill_missing()
+
+    def append_rows(self, rows: List[dict]) -> NoReturn:
+        """
+        Добавляет пачку путёвок. Если у всех путёвок пачки одинаковый набор полей,
+        значения переносятся в буферы по полям, иначе путёвки добавляются по одной.
+        """
+        if not rows:
+            return
+        keys = rows[0].keys()
+        if not all(map(keys.__eq__, map(dict.keys, rows))):
+            for row in rows:
+                self.append(row)
+            return
+        for name in keys:
+            if self.columns is None or name in self.columns:
+                self.get_column(name).extend_values(list(map(itemgetter(name), rows)))
+        self._length += len(rows)
+        self.fill_missing()
+
+    def extend(self, vouchers: 'VouchersColumns') -> NoReturn:
+        """Добавляет путёвки другого списка (например, следующей страницы API)"""
+        for name, column in vouchers._columns.items():
+            self.get_column(name).extend(column)
+        self._length += len(vouchers)
+        self.fill_missing()
+
+    def fill_missing(self) -> NoReturn:
+        """Дополняет пропусками поля, которых не было в последних путёвках"""
+        for column in self._columns.values():
+            column.fill(self._length - len(column))
+
+    def to_df(self, index: Optional[pd.Index] = None) -> pd.DataFrame:
+        """
+        Функция формирует DataFrame путёвок, буферы полей освобождаются по мере переноса в DataFrame.
+
+        :param index: Индекс путёвок.
+        """
+        data = {}
+        for name in list(self._columns):
+            data[name] = self._columns.pop(name).to_array()
+        self._length = 0
+        return pd.DataFrame(data, index=index)
+
+
+class JsonStreamReader(object):
+    """Последовательное чтение значений JSON из потока блоков байтов"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._json = json.JSONDecoder()
+        self._eof = False
+        self.buffer = ''
+        self.pos = 0
+
+    def read(self) -> bool:
+        """Дочитывает следующий блок в буфер, возвращает False, если поток закончился"""
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            text = self._decoder.decode(b'', final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Следующий непробельный символ (пустая строка в конце потока)"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        """Пропускает один из ожидаемых символов"""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Ожидается один из символов %r, получено %r.' % (chars, char or 'конец файла'))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """Разбирает следующее значение целиком"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # значение могло не поместиться в буфер
+                if self.read():
+                    continue
+                raise
+            # число в конце буфера может продолжаться в следующем блоке
+            if end == len(self.buffer) and self.read():
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self) -> Iterator[list]:
+        """
+        Генератор пачек элементов массива.
+
+        Элементы, целиком находящиеся в буфере, разбираются одним вызовом json.loads: текст
+        обрезается по последнему разделителю объектов "}," и, если получился корректный массив,
+        разделитель стоял между элементами (внутри строки или вложенного объекта обрезанный текст
+        не был бы корректным JSON). Иначе элементы буфера разбираются по одному.
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        failed_buffer = None
+        while True:
+            buffer = self.buffer
+            if buffer is not failed_buffer:
+                cut = buffer.rfind('},', self.pos)
+                if cut >= 0:
+                    try:
+                        batch = json.loads('[%s]' % buffer[self.pos:cut + 1])
+                    except ValueError:
+                        failed_buffer = buffer
+                    else:
+                        self.pos = cut + 2
+                        yield batch
+                        continue
+            value = self.decode()
+            last = self.expect(',]') == ']'
+            yield [value]
+            if last:
+                return
+
+
+def iter_chunks(source, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Генератор блоков байтов источника JSON.
+
+    :param source: Путь к файлу, файловый объект (в т.ч. загруженный файл), ответ requests
+                   (запрос с stream=True), байты или итератор блоков байтов.
+    :param chunk_size: Размер блока в байтах.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield from iter(lambda: f.read(chunk_size), b'')
+    elif hasattr(source, 'iter_content'):
+        yield from source.iter_content(chunk_size)
+    elif hasattr(source, 'read'):
+        yield from iter(lambda: source.read(chunk_size), b'')
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        for start in range(0, len(source), chunk_size):
+            yield bytes(source[start:start + chunk_size])
+    else:
+        yield from source
+
+
+def read_vouchers(source, vouchers: VouchersColumns, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Функция разбирает JSON со списком путёвок ({"total": ..., "rows": [...]} или [...])
+    и добавляет путёвки в колоночные буферы по мере чтения.
+
+    :param source: Источник JSON (см. iter_chunks).
+    :param vouchers: Колоночные буферы, в которые добавляются путёвки.
+    :param chunk_size: Размер блока в байтах.
+    :return: Остальные поля JSON (например, total).
+    """
+    reader = JsonStreamReader(iter_chunks(source, chunk_size))
+    meta = {}
+    if reader.peek() == '[':
+        for rows in reader.iter_array():
+            vouchers.append_rows(rows)
+        return meta
+
+    reader.expect('{')
+    if reader.peek() == '}':
+        return meta
+    while True:
+        key = reader.decode()
+        reader.expect(':')
+        if key == 'rows':
+            for rows in reader.iter_array():
+                vouchers.append_rows(rows)
+        else:
+            meta[key] = reader.decode()
+        if reader.expect(',}') == '}':
+            return meta
+